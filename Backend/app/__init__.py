@@ -24,6 +24,10 @@ def create_app(config_name='default'):
     
     # Load the configuration
     app.config.from_object(config_by_name[config_name])
+
+    if app.config.get('JSON_PROVIDER') == 'orjson':
+        from .json_provider import OrjsonProvider
+        app.json = OrjsonProvider(app)
     
     # Initialize extensions
     db.init_app(app)
@@ -31,6 +35,20 @@ def create_app(config_name='default'):
     ma.init_app(app)
     migrate.init_app(app, db)
     swagger.init_app(app)
+
+    from .slot_status import StatusWriteBuffer
+    StatusWriteBuffer(app)
+
+    from .device_keys import device_keys
+    device_keys.init_app(app)
+
+    from .cache import lot_cache
+    lot_cache.init_app(app)
+
+    from .cli import register_commands
+    register_commands(app)
+
+    from . import lot_version  # noqa: F401 -- registers the lot version flush hooks
     
     # Register blueprints here
     from .main import main_bp
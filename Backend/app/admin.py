@@ -1,10 +1,14 @@
 import jwt
 from flask import Blueprint, request, jsonify, current_app
 from functools import wraps
-from .models import db, User, ParkingLotDetails, AdminParkingLot, Slot, ParkingSession, AdminPaymentLedger
+from .models import db, User, ParkingLotDetails, AdminParkingLot, Slot, ParkingSession, AdminPaymentLedger, Device, DeviceLot
+from .device_keys import device_keys, generate_api_key, hash_api_key
+from .slot_status import claim_free_slot, occupy_slot, release_slot
+from .layout import VEHICLE_TYPES
 import uuid
 from datetime import datetime
 from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 from datetime import date as date_cls
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -268,13 +272,119 @@ def vehicle_checkin():
         start_time=datetime.utcnow(),
         vehicle_type=vehicle_type
     )
-    slot.status = 1  # Mark slot as occupied
-    slot.vehicle_reg_no = vehicle_reg_no
-    slot.ticket_id = ticket_id
+    if not occupy_slot(slot, vehicle_reg_no, ticket_id):
+        # Another check-in (or a device) took the slot since it was read
+        db.session.rollback()
+        return jsonify({'msg': 'Slot is already occupied'}), 409
     db.session.add(session)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent check-in of the same vehicle won (uq_parking_sessions_active_vehicle)
+        db.session.rollback()
+        return jsonify({'msg': 'Vehicle already checked in'}), 409
     return jsonify({'msg': 'Vehicle checked in', 'session_id': ticket_id}), 200 
 
+# Slot vehicle types by their lowercase spelling, as accepted by /session/allocate
+ALLOCATABLE_VEHICLE_TYPES = {vehicle_type.lower(): vehicle_type for vehicle_type in VEHICLE_TYPES}
+
+@admin_bp.route('/session/allocate', methods=['POST'])
+@role_required("admin")
+def vehicle_allocate():
+    """
+    Admin Vehicle Check-In to Any Free Slot
+    ---
+    tags:
+      - Admin
+    description: |
+      Note: You must use the Authorize button and provide a valid JWT as a Bearer token in the Authorization header.
+
+      Claims the first free slot of the lot for the vehicle type (on `floor_id` when it
+      has one free, else on the lowest floor) and checks the vehicle in, in one
+      transaction. Concurrent requests never receive the same slot.
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            vehicle_reg_no:
+              type: string
+            lot_id:
+              type: integer
+            vehicle_type:
+              type: string
+              description: Car (default) or Two-Wheeler, in any case; only slots of this type are allocated
+            floor_id:
+              type: integer
+              description: Preferred floor
+    responses:
+      200:
+        description: Vehicle checked in to the allocated slot
+        schema:
+          type: object
+          properties:
+            msg:
+              type: string
+            session_id:
+              type: string
+            slot:
+              type: object
+      400:
+        description: Missing or invalid fields
+      404:
+        description: Lot not found
+      409:
+        description: No free slot or vehicle already checked in
+    security:
+      - Bearer: []
+    """
+    data = request.get_json(silent=True) or {}
+    vehicle_reg_no = data.get('vehicle_reg_no')
+    lot_id = data.get('lot_id')
+    vehicle_type = data.get('vehicle_type') or 'Car'
+    floor_id = data.get('floor_id')
+    if not vehicle_reg_no or not lot_id:
+        return jsonify({'msg': 'Missing required fields'}), 400
+    if not isinstance(lot_id, int) or isinstance(lot_id, bool):
+        return jsonify({'msg': 'lot_id must be an integer'}), 400
+    if floor_id is not None and (not isinstance(floor_id, int) or isinstance(floor_id, bool)):
+        return jsonify({'msg': 'floor_id must be an integer'}), 400
+    vehicle_type = ALLOCATABLE_VEHICLE_TYPES.get(vehicle_type.lower()) if isinstance(vehicle_type, str) else None
+    if vehicle_type is None:
+        return jsonify({'msg': 'vehicle_type must be Car or Two-Wheeler'}), 400
+    if not db.session.get(ParkingLotDetails, lot_id):
+        return jsonify({'msg': 'Lot not found'}), 404
+    if ParkingSession.query.filter_by(vehicle_reg_no=vehicle_reg_no, end_time=None).first():
+        return jsonify({'msg': 'Vehicle already checked in'}), 409
+    ticket_id = str(uuid.uuid4())
+    slot = claim_free_slot(lot_id, vehicle_type, vehicle_reg_no, ticket_id, floor_id)
+    if slot is None:
+        db.session.rollback()
+        return jsonify({'msg': 'No free slot'}), 409
+    db.session.add(ParkingSession(
+        ticket_id=ticket_id,
+        parkinglot_id=lot_id,
+        floor_id=slot.floor_id,
+        row_id=slot.row_id,
+        slot_id=slot.id,
+        vehicle_reg_no=vehicle_reg_no,
+        start_time=datetime.utcnow(),
+        vehicle_type=vehicle_type
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'msg': 'Vehicle already checked in'}), 409
+    return jsonify({
+        'msg': 'Vehicle checked in',
+        'session_id': ticket_id,
+        'slot': {'id': slot.id, 'name': slot.name, 'floor_id': slot.floor_id, 'row_id': slot.row_id,
+                 'vehicle_type': slot.vehicle_type}
+    }), 200
+
 @admin_bp.route('/session/checkout', methods=['POST'])
 @role_required("admin")
 def vehicle_checkout():
@@ -350,9 +460,7 @@ def vehicle_checkout():
     # Mark slot as available
     slot = Slot.query.filter_by(id=session.slot_id).first()
     if slot:
-        slot.status = 0
-        slot.vehicle_reg_no = None
-        slot.ticket_id = None
+        release_slot(slot, session.ticket_id)
     # --- Update admin ledger ---
     admin_lots = AdminParkingLot.query.filter_by(parking_lot_id=session.parkinglot_id).all()
     if len(admin_lots) == 0:
@@ -600,4 +708,120 @@ def register_admin():
     new_user.set_password(data.get('user_password'))
     db.session.add(new_user)
     db.session.commit()
-    return jsonify({"msg": "Admin registered successfully", "role": new_user.role}), 201 
\ No newline at end of file
+    return jsonify({"msg": "Admin registered successfully", "role": new_user.role}), 201
+
+@admin_bp.route('/devices', methods=['POST'])
+@role_required("super_admin")
+def register_device():
+    """
+    Register an edge device and issue its API key (super_admin only).
+    ---
+    tags:
+      - Admin
+    description: |
+      Note: You must use the Authorize button and provide a valid JWT as a Bearer token in the Authorization header.
+
+      The returned `api_key` is shown only once; the server stores its SHA-256 digest.
+      The device may only write slots of the listed parking lots.
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - name
+            - parking_lot_ids
+          properties:
+            name:
+              type: string
+            parking_lot_ids:
+              type: array
+              items:
+                type: integer
+    responses:
+      201:
+        description: Device registered
+      400:
+        description: Missing name or invalid parking lots
+      409:
+        description: Device name already registered
+    security:
+      - Bearer: []
+    """
+    data = request.get_json()
+    name = data.get('name')
+    lot_ids = data.get('parking_lot_ids') or []
+    if not name or not isinstance(lot_ids, list) or not lot_ids:
+        return jsonify({'msg': 'Missing name or parking_lot_ids'}), 400
+    lot_ids = set(lot_ids)
+    if ParkingLotDetails.query.filter(ParkingLotDetails.id.in_(lot_ids)).count() != len(lot_ids):
+        return jsonify({'msg': 'Invalid parking lot'}), 400
+    if Device.query.filter_by(name=name).first():
+        return jsonify({'msg': 'Device name already registered'}), 409
+    api_key = generate_api_key()
+    device = Device(name=name, api_key_hash=hash_api_key(api_key))
+    device.lots = [DeviceLot(parkinglot_id=lot_id) for lot_id in sorted(lot_ids)]
+    db.session.add(device)
+    device_keys.bump()
+    db.session.commit()
+    return jsonify({
+        'device_id': device.id,
+        'name': device.name,
+        'parking_lot_ids': sorted(lot_ids),
+        'api_key': api_key
+    }), 201
+
+@admin_bp.route('/devices', methods=['GET'])
+@role_required("super_admin")
+def get_devices():
+    """
+    List registered edge devices (super_admin only).
+    ---
+    tags:
+      - Admin
+    responses:
+      200:
+        description: List of devices with their parking lot scope
+    security:
+      - Bearer: []
+    """
+    devices = Device.query.order_by(Device.id).all()
+    return jsonify([
+        {
+            'device_id': d.id,
+            'name': d.name,
+            'is_active': d.is_active,
+            'parking_lot_ids': sorted(l.parkinglot_id for l in d.lots)
+        }
+        for d in devices
+    ]), 200
+
+@admin_bp.route('/devices/<int:device_id>', methods=['DELETE'])
+@role_required("super_admin")
+def deactivate_device(device_id):
+    """
+    Revoke an edge device's API key (super_admin only).
+    ---
+    tags:
+      - Admin
+    parameters:
+      - in: path
+        name: device_id
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Device deactivated
+      404:
+        description: Device not found
+    security:
+      - Bearer: []
+    """
+    device = db.session.get(Device, device_id)
+    if not device:
+        return jsonify({'msg': 'Device not found'}), 404
+    device.is_active = False
+    device_keys.bump()
+    db.session.commit()
+    return jsonify({'msg': 'Device deactivated'}), 200
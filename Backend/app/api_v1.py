@@ -1,18 +1,42 @@
-from flask import Blueprint, request, jsonify, current_app
-from .models import Slot
+from functools import wraps
+import hmac
+import json
+from flask import Blueprint, request, jsonify, current_app, stream_with_context, g
 from . import db
+from . import bitmap
+from .device_keys import device_keys
+from .slot_status import (
+    parse_status_items, apply_status_updates, fill_results, write_buffer, resolve_slot_scope,
+    snapshot_sequence, claim_sequence,
+)
 
 api_v1_bp = Blueprint('api_v1', __name__, url_prefix='/api/v1')
 
-# Simple API Key Authentication
+# API Key Authentication: per-device keys from the in-memory key table, or the shared RPI_API_KEY
 def require_api_key(f):
+    @wraps(f)
     def decorated_function(*args, **kwargs):
         api_key = request.headers.get('X-API-KEY')
-        if not api_key or api_key != current_app.config.get('RPI_API_KEY'):
+        if not api_key:
             return jsonify({"error": "Unauthorized"}), 401
+        device = device_keys.lookup(api_key, current_app.config.get('DEVICE_KEY_TABLE_TTL', 60))
+        if device is None:
+            legacy_key = current_app.config.get('RPI_API_KEY')
+            if not legacy_key or not hmac.compare_digest(api_key, legacy_key):
+                return jsonify({"error": "Unauthorized"}), 401
+        g.device = device
         return f(*args, **kwargs)
     return decorated_function
 
+def device_lot_ids():
+    """Lots the authenticated device may write, or None for the unscoped legacy key."""
+    device = g.get('device')
+    return device.lot_ids if device is not None else None
+
+def lot_in_scope(lot_id):
+    lot_ids = device_lot_ids()
+    return lot_ids is None or lot_id in lot_ids
+
 @api_v1_bp.route('/slots/update_status', methods=['POST'])
 @require_api_key
 def update_slot_status():
@@ -39,11 +63,15 @@ def update_slot_status():
               description: "0 for free, 1 for occupied"
     responses:
       200:
-        description: Slot status updated successfully
+        description: Slot status updated successfully (`changed` is false if it already had this status)
+      202:
+        description: Status accepted for a buffered write (write-behind mode)
       400:
         description: Invalid input
       401:
         description: Unauthorized
+      403:
+        description: Slot is outside this device's lots
       404:
         description: Slot not found
     """
@@ -54,17 +82,281 @@ def update_slot_status():
     if not slot_id or new_status is None:
         return jsonify({"error": "Missing id or status"}), 400
 
-    slot = db.session.get(Slot, slot_id)
-    if not slot:
-        return jsonify({"error": "Slot not found"}), 404
+    updates, results = parse_status_items([data])
+    if results[0]["result"] == "invalid":
+        return jsonify({"error": "Invalid status value"}), 400
+
+    if write_buffer.enabled:
+        found, out_of_scope = resolve_slot_scope(updates.keys(), lot_ids=device_lot_ids())
+        if out_of_scope:
+            return jsonify({"error": "Slot is outside this device's lots"}), 403
+        if not found:
+            return jsonify({"error": "Slot not found"}), 404
+        write_buffer.submit(updates, lot_ids=device_lot_ids())
+        return jsonify({"message": f"Slot {slot_id} status {new_status} accepted"}), 202
 
-    # Assuming status is an integer (e.g., 0 for free, 1 for occupied)
     try:
-        slot.status = int(new_status)
+        found, changed, out_of_scope = apply_status_updates(updates, lot_ids=device_lot_ids())
+        if out_of_scope:
+            return jsonify({"error": "Slot is outside this device's lots"}), 403
+        if not found:
+            return jsonify({"error": "Slot not found"}), 404
         db.session.commit()
-        return jsonify({"message": f"Slot {slot_id} status updated to {new_status}"})
-    except (ValueError, TypeError):
-        return jsonify({"error": "Invalid status value"}), 400
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500 
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "message": f"Slot {slot_id} status updated to {new_status}",
+        "changed": bool(changed)
+    })
+
+@api_v1_bp.route('/slots/bulk_update_status', methods=['POST'])
+@require_api_key
+def bulk_update_slot_status():
+    """
+    Update the status of many parking slots in one transaction. (For RPi clients)
+    ---
+    tags:
+      - RPi API
+    security:
+      - ApiKey: []
+    description: |
+      Accepts the list printed by detect_parking_occupancy.py and applies it with a
+      single query plus one multi-row UPDATE of the slots whose status actually
+      changed. Each item gets its own result: `changed`, `unchanged`, `not_found`,
+      `out_of_scope` (slot belongs to a lot this device key is not registered for)
+      or `invalid`; `changed` lists the slot IDs that transitioned.
+
+      When SLOT_STATUS_WRITE_BEHIND is enabled the batch is acknowledged with 202
+      and coalesced in memory; writable items are reported as `accepted`, unknown
+      and out-of-scope slots as `not_found` and `out_of_scope`.
+
+      To make retries safe, wrap the list in an envelope carrying the device ID, the
+      lot ID and either a monotonic `seq` or the `captured_at` time of the snapshot:
+
+        {"device_id": "rpi-1", "lot_id": 1, "seq": 42, "slots": [{"id": 1, "status": 1}]}
+
+      The server remembers the last applied sequence per device and lot and answers
+      409 to stale or replayed snapshots without touching the slots.
+
+      Alternatively send `Content-Type: application/vnd.parking.slot-bitmap` with a
+      packed bitset of statuses (see app/bitmap.py) in the slot order returned by
+      /api/v1/lots/{lot_id}/layout. A camera that sees only part of the lot sends the
+      format 2 bitmap with a coverage mask, and the slots outside the mask keep their
+      status. A bitmap built for an outdated layout gets a 409 carrying the current
+      `layout_version`.
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: array
+          items:
+            type: object
+            required:
+              - id
+              - status
+            properties:
+              id:
+                type: integer
+              status:
+                type: integer
+                description: "0 for free, 1 for occupied"
+    responses:
+      200:
+        description: Batch applied, see per-item results
+      202:
+        description: Batch accepted for a buffered write (write-behind mode)
+      400:
+        description: Invalid input
+      401:
+        description: Unauthorized
+      403:
+        description: Envelope lot is outside this device's scope
+      409:
+        description: Stale or replayed snapshot, or outdated bitmap layout
+    """
+    if request.mimetype == bitmap.BITMAP_MIMETYPE:
+        body, status_code = ingest_bitmap(request.get_data())
+    else:
+        body, status_code = ingest_snapshot(request.get_json(silent=True))
+    return jsonify(body), status_code
+
+@api_v1_bp.route('/slots/stream', methods=['POST'])
+@require_api_key
+def stream_slot_status():
+    """
+    Long-lived ingest channel for edge detectors. (For RPi clients)
+    ---
+    tags:
+      - RPi API
+    security:
+      - ApiKey: []
+    consumes:
+      - application/x-ndjson
+    produces:
+      - application/x-ndjson
+    description: |
+      The device authenticates once and then streams newline-delimited JSON frames
+      over a single chunked request. Every frame has the same shape as a
+      bulk_update_status body (a list or a sequenced envelope) and is applied through
+      the same batched write path. The response streams one acknowledgement line per
+      frame: `{"frame": <n>, "status": <http status>, ...}`.
+    responses:
+      200:
+        description: Stream of per-frame acknowledgements
+      401:
+        description: Unauthorized
+      503:
+        description: Streams are not served by this worker
+    """
+    if not current_app.config['SERVE_STREAMS']:
+        return jsonify({"error": "Streams are served by the streaming service"}), 503
+
+    def acknowledgements():
+        for frame, line in enumerate(request.stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                body, status_code = {"error": "Invalid JSON frame"}, 400
+            else:
+                body, status_code = ingest_snapshot(data)
+            yield json.dumps({"frame": frame, "status": status_code, **body}) + "\n"
+
+    return current_app.response_class(stream_with_context(acknowledgements()), mimetype='application/x-ndjson')
+
+@api_v1_bp.route('/lots/<int:lot_id>/layout', methods=['GET'])
+@require_api_key
+def get_lot_layout(lot_id):
+    """
+    Get the slot ordering used by the compact bitmap format. (For RPi clients)
+    ---
+    tags:
+      - RPi API
+    security:
+      - ApiKey: []
+    parameters:
+      - in: path
+        name: lot_id
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Slot IDs in bitmap order and the layout version
+      401:
+        description: Unauthorized
+      403:
+        description: Lot is outside this device's scope
+      404:
+        description: Parking lot has no slots
+    """
+    if not lot_in_scope(lot_id):
+        return jsonify({"error": "Lot is outside this device's scope"}), 403
+    slot_ids, _ = bitmap.load_layout(lot_id)
+    if not slot_ids:
+        return jsonify({"error": "Parking lot has no slots"}), 404
+    return jsonify({
+        "lot_id": lot_id,
+        "layout_version": bitmap.layout_version(slot_ids),
+        "slot_ids": slot_ids
+    })
+
+def ingest_bitmap(payload):
+    """
+    Apply a compact bitmap snapshot by expanding it into the JSON envelope form.
+
+    Devices may pass X-DEVICE-ID and X-SNAPSHOT-SEQ headers for sequencing.
+    """
+    try:
+        lot_id, version, statuses = bitmap.decode(payload)
+    except bitmap.BitmapError as e:
+        return {"error": str(e)}, 400
+    if not lot_in_scope(lot_id):
+        return {"error": "Lot is outside this device's scope"}, 403
+    slot_ids, _ = bitmap.load_layout(lot_id)
+    if not slot_ids:
+        return {"error": "Parking lot has no slots"}, 404
+    current_version = bitmap.layout_version(slot_ids)
+    if version != current_version or len(statuses) != len(slot_ids):
+        return {"error": "Layout version mismatch", "layout_version": current_version}, 409
+
+    envelope = {
+        "lot_id": lot_id,
+        # Slots outside a format 2 coverage mask were not observed and are left untouched
+        "slots": [{"id": slot_id, "status": status} for slot_id, status in zip(slot_ids, statuses) if status is not None]
+    }
+    seq = request.headers.get('X-SNAPSHOT-SEQ')
+    if seq is not None:
+        try:
+            envelope["seq"] = int(seq)
+        except ValueError:
+            return {"error": "X-SNAPSHOT-SEQ must be an integer"}, 400
+    return ingest_snapshot(envelope)
+
+def ingest_snapshot(data):
+    """
+    Validate and apply one edge snapshot: a plain list of ``{id, status}`` items or a
+    sequenced envelope ``{device_id, lot_id, seq|captured_at, slots}``.
+
+    Stale or replayed envelopes and envelopes for lots outside the device's scope are
+    rejected before the slots table is touched. An envelope's slots are applied only
+    to its ``lot_id``; slots of other lots are reported as ``out_of_scope``. Registered devices are sequenced under
+    their own name; any device_id in the payload only applies to the shared legacy key.
+
+    :return: ``(body, status_code)`` for the response.
+    """
+    sequence = None
+    lot_ids = device_lot_ids()
+    if isinstance(data, dict):
+        envelope, data = data, data.get('slots')
+        lot_id = envelope.get('lot_id')
+        if lot_id is not None:
+            if isinstance(lot_id, bool) or not isinstance(lot_id, int):
+                return {"error": "lot_id must be an integer"}, 400
+            if not lot_in_scope(lot_id):
+                return {"error": "Lot is outside this device's scope"}, 403
+            # The envelope (and its sequence) covers one lot; slots of other lots are out of scope
+            lot_ids = frozenset([lot_id])
+        try:
+            seq = snapshot_sequence(envelope)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if seq is not None:
+            if g.get('device') is not None:
+                device_id = g.device.name
+            else:
+                device_id = envelope.get('device_id') or request.headers.get('X-DEVICE-ID')
+            if not device_id or lot_id is None:
+                return {"error": "Sequenced snapshots need device_id and lot_id"}, 400
+            sequence = (str(device_id), lot_id, seq)
+    if not isinstance(data, list):
+        return {"error": "Expected a list of {id, status} objects"}, 400
+
+    updates, results = parse_status_items(data)
+    try:
+        if sequence is not None:
+            accepted, last_seq = claim_sequence(*sequence)
+            if not accepted:
+                db.session.rollback()
+                return {"error": "Stale or replayed snapshot", "last_seq": last_seq}, 409
+
+        if write_buffer.enabled:
+            # Unknown and out-of-scope slots are reported now instead of being queued
+            found, out_of_scope = resolve_slot_scope(updates.keys(), lot_ids=lot_ids)
+            # Persist the sequence now; the slot writes follow with the next flush
+            db.session.commit()
+            write_buffer.submit({slot_id: updates[slot_id] for slot_id in found}, lot_ids=lot_ids)
+            fill_results(results, found, {}, out_of_scope, accepted=True)
+            return {"accepted": len(found), "results": results}, 202
+
+        found, changed, out_of_scope = apply_status_updates(updates, lot_ids=lot_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return {"error": str(e)}, 500
+
+    fill_results(results, found, changed, out_of_scope)
+    return {"changed": sorted(changed), "results": results}, 200
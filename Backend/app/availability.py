@@ -0,0 +1,192 @@
+from sqlalchemy import case, func, select, update
+from .models import ParkingLotDetails, Floor, Slot
+from . import db
+from .lot_version import version_bump_values
+from .pubsub import stage_lot_versions
+
+def lot_stats(lot_ids):
+    """
+    Slot counts for many lots with one grouped aggregate query.
+
+    Lots are LEFT JOINed to their slots, so a lot without slots still shows up with
+    zero counts and IDs that do not exist are simply absent from the result.
+    A slot counts as available only when its status is 0.
+
+    :return: ``{lot_id: stats}`` where ``stats`` carries ``total_slots``,
+        ``available_slots`` and ``occupied_slots`` plus the same counts per floor
+        (``floors``) and per slot vehicle type (``vehicle_types``).
+    """
+    rows = db.session.execute(
+        select(
+            ParkingLotDetails.id,
+            Slot.floor_id,
+            Floor.name,
+            Slot.vehicle_type,
+            func.count(Slot.id),
+            func.coalesce(func.sum(case((Slot.status == 0, 1), else_=0)), 0)
+        )
+        .outerjoin(Slot, Slot.parkinglot_id == ParkingLotDetails.id)
+        .outerjoin(Floor, Floor.id == Slot.floor_id)
+        .where(ParkingLotDetails.id.in_(lot_ids))
+        .group_by(ParkingLotDetails.id, Slot.floor_id, Floor.name, Slot.vehicle_type)
+    ).all()
+
+    stats = {}
+    for lot_id, floor_id, floor_name, vehicle_type, total, available in rows:
+        lot = stats.setdefault(lot_id, {
+            'parkinglot_id': lot_id,
+            'total_slots': 0,
+            'available_slots': 0,
+            'occupied_slots': 0,
+            'floors': {},
+            'vehicle_types': {}
+        })
+        if not total:
+            continue
+        _add_counts(lot, total, available)
+        floor = lot['floors'].setdefault(floor_id, {'floor_id': floor_id, 'name': floor_name,
+                                                    'total_slots': 0, 'available_slots': 0, 'occupied_slots': 0})
+        _add_counts(floor, total, available)
+        by_type = lot['vehicle_types'].setdefault(vehicle_type, {'total_slots': 0, 'available_slots': 0,
+                                                                 'occupied_slots': 0})
+        _add_counts(by_type, total, available)
+
+    for lot in stats.values():
+        lot['floors'] = sorted(lot['floors'].values(), key=lambda f: f['floor_id'])
+    return stats
+
+def availability_snapshot(lot_ids):
+    """
+    Slot counts for many lots together with the lot version they belong to.
+
+    Version and counts come from one statement, so they describe the same committed
+    state: a change published with a version at or below it is already counted.
+
+    :return: ``{lot_id: (version, total_slots, available_slots)}``; IDs that do not
+        exist are absent.
+    """
+    rows = db.session.execute(
+        select(
+            ParkingLotDetails.id,
+            ParkingLotDetails.version,
+            func.count(Slot.id),
+            func.coalesce(func.sum(case((Slot.status == 0, 1), else_=0)), 0)
+        )
+        .outerjoin(Slot, Slot.parkinglot_id == ParkingLotDetails.id)
+        .where(ParkingLotDetails.id.in_(lot_ids))
+        .group_by(ParkingLotDetails.id, ParkingLotDetails.version)
+    )
+    return {lot_id: (version, total, available) for lot_id, version, total, available in rows}
+
+def _add_counts(target, total, available):
+    target['total_slots'] += total
+    target['available_slots'] += available
+    target['occupied_slots'] += total - available
+
+# available_car_slots / available_two_wheeler_slots on ParkingLotDetails are kept in
+# step with the slots table by every write path, in the same transaction, so reading
+# availability is a primary-key lookup. reconcile_available_counters repairs drift.
+
+def is_car(vehicle_type):
+    return (vehicle_type or 'Car').lower() == 'car'
+
+def track_availability(deltas, lot_id, vehicle_type, was_available, is_available):
+    """
+    Accumulate the counter change for one slot into ``deltas`` ({lot_id: [car, two_wheeler]}).
+
+    A slot is available when its status is 0; pass False for a slot that did not
+    exist before (created) or no longer exists (deleted).
+    """
+    change = int(bool(is_available)) - int(bool(was_available))
+    if change:
+        entry = deltas.setdefault(lot_id, [0, 0])
+        entry[0 if is_car(vehicle_type) else 1] += change
+
+def adjust_available_counters(deltas, resync=()):
+    """
+    Apply accumulated counter changes with one UPDATE, relative to the stored values.
+
+    Every lot in ``deltas`` also gets its version bumped, so callers that changed slots
+    without changing availability can pass a ``[0, 0]`` entry instead of a second UPDATE.
+    Lots in ``resync`` had a structural change, see app/lot_version.py.
+
+    :return: Dict mapping lot_id -> new version.
+    """
+    if not deltas:
+        return {}
+
+    def increment(column, index):
+        return func.coalesce(column, 0) + case(
+            {lot_id: delta[index] for lot_id, delta in deltas.items()},
+            value=ParkingLotDetails.id, else_=0
+        )
+
+    rows = db.session.execute(
+        update(ParkingLotDetails)
+        .where(ParkingLotDetails.id.in_(sorted(deltas)))
+        .values(
+            available_car_slots=increment(ParkingLotDetails.available_car_slots, 0),
+            available_two_wheeler_slots=increment(ParkingLotDetails.available_two_wheeler_slots, 1),
+            **version_bump_values(resync)
+        )
+        .returning(ParkingLotDetails.id, ParkingLotDetails.version)
+        .execution_options(synchronize_session=False)
+    )
+    versions = dict(rows.all())
+    stage_lot_versions(db.session, versions)
+    return versions
+
+def adjust_slot_availability(lot_id, vehicle_type, was_available, is_available):
+    deltas = {}
+    track_availability(deltas, lot_id, vehicle_type, was_available, is_available)
+    return adjust_available_counters(deltas)
+
+def reconcile_available_counters(lot_ids=None):
+    """
+    Recount available slots for every lot that has slots (or only ``lot_ids``) and
+    overwrite counters that drifted. Lots without slots keep their manually entered
+    counters. The caller commits.
+
+    :return: List of ``(lot_id, (old_car, old_two_wheeler), (new_car, new_two_wheeler))``.
+    """
+    # Lock the lots first: writers adjusting counters concurrently then wait and apply
+    # their delta on top of the recount, which only sees committed slot changes.
+    locked = select(ParkingLotDetails.id).order_by(ParkingLotDetails.id).with_for_update()
+    if lot_ids is not None:
+        locked = locked.where(ParkingLotDetails.id.in_(lot_ids))
+    db.session.execute(locked).all()
+
+    car = func.lower(Slot.vehicle_type) == 'car'
+    query = (
+        select(
+            ParkingLotDetails.id,
+            ParkingLotDetails.available_car_slots,
+            ParkingLotDetails.available_two_wheeler_slots,
+            func.coalesce(func.sum(case(((Slot.status == 0) & car, 1), else_=0)), 0),
+            func.coalesce(func.sum(case(((Slot.status == 0) & ~car, 1), else_=0)), 0)
+        )
+        .join(Slot, Slot.parkinglot_id == ParkingLotDetails.id)
+        .group_by(ParkingLotDetails.id, ParkingLotDetails.available_car_slots,
+                  ParkingLotDetails.available_two_wheeler_slots)
+        .order_by(ParkingLotDetails.id)
+    )
+    if lot_ids is not None:
+        query = query.where(ParkingLotDetails.id.in_(lot_ids))
+    drifted = [
+        (lot_id, (old_car, old_two_wheeler), (new_car, new_two_wheeler))
+        for lot_id, old_car, old_two_wheeler, new_car, new_two_wheeler in db.session.execute(query)
+        if (old_car, old_two_wheeler) != (new_car, new_two_wheeler)
+    ]
+    if drifted:
+        db.session.execute(
+            update(ParkingLotDetails)
+            .where(ParkingLotDetails.id.in_([lot_id for lot_id, _, _ in drifted]))
+            .values(
+                available_car_slots=case({lot_id: new[0] for lot_id, _, new in drifted}, value=ParkingLotDetails.id),
+                available_two_wheeler_slots=case({lot_id: new[1] for lot_id, _, new in drifted},
+                                                 value=ParkingLotDetails.id),
+                version=ParkingLotDetails.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+    return drifted
@@ -0,0 +1,80 @@
+import struct
+import zlib
+from sqlalchemy import select
+from .models import Slot
+from . import db
+
+# Compact occupancy wire format, one bit per slot.
+#
+#   magic        2 bytes  b'SB'
+#   format       uint8    1, or 2 when a coverage mask follows the bits
+#   lot_id       uint32
+#   layout       uint32   layout version, see layout_version()
+#   slot_count   uint32
+#   bits         ceil(slot_count / 8) bytes, bit i (LSB first) = status of the i-th slot
+#   covered      format 2 only: ceil(slot_count / 8) bytes, bit i set if the sender
+#                observed the i-th slot; the status of an unobserved slot is unknown
+#
+# Slots are ordered by ascending slot_id. All integers are big-endian. A camera that
+# sees only part of a lot sends format 2, so the slots it cannot see are left alone.
+BITMAP_MIMETYPE = 'application/vnd.parking.slot-bitmap'
+MAGIC = b'SB'
+FORMAT_VERSION = 1
+FORMAT_MASKED = 2
+HEADER = struct.Struct('>2sBIII')
+
+class BitmapError(ValueError):
+    pass
+
+def layout_version(slot_ids):
+    """CRC32 of the ordered slot IDs; changes whenever slots are added to or removed from a lot."""
+    return zlib.crc32(struct.pack(f'>{len(slot_ids)}I', *slot_ids))
+
+def load_layout(lot_id):
+    """Return ``(slot_ids, statuses)`` for a lot in bitmap order."""
+    rows = db.session.execute(
+        select(Slot.id, Slot.status).where(Slot.parkinglot_id == lot_id).order_by(Slot.id)
+    ).all()
+    return [r[0] for r in rows], [r[1] or 0 for r in rows]
+
+def _pack(flags):
+    bits = bytearray((len(flags) + 7) // 8)
+    for i, flag in enumerate(flags):
+        if flag:
+            bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+def _unpack(bits, count):
+    return [(bits[i >> 3] >> (i & 7)) & 1 for i in range(count)]
+
+def encode(lot_id, version, statuses):
+    """
+    Pack a list of 0/1 statuses into the bitmap wire format. Statuses given as None
+    (slots the sender did not observe) produce a format 2 payload with a coverage mask.
+    """
+    if any(status is None for status in statuses):
+        return (HEADER.pack(MAGIC, FORMAT_MASKED, lot_id, version, len(statuses))
+                + _pack(statuses) + _pack([status is not None for status in statuses]))
+    return HEADER.pack(MAGIC, FORMAT_VERSION, lot_id, version, len(statuses)) + _pack(statuses)
+
+def decode(payload):
+    """
+    Unpack a bitmap payload.
+
+    :return: ``(lot_id, layout_version, statuses)``, with None for slots outside the
+             coverage mask of a format 2 payload.
+    :raises BitmapError: If the payload is malformed.
+    """
+    if len(payload) < HEADER.size:
+        raise BitmapError("Bitmap payload too short")
+    magic, fmt, lot_id, version, count = HEADER.unpack_from(payload)
+    if magic != MAGIC or fmt not in (FORMAT_VERSION, FORMAT_MASKED):
+        raise BitmapError("Unsupported bitmap format")
+    size = (count + 7) // 8
+    body = payload[HEADER.size:]
+    if len(body) != (size * 2 if fmt == FORMAT_MASKED else size):
+        raise BitmapError("Bitmap length does not match slot count")
+    statuses = _unpack(body[:size], count)
+    if fmt == FORMAT_MASKED:
+        statuses = [status if covered else None for status, covered in zip(statuses, _unpack(body[size:], count))]
+    return lot_id, version, statuses
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+STALE_LOTS_KEY = 'stale_lot_documents'
+
+class LRUBackend:
+    """
+    Per-process cache bounded by the total size of the stored documents. Like the
+    Redis backend it indexes keys by lot, so invalidate() only touches that lot's entries.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (lot_id, key) -> bytes
+        self._lot_keys = {}  # lot_id -> set of keys in _entries
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, lot_id, key):
+        with self._lock:
+            data = self._entries.get((lot_id, key))
+            if data is not None:
+                self._entries.move_to_end((lot_id, key))
+            return data
+
+    def set(self, lot_id, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((lot_id, key), None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[(lot_id, key)] = data
+            self._lot_keys.setdefault(lot_id, set()).add(key)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                (evicted_lot, evicted_key), evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._forget(evicted_lot, evicted_key)
+
+    def invalidate(self, lot_id):
+        with self._lock:
+            for key in self._lot_keys.pop(lot_id, ()):
+                self._size -= len(self._entries.pop((lot_id, key)))
+
+    def _forget(self, lot_id, key):
+        keys = self._lot_keys[lot_id]
+        keys.discard(key)
+        if not keys:
+            del self._lot_keys[lot_id]
+
+class RedisBackend:
+    """
+    Cache shared by all workers. Each lot keeps a set of its document keys so
+    invalidate() can drop them in one round trip; entries also expire after ``ttl``.
+    Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, url, ttl, prefix='lotdoc'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("LOT_CACHE_BACKEND=redis needs the 'redis' package (pip install redis)")
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _index(self, lot_id):
+        return f'{self.prefix}:{lot_id}:keys'
+
+    def get(self, lot_id, key):
+        return self._redis.get(f'{self.prefix}:{key}')
+
+    def set(self, lot_id, key, data):
+        pipe = self._redis.pipeline()
+        pipe.set(f'{self.prefix}:{key}', data, ex=self.ttl)
+        pipe.sadd(self._index(lot_id), f'{self.prefix}:{key}')
+        pipe.expire(self._index(lot_id), self.ttl)
+        pipe.execute()
+
+    def invalidate(self, lot_id):
+        keys = self._redis.smembers(self._index(lot_id))
+        self._redis.delete(self._index(lot_id), *keys)
+
+class LotDocumentCache:
+    """
+    Rendered JSON bodies of lot documents (detail, floor and row listings).
+
+    Keys carry the lot version, so a bumped version is never served a stale body.
+    Writers still invalidate the lots they touched, which frees the superseded
+    entries at once instead of waiting for them to be evicted.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        app.extensions['lot_cache'] = self
+        backend = app.config.get('LOT_CACHE_BACKEND', 'lru')
+        if backend == 'redis':
+            self.backend = RedisBackend(app.config['LOT_CACHE_REDIS_URL'], app.config.get('LOT_CACHE_TTL', 3600))
+        elif backend == 'lru':
+            self.backend = LRUBackend(app.config.get('LOT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        else:
+            self.backend = None
+
+    def get_or_render(self, lot_id, key, render):
+        """
+        Return the cached body for ``key``, or call ``render()`` for the bytes and store them.
+        """
+        if self.backend is None:
+            return render()
+        data = self.backend.get(lot_id, key)
+        if data is None:
+            data = render()
+            self.backend.set(lot_id, key, data)
+        return data
+
+    def invalidate(self, *lot_ids):
+        if self.backend is not None:
+            for lot_id in set(lot_ids):
+                if lot_id is not None:
+                    self.backend.invalidate(lot_id)
+
+    def invalidate_on_commit(self, session, lot_ids):
+        """Invalidate ``lot_ids`` once ``session`` commits (for writers that do not commit themselves)."""
+        session.info.setdefault(STALE_LOTS_KEY, set()).update(lot_ids)
+
+lot_cache = LotDocumentCache()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    lot_ids = session.info.pop(STALE_LOTS_KEY, None)
+    if lot_ids:
+        lot_cache.invalidate(*lot_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(STALE_LOTS_KEY, None)
@@ -0,0 +1,232 @@
+import csv
+import json
+import os
+import re
+import time
+from datetime import date
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from . import db
+from .availability import reconcile_available_counters
+from .cache import lot_cache
+from .layout import LayoutImporter
+from .models import ParkingLotDetails
+
+slot_events_cli = AppGroup('slot-events', help='Maintain the slot_status_events log.')
+
+availability_cli = AppGroup('availability', help='Maintain the per-lot availability counters.')
+
+layout_cli = AppGroup('layout', help='Bulk-load lot layouts.')
+
+PARTITION_RE = re.compile(r'slot_status_events_y(\d{4})m(\d{2})')
+DEFAULT_PARTITION = 'slot_status_events_default'
+
+def month_start(day, offset=0):
+    """First day of the month ``offset`` months after ``day``'s month."""
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(start):
+    return f"slot_status_events_y{start.year}m{start.month:02d}"
+
+def create_event_partitions(connection, months_ahead, today=None):
+    """
+    Create monthly partitions from the current month up to ``months_ahead`` months ahead.
+
+    PostgreSQL refuses to create a partition while the default partition holds rows in
+    its range, which happens once ingest has run ahead of this command. Such rows are
+    moved into the new table before it is attached, in the caller's transaction.
+
+    :return: (partition name, rows moved from the default partition or None if the
+        partition already existed) for each month.
+    """
+    today = today or date.today()
+    has_default = connection.execute(text("SELECT to_regclass(:name)"), {'name': DEFAULT_PARTITION}).scalar()
+    created = []
+    for offset in range(months_ahead + 1):
+        start, end = month_start(today, offset), month_start(today, offset + 1)
+        name = partition_name(start)
+        if connection.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+            created.append((name, None))
+            continue
+        bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        connection.execute(text(f"CREATE TABLE {name} (LIKE slot_status_events)"))
+        moved = 0
+        if has_default:
+            # Block ingest into the default partition until the new one is attached
+            connection.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE"))
+            moved = connection.execute(text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE changed_at >= :start AND changed_at < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), {'start': start, 'end': end}).rowcount
+        connection.execute(text(f"ALTER TABLE slot_status_events ATTACH PARTITION {name} FOR VALUES {bounds}"))
+        created.append((name, moved))
+    return created
+
+def _require_postgres():
+    if db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('slot_status_events is only partitioned on PostgreSQL')
+
+@slot_events_cli.command('create-partitions')
+@click.option('--months-ahead', default=3, show_default=True, help='Months to create beyond the current one.')
+def create_partitions(months_ahead):
+    """Create upcoming monthly partitions (run from cron, e.g. weekly)."""
+    _require_postgres()
+    with db.engine.begin() as connection:
+        for name, moved in create_event_partitions(connection, months_ahead):
+            if moved is None:
+                click.echo(f'Partition {name} already exists')
+            elif moved:
+                click.echo(f'Created partition {name} (moved {moved} rows out of the default partition)')
+            else:
+                click.echo(f'Created partition {name}')
+
+@slot_events_cli.command('drop-partitions')
+@click.option('--keep-months', default=12, show_default=True, help='Full months of history to keep.')
+def drop_partitions(keep_months):
+    """Drop monthly partitions that are entirely older than the retention window."""
+    _require_postgres()
+    cutoff = month_start(date.today(), -keep_months)
+    with db.engine.begin() as connection:
+        names = connection.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'slot_status_events'"
+        )).scalars().all()
+        for name in sorted(names):
+            match = PARTITION_RE.fullmatch(name)
+            if not match:
+                continue  # default partition
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            if month_start(start, 1) <= cutoff:
+                connection.execute(text(f'DROP TABLE {name}'))
+                click.echo(f'Dropped partition {name}')
+
+@availability_cli.command('reconcile')
+@click.option('--lot-id', 'lot_ids', type=int, multiple=True, help='Only these lots (repeatable).')
+def reconcile(lot_ids):
+    """Recount available slots and repair drifted lot counters."""
+    drifted = reconcile_available_counters(lot_ids or None)
+    db.session.commit()
+    for lot_id, old, new in drifted:
+        click.echo(f'Lot {lot_id}: car {old[0]} -> {new[0]}, two-wheeler {old[1]} -> {new[1]}')
+    click.echo(f'{len(drifted)} lot(s) repaired')
+
+def read_csv_slots(path):
+    """Yield ``(floor, row, slot, status, vehicle_type)`` from a CSV with a floor,row,slot[,status,vehicle_type] header."""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = {'floor', 'row', 'slot'} - set(reader.fieldnames or ())
+        if missing:
+            raise click.ClickException(f"{path}: missing column(s) {', '.join(sorted(missing))}")
+        for line in reader:
+            status = line.get('status') or '0'
+            if not status.isdigit():
+                raise click.ClickException(f'{path}, line {reader.line_num}: invalid status {status!r}')
+            yield line['floor'], line['row'], line['slot'], int(status), line.get('vehicle_type') or 'Car'
+
+def read_json_slots(layout):
+    """Yield slots from a layout in the POST /parking/lots/<id>/layout body format."""
+    for floor in layout.get('floors', []):
+        for row in floor.get('rows', []):
+            for slot in row.get('slots', []):
+                yield (floor.get('name'), row.get('name'), slot.get('name'),
+                       slot.get('status', 0), slot.get('vehicle_type', 'Car'))
+
+def read_spots(spots, video, floor, row):
+    """Yield one slot per spot of ``video`` in a parking_spots.json mapping (video -> Spot_N -> box)."""
+    for spot in spots[video]:
+        yield floor, row, spot, 0, 'Car'
+
+def write_spot_mapping(path, video, slot_ids):
+    """Merge ``video``'s Spot_N -> slot_id mapping into the edge's JSON mapping file."""
+    mapping = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            mapping = json.load(f)
+    mapping[video] = {slot: slot_id for (_, _, slot), slot_id in slot_ids.items()}
+    with open(path, 'w') as f:
+        json.dump(mapping, f, indent=4)
+
+def nested_slot_ids(importer):
+    """IDs keyed by name, in the shape returned by POST /parking/lots/<id>/layout."""
+    floors = {}
+    for (floor, row, slot), slot_id in importer.slot_ids.items():
+        entry = floors.setdefault(floor, {'id': importer.floor_ids[floor], 'rows': {}})
+        entry['rows'].setdefault(row, {'id': importer.row_ids[(floor, row)], 'slots': {}})['slots'][slot] = slot_id
+    return floors
+
+@layout_cli.command('import')
+@click.argument('lot_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv', 'spots']),
+              help='Input format (default: csv for .csv files; json, or spots for a parking_spots.json mapping).')
+@click.option('--video', help='Entry of a spots file to import (default: its only entry).')
+@click.option('--floor', default='Ground', show_default=True, help='Floor name for spots imports.')
+@click.option('--row', default='A', show_default=True, help='Row name for spots imports.')
+@click.option('--mapping-out', type=click.Path(dir_okay=False),
+              help='Where to write the generated IDs (spots default: slot_ids.json next to the input).')
+@click.option('--batch-size', default=10000, show_default=True, help='Slots per COPY/INSERT batch.')
+def import_layout(lot_id, path, fmt, video, floor, row, mapping_out, batch_size):
+    """
+    Load floors, rows and slots into a lot from a layout JSON, a CSV or parking_spots.json.
+
+    The whole file is imported in one transaction. For spots files the Spot_N -> slot_id
+    mapping is written for detect_parking_occupancy.py.
+    """
+    if db.session.get(ParkingLotDetails, lot_id) is None:
+        raise click.ClickException(f'Parking lot {lot_id} not found')
+    started = time.perf_counter()
+
+    if fmt is None and path.lower().endswith('.csv'):
+        fmt = 'csv'
+    if fmt == 'csv':
+        records = read_csv_slots(path)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        if fmt is None:
+            fmt = 'json' if isinstance(data, dict) and 'floors' in data else 'spots'
+        if fmt == 'json':
+            records = read_json_slots(data)
+        else:
+            if video is None:
+                if len(data) != 1:
+                    raise click.ClickException(f"{path} has several entries, pick one with --video: {', '.join(data)}")
+                video = next(iter(data))
+            if video not in data:
+                raise click.ClickException(f'{path} has no entry {video!r}')
+            records = read_spots(data, video, floor, row)
+            mapping_out = mapping_out or os.path.join(os.path.dirname(os.path.abspath(path)), 'slot_ids.json')
+
+    importer = LayoutImporter(lot_id, batch_size)
+    try:
+        for record in records:
+            importer.add(*record)
+        slot_ids = importer.finish()
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    except BaseException:
+        db.session.rollback()
+        raise
+    lot_cache.invalidate(lot_id)
+    click.echo(f'Imported {len(slot_ids)} slot(s) in {len({key[0] for key in slot_ids})} floor(s) and '
+               f'{len({key[:2] for key in slot_ids})} row(s) into lot {lot_id} in {time.perf_counter() - started:.1f}s')
+
+    if mapping_out:
+        if fmt == 'spots':
+            write_spot_mapping(mapping_out, video, slot_ids)
+        else:
+            with open(mapping_out, 'w') as f:
+                json.dump(nested_slot_ids(importer), f, indent=4)
+        click.echo(f'Wrote slot IDs to {mapping_out}')
+
+def register_commands(app):
+    app.cli.add_command(slot_events_cli)
+    app.cli.add_command(availability_cli)
+    app.cli.add_command(layout_cli)
@@ -17,9 +17,34 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{DB_HOST}:{DB_PORT}/{POSTGRES_DB}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    RPI_API_KEY = os.environ.get('RPI_API_KEY') or 'super-secret-rpi-key'
+    RPI_API_KEY = os.environ.get('RPI_API_KEY') or 'super-secret-rpi-key'  # Shared legacy key, not lot-scoped
+    DEVICE_KEY_TABLE_TTL = int(os.environ.get('DEVICE_KEY_TABLE_TTL', '60'))  # seconds
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-string'
 
+    # Slot status ingest: acknowledge immediately and write to the DB in batches
+    SLOT_STATUS_WRITE_BEHIND = os.environ.get('SLOT_STATUS_WRITE_BEHIND', 'false').lower() == 'true'
+    SLOT_STATUS_WRITE_BEHIND_SYNC = False  # Flush inline on every submit (for tests)
+    SLOT_STATUS_FLUSH_INTERVAL = float(os.environ.get('SLOT_STATUS_FLUSH_INTERVAL', '0.5'))  # seconds
+    SLOT_STATUS_FLUSH_MAX_PENDING = int(os.environ.get('SLOT_STATUS_FLUSH_MAX_PENDING', '1000'))
+    SLOT_STATUS_FLUSH_MAX_ATTEMPTS = int(os.environ.get('SLOT_STATUS_FLUSH_MAX_ATTEMPTS', '5'))  # then the status is dropped
+
+    # Long-lived streams (ingest, availability) are served by the gevent 'stream' service;
+    # set to false on thread-pool workers so a handful of streams cannot occupy them all
+    SERVE_STREAMS = os.environ.get('SERVE_STREAMS', 'true').lower() == 'true'
+
+    # Server-Sent Events availability stream
+    AVAILABILITY_STREAM_HEARTBEAT = float(os.environ.get('AVAILABILITY_STREAM_HEARTBEAT', '15'))  # seconds
+    AVAILABILITY_STREAM_MAX_LOTS = 50  # Lots per multi-lot subscription
+
+    # 'orjson' renders JSON responses with orjson, byte-compatible with 'default'
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'default')
+
+    # Rendered lot documents: 'lru' (per worker), 'redis' (shared, needs the redis package) or 'none'
+    LOT_CACHE_BACKEND = os.environ.get('LOT_CACHE_BACKEND', 'lru')
+    LOT_CACHE_MAX_BYTES = int(os.environ.get('LOT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    LOT_CACHE_REDIS_URL = os.environ.get('LOT_CACHE_REDIS_URL', 'redis://redis:6379/0')
+    LOT_CACHE_TTL = int(os.environ.get('LOT_CACHE_TTL', '3600'))  # seconds, redis only
+
     @staticmethod
     def init_app(app):
         pass
@@ -0,0 +1,117 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import select, text, update
+from .models import Device, DeviceLot, DeviceKeyGeneration
+from . import db
+from .pubsub import listen_forever
+
+# PostgreSQL NOTIFY channel telling every worker to reload its key table
+CHANNEL = 'device_keys'
+
+DeviceCredential = namedtuple('DeviceCredential', ['id', 'name', 'lot_ids'])
+
+def generate_api_key():
+    return secrets.token_urlsafe(32)
+
+def hash_api_key(api_key):
+    # Keys are random 256-bit tokens, so an unsalted digest is enough to keep them out of the DB
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+class DeviceKeyTable:
+    """
+    In-memory map of hashed device API key -> DeviceCredential.
+
+    The table is loaded with two queries and reused across requests, so authenticating
+    a device and checking its lot scope costs no query at all. Writers call bump() in
+    the transaction that changes a device key or scope: it advances the shared
+    generation in device_key_generation and, on PostgreSQL, sends a NOTIFY that makes
+    every worker drop its copy once the transaction commits (see listen). Once a copy
+    is DEVICE_KEY_TABLE_TTL seconds old the generation is compared, which bounds the
+    staleness of processes that missed a notification or cannot LISTEN.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._generation = None
+        self._loaded_at = None
+        self._invalidations = 0
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions['device_keys'] = self
+        self.invalidate()
+
+    def lookup(self, api_key, ttl):
+        if self._listener is None:
+            self.listen(db.engine)
+        if self._loaded_at is None:
+            self.reload()
+        elif time.monotonic() - self._loaded_at > ttl:
+            if current_generation() == self._generation:
+                self._loaded_at = time.monotonic()
+            else:
+                self.reload()
+        return self._keys.get(hash_api_key(api_key))
+
+    def listen(self, engine):
+        """
+        Start this worker's listener for key changes committed by any process. Called on
+        the first lookup, i.e. after the worker was forked. Idempotent; the listener
+        only runs on PostgreSQL.
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = False
+            if engine.dialect.name == 'postgresql':
+                self._listener = threading.Thread(target=listen_forever,
+                                                  args=(engine, CHANNEL, lambda payload: self.invalidate(), self.invalidate),
+                                                  name='device-key-listener', daemon=True)
+                self._listener.start()
+
+    def invalidate(self):
+        self._invalidations += 1
+        self._loaded_at = None
+
+    def bump(self):
+        """Advance the shared generation in the current transaction; the caller commits."""
+        db.session.execute(
+            update(DeviceKeyGeneration).where(DeviceKeyGeneration.id == 1)
+            .values(generation=DeviceKeyGeneration.generation + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # Delivered by PostgreSQL only if and when the transaction commits
+            db.session.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': CHANNEL, 'payload': ''})
+        self.invalidate()
+
+    def reload(self):
+        with self._lock:
+            # Read the generation first and note invalidations: a change committed
+            # during the reload then leaves the copy stale (notified) or older than the
+            # shared generation (not notified), and it is reloaded again
+            invalidations = self._invalidations
+            generation = current_generation()
+            scopes = {}
+            for device_id, lot_id in db.session.execute(select(DeviceLot.device_id, DeviceLot.parkinglot_id)):
+                scopes.setdefault(device_id, set()).add(lot_id)
+            devices = db.session.execute(
+                select(Device.id, Device.name, Device.api_key_hash).where(Device.is_active.is_(True))
+            ).all()
+            self._keys = {
+                key_hash: DeviceCredential(device_id, name, frozenset(scopes.get(device_id, ())))
+                for device_id, name, key_hash in devices
+            }
+            self._generation = generation
+            self._loaded_at = time.monotonic() if self._invalidations == invalidations else None
+
+def current_generation():
+    return db.session.execute(
+        select(DeviceKeyGeneration.generation).where(DeviceKeyGeneration.id == 1)
+    ).scalar()
+
+device_keys = DeviceKeyTable()
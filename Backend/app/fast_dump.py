@@ -0,0 +1,145 @@
+from marshmallow import fields
+from sqlalchemy import inspect, select
+from .models import ParkingLotDetails, Floor, Row, Slot
+from . import db
+
+# Read-path serializers that produce the same dicts as the Marshmallow schemas in
+# parking.py, but from plain row tuples: the column list and per-field converters
+# are worked out once from the schema declarations, so dumping a row is a single
+# dict comprehension instead of a field-by-field walk over an ORM object.
+
+CONVERTERS = {
+    fields.Integer: int,
+    fields.String: str,
+    fields.Float: float,
+    fields.Boolean: bool,
+    fields.DateTime: lambda value: value.isoformat(),
+    fields.Time: lambda value: value.isoformat(),
+}
+
+def _converter(field):
+    for field_class in type(field).__mro__:
+        if field_class in CONVERTERS:
+            return CONVERTERS[field_class]
+    raise TypeError(f'No fast converter for {type(field).__name__}')
+
+class CompiledDump:
+    """
+    Precompiled equivalent of ``schema.dump`` for rows selected with ``columns``.
+
+    Nested fields are left to the caller, and fields whose attribute is not a column
+    of ``model`` are dropped, just as Marshmallow omits attributes the object lacks.
+    """
+
+    def __init__(self, schema, model):
+        column_attrs = inspect(model).column_attrs
+        self.columns = []
+        self.keys = []
+        self.converters = []
+        for name, field in schema.dump_fields.items():
+            attribute = field.attribute or name
+            if isinstance(field, fields.Nested) or attribute not in column_attrs:
+                continue
+            self.columns.append(getattr(model, attribute))
+            self.keys.append(field.data_key or name)
+            self.converters.append(_converter(field))
+        self._fields = tuple(zip(self.keys, self.converters))
+
+    def dump(self, row):
+        return {
+            key: None if value is None else convert(value)
+            for (key, convert), value in zip(self._fields, row)
+        }
+
+class LotDocuments:
+    """
+    Tuple-based builders for the nested lot documents, one query per level.
+
+    Children are ordered by ID, matching the ``order_by`` of the model relationships.
+    """
+
+    def __init__(self, lot_schema, floor_schema, row_schema, slot_schema):
+        self.lot = CompiledDump(lot_schema, ParkingLotDetails)
+        self.floor = CompiledDump(floor_schema, Floor)
+        self.row = CompiledDump(row_schema, Row)
+        self.slot = CompiledDump(slot_schema, Slot)
+
+    def _slots_by_row(self, condition):
+        by_row = {}
+        rows = db.session.execute(
+            select(Slot.row_id, *self.slot.columns)
+            .join(Row, Row.id == Slot.row_id)
+            .where(condition)
+            .order_by(Slot.id)
+        )
+        for row in rows:
+            by_row.setdefault(row[0], []).append(self.slot.dump(row[1:]))
+        return by_row
+
+    def _rows_by_floor(self, condition):
+        slots = self._slots_by_row(condition)
+        by_floor = {}
+        rows = db.session.execute(
+            select(Row.floor_id, Row.id, *self.row.columns).where(condition).order_by(Row.id)
+        )
+        for row in rows:
+            document = self.row.dump(row[2:])
+            document['slots'] = slots.get(row[1], [])
+            by_floor.setdefault(row[0], []).append(document)
+        return by_floor
+
+    def floors(self, lot_id):
+        rows = self._rows_by_floor(Row.floor_id.in_(select(Floor.id).where(Floor.parkinglot_id == lot_id)))
+        floors = []
+        for row in db.session.execute(
+            select(Floor.id, *self.floor.columns).where(Floor.parkinglot_id == lot_id).order_by(Floor.id)
+        ):
+            document = self.floor.dump(row[1:])
+            document['rows'] = rows.get(row[0], [])
+            floors.append(document)
+        return floors
+
+    def detail(self, lot_id):
+        """The full lot document, or None if the lot does not exist."""
+        row = db.session.execute(
+            select(*self.lot.columns).where(ParkingLotDetails.id == lot_id)
+        ).first()
+        if row is None:
+            return None
+        document = self.lot.dump(row)
+        document['floors'] = self.floors(lot_id)
+        return document
+
+    def rows(self, floor_id):
+        return self._rows_by_floor(Row.floor_id == floor_id).get(floor_id, [])
+
+    def floors_by_id(self, floor_ids):
+        """Floor documents of ``floor_ids`` that exist, keyed by ID."""
+        rows = self._rows_by_floor(Row.floor_id.in_(floor_ids))
+        floors = {}
+        for row in db.session.execute(select(Floor.id, *self.floor.columns).where(Floor.id.in_(floor_ids))):
+            document = self.floor.dump(row[1:])
+            document['rows'] = rows.get(row[0], [])
+            floors[row[0]] = document
+        return floors
+
+    def rows_by_id(self, row_ids):
+        """Row documents of ``row_ids`` that exist, keyed by ID."""
+        rows = {}
+        for floor_rows in self._rows_by_floor(Row.id.in_(row_ids)).values():
+            for document in floor_rows:
+                rows[document['id']] = document
+        return rows
+
+    def slots_by_id(self, slot_ids):
+        """Slot documents of ``slot_ids`` that exist, keyed by ID."""
+        return {
+            row[0]: self.slot.dump(row[1:])
+            for row in db.session.execute(select(Slot.id, *self.slot.columns).where(Slot.id.in_(slot_ids)))
+        }
+
+    def slots(self, row_id):
+        return [
+            self.slot.dump(row)
+            for row in db.session.execute(select(*self.slot.columns).where(Slot.row_id == row_id).order_by(Slot.id))
+        ]
@@ -0,0 +1,93 @@
+import math
+
+# Geohash grid used to find lots near a point with a plain B-tree index: every lot
+# stores the geohash of its coordinates, and the cells around a point are matched by
+# prefix. A geohash interleaves longitude and latitude bits (longitude first) and
+# writes them 5 bits per character in this alphabet.
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+DECODE = {c: i for i, c in enumerate(BASE32)}
+STORED_PRECISION = 9  # ~5m cells
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+def encode(latitude, longitude, precision=STORED_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+def decode_bounds(geohash):
+    """``(min_lat, max_lat, min_lon, max_lon)`` of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+def cell_size(precision):
+    """Height and width of a geohash cell in degrees."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+def search_precision(latitude, radius_m):
+    """Longest geohash prefix whose cells are at least ``radius_m`` tall and wide at this latitude."""
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    precision = 1
+    for candidate in range(1, STORED_PRECISION + 1):
+        height, width = cell_size(candidate)
+        if height < dlat or width < dlon:
+            break
+        precision = candidate
+    return precision
+
+def covering_cells(latitude, longitude, radius_m):
+    """
+    Geohash prefixes whose cells together cover the circle of ``radius_m`` around a point.
+
+    The point's cell is at least as large as the radius in both directions, so it and
+    its eight neighbours always contain the whole circle.
+    """
+    precision = search_precision(latitude, radius_m)
+    center = encode(latitude, longitude, precision)
+    min_lat, max_lat, min_lon, max_lon = decode_bounds(center)
+    height, width = max_lat - min_lat, max_lon - min_lon
+    mid_lat, mid_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    cells = set()
+    for dy in (-1, 0, 1):
+        lat = mid_lat + dy * height
+        if not -90 < lat < 90:
+            continue
+        for dx in (-1, 0, 1):
+            lon = (mid_lon + dx * width + 180) % 360 - 180
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
@@ -0,0 +1,149 @@
+from sqlalchemy import delete, select, update
+from .models import ParkingLotDetails, Floor, Row, Slot, ParkingSession, AdminParkingLot, DeviceLot, DeviceSequence
+from . import db
+from .availability import track_availability, adjust_available_counters
+from .cache import lot_cache
+from .device_keys import device_keys
+from .lot_version import bump_lot_versions
+from .slot_status import record_status_events
+
+# Set-based mutations of the lot hierarchy: each one is a fixed number of statements
+# however many floors, rows or slots it touches, and none of them load ORM objects.
+# The statements bypass the flush hooks, so they keep the lot versions, availability
+# counters and lot_cache in step themselves. Slots are locked or deleted before the
+# lot row is updated, the same order as apply_status_updates. The caller commits.
+
+def update_slot(slot_id, changes, columns):
+    """
+    Apply ``changes`` (attribute name -> value) to a slot with one UPDATE ... RETURNING.
+
+    :return: The updated slot's ``columns``, or None if the slot does not exist.
+    """
+    current = db.session.execute(
+        select(Slot.parkinglot_id, Slot.status, Slot.vehicle_type).where(Slot.id == slot_id).with_for_update()
+    ).first()
+    if current is None:
+        return None
+    lot_id, status, vehicle_type = current
+    new_status = changes.get('status', status)
+    deltas = {lot_id: [0, 0]}
+    track_availability(deltas, lot_id, vehicle_type, status == 0, False)
+    track_availability(deltas, lot_id, changes.get('vehicle_type', vehicle_type), False, new_status == 0)
+    versions = adjust_available_counters(deltas)
+    row = db.session.execute(
+        update(Slot)
+        .where(Slot.id == slot_id)
+        .values(**changes, change_version=versions[lot_id])
+        .returning(*columns)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if new_status != status:
+        record_status_events([(slot_id, lot_id, status, new_status)], 'manual')
+    lot_cache.invalidate_on_commit(db.session, [lot_id])
+    return row
+
+def rename(model, id_, changes, columns):
+    """
+    Apply ``changes`` to a floor or row with one UPDATE ... RETURNING. Renames cannot be
+    described by slot deltas, so delta sync clients of the lot are sent to a resync.
+
+    :return: The updated ``columns``, or None if the floor or row does not exist.
+    """
+    if changes:
+        statement = (
+            update(model).where(model.id == id_).values(**changes)
+            .execution_options(synchronize_session=False)
+            .returning(model.parkinglot_id, *columns)
+        )
+    else:
+        statement = select(model.parkinglot_id, *columns).where(model.id == id_)
+    row = db.session.execute(statement).first()
+    if row is None:
+        return None
+    if changes:
+        bump_lot_versions([row[0]], resync=[row[0]])
+        lot_cache.invalidate_on_commit(db.session, [row[0]])
+    return row[1:]
+
+def _delete_slots(condition):
+    """
+    Delete the slots matching ``condition``, detaching their parking sessions so the
+    session history survives, log the deletions as status events (which also publishes
+    them to the availability stream) and return the availability deltas per lot.
+    """
+    db.session.execute(
+        update(ParkingSession)
+        .where(ParkingSession.slot_id.in_(select(Slot.id).where(condition)))
+        .values(slot_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    deltas, removed = {}, []
+    for slot_id, lot_id, vehicle_type, status in db.session.execute(
+        delete(Slot).where(condition)
+        .returning(Slot.id, Slot.parkinglot_id, Slot.vehicle_type, Slot.status)
+        .execution_options(synchronize_session=False)
+    ):
+        deltas.setdefault(lot_id, [0, 0])
+        track_availability(deltas, lot_id, vehicle_type, status == 0, False)
+        removed.append((slot_id, lot_id, status, None))
+    record_status_events(removed, 'delete')
+    return deltas
+
+def _delete(model, condition):
+    return db.session.execute(
+        delete(model).where(condition).returning(model.parkinglot_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().first()
+
+def _finish_delete(lot_id, deltas):
+    deltas.setdefault(lot_id, [0, 0])
+    adjust_available_counters(deltas, resync=[lot_id])
+    lot_cache.invalidate_on_commit(db.session, [lot_id])
+
+def delete_slot(slot_id):
+    """Delete a slot. Returns its lot ID, or None if it does not exist."""
+    deltas = _delete_slots(Slot.id == slot_id)
+    if not deltas:
+        return None
+    lot_id, = deltas
+    _finish_delete(lot_id, deltas)
+    return lot_id
+
+def delete_row(row_id):
+    """Delete a row and its slots. Returns the lot ID, or None if the row does not exist."""
+    deltas = _delete_slots(Slot.row_id == row_id)
+    lot_id = _delete(Row, Row.id == row_id)
+    if lot_id is not None:
+        _finish_delete(lot_id, deltas)
+    return lot_id
+
+def delete_floor(floor_id):
+    """Delete a floor with its rows and slots. Returns the lot ID, or None if the floor does not exist."""
+    deltas = _delete_slots(Slot.floor_id == floor_id)
+    db.session.execute(delete(Row).where(Row.floor_id == floor_id).execution_options(synchronize_session=False))
+    lot_id = _delete(Floor, Floor.id == floor_id)
+    if lot_id is not None:
+        _finish_delete(lot_id, deltas)
+    return lot_id
+
+def delete_lot(lot_id):
+    """
+    Delete a lot with its floors, rows and slots, admin and device assignments and
+    device sequences. Returns False if the lot does not exist.
+    """
+    _delete_slots(Slot.parkinglot_id == lot_id)
+    for model, column in ((Row, Row.parkinglot_id), (Floor, Floor.parkinglot_id),
+                          (AdminParkingLot, AdminParkingLot.parking_lot_id), (DeviceLot, DeviceLot.parkinglot_id),
+                          (DeviceSequence, DeviceSequence.parkinglot_id)):
+        db.session.execute(delete(model).where(column == lot_id).execution_options(synchronize_session=False))
+    deleted = db.session.execute(
+        delete(ParkingLotDetails).where(ParkingLotDetails.id == lot_id)
+        .returning(ParkingLotDetails.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if deleted is None:
+        return False
+    # Device scopes lost this lot: every worker reloads its key table after the commit
+    device_keys.bump()
+    lot_cache.invalidate_on_commit(db.session, [lot_id])
+    return True
@@ -0,0 +1,39 @@
+import re
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+# Floats that Python writes in exponent form (below 1e-4 or from 1e16) are formatted
+# differently by orjson ("1e16", "5e-7" or "0.00001"); any output that may contain
+# one is re-encoded by the default provider. Matches inside strings only cause a
+# harmless fallback. The pattern starts with a literal so the scan stays cheap.
+ORJSON_EXPONENT_RE = re.compile(rb'e[-0-9]')
+SMALL_FLOAT_MARKER = b'0.0000'
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that renders responses with orjson.
+
+    Output is byte-for-byte what DefaultJSONProvider produces for compact responses:
+    keys are sorted, dates and Decimals go through the default provider's hook, and
+    anything orjson would render differently (non-ASCII text, which the default
+    escapes, exponent-form floats, non-string keys) falls back to the default encoder.
+    The one exception is NaN/Infinity, which orjson writes as null.
+    Request bodies are still parsed by the stdlib, which accepts input orjson rejects
+    (NaN, integers beyond 64 bits). Enable it with JSON_PROVIDER=orjson.
+    """
+
+    def dumps(self, obj, **kwargs):
+        # Only compact response bodies take the fast path; other callers get the stdlib layout
+        if kwargs != {'separators': (',', ':')} or not self.sort_keys or not self.ensure_ascii:
+            return super().dumps(obj, **kwargs)
+        try:
+            data = orjson.dumps(
+                obj,
+                default=self.default,
+                option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            )
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+        if not data.isascii() or SMALL_FLOAT_MARKER in data or ORJSON_EXPONENT_RE.search(data):
+            return super().dumps(obj, **kwargs)
+        return data.decode()
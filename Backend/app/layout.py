@@ -0,0 +1,242 @@
+from marshmallow import validate, validates_schema, ValidationError
+import csv
+import io
+from sqlalchemy import insert, select, text
+from .models import Floor, Row, Slot
+from . import db, ma
+from .availability import track_availability, adjust_available_counters
+from .pubsub import stage_slot_counts
+from .slot_status import VALID_STATUSES
+
+# Whole-lot layouts (floors -> rows -> slots) created with one multi-row INSERT ...
+# RETURNING per level instead of one request and commit per object.
+
+MAX_LAYOUT_SLOTS = 10000
+VEHICLE_TYPES = ('Car', 'Two-Wheeler')
+
+def _unique_names(items, field):
+    names = [item['name'] for item in items]
+    if len(names) != len(set(names)):
+        raise ValidationError('Names must be unique within their parent', field)
+
+class LayoutSlotSchema(ma.Schema):
+    name = ma.Str(required=True, validate=validate.Length(min=1, max=50))
+    status = ma.Int(load_default=0, validate=validate.OneOf(VALID_STATUSES))
+    vehicle_type = ma.Str(load_default='Car', validate=validate.OneOf(VEHICLE_TYPES))
+
+class LayoutRowSchema(ma.Schema):
+    name = ma.Str(required=True, validate=validate.Length(min=1, max=50))
+    slots = ma.List(ma.Nested(LayoutSlotSchema), load_default=list)
+
+    @validates_schema
+    def check_slot_names(self, data, **kwargs):
+        _unique_names(data['slots'], 'slots')
+
+class LayoutFloorSchema(ma.Schema):
+    name = ma.Str(required=True, validate=validate.Length(min=1, max=50))
+    rows = ma.List(ma.Nested(LayoutRowSchema), load_default=list)
+
+    @validates_schema
+    def check_row_names(self, data, **kwargs):
+        _unique_names(data['rows'], 'rows')
+
+class LayoutSchema(ma.Schema):
+    floors = ma.List(ma.Nested(LayoutFloorSchema), required=True, validate=validate.Length(min=1))
+
+    @validates_schema
+    def check_layout(self, data, **kwargs):
+        _unique_names(data['floors'], 'floors')
+        total = sum(len(row['slots']) for floor in data['floors'] for row in floor['rows'])
+        if total > MAX_LAYOUT_SLOTS:
+            raise ValidationError(f'At most {MAX_LAYOUT_SLOTS} slots per layout', 'floors')
+
+layout_schema = LayoutSchema()
+
+def _insert_returning(model, values, *key_columns):
+    """
+    Multi-row INSERT of ``values`` (keyed by column name) into ``model``'s table,
+    returning ``{key: id}`` with the key built from ``key_columns``. This is a Core
+    insert: the ORM bulk path costs several times more per row.
+    """
+    if not values:
+        return {}
+    rows = db.session.execute(insert(model.__table__).returning(model.id, *key_columns), values)
+    return {tuple(key): id_ for id_, *key in rows}
+
+def create_layout(lot_id, layout):
+    """
+    Insert a validated layout (``layout_schema.load`` output) into a lot and adjust
+    its availability counters and version. The caller commits.
+
+    Names are unique within their parent, so generated IDs are matched back through
+    ``(parent_id, name)`` and the INSERTs need not return rows in parameter order.
+
+    :return: Generated IDs keyed by the supplied names:
+             ``{floor: {"id": ..., "rows": {row: {"id": ..., "slots": {slot: id}}}}}``.
+    """
+    floors = layout['floors']
+    floor_ids = _insert_returning(Floor, [
+        {'floor_name': floor['name'], 'parkinglot_id': lot_id} for floor in floors
+    ], Floor.name)
+
+    row_ids = _insert_returning(Row, [
+        {'row_name': row['name'], 'floor_id': floor_ids[(floor['name'],)], 'parkinglot_id': lot_id}
+        for floor in floors for row in floor['rows']
+    ], Row.floor_id, Row.name)
+
+    slots = []
+    for floor in floors:
+        floor_id = floor_ids[(floor['name'],)]
+        for row in floor['rows']:
+            row_id = row_ids[(floor_id, row['name'])]
+            slots.extend(
+                {'slot_name': slot['name'], 'status': slot['status'], 'vehicle_type': slot['vehicle_type'],
+                 'row_id': row_id, 'floor_id': floor_id, 'parkinglot_id': lot_id}
+                for slot in row['slots']
+            )
+    slot_ids = _insert_returning(Slot, slots, Slot.row_id, Slot.name)
+
+    # The bulk INSERTs bypass the flush hooks, so the counter UPDATE also bumps the version;
+    # new floors and rows are a structural change for delta sync clients
+    deltas = {lot_id: [0, 0]}
+    for slot in slots:
+        track_availability(deltas, lot_id, slot['vehicle_type'], False, slot['status'] == 0)
+    adjust_available_counters(deltas, resync=[lot_id])
+    stage_slot_counts(db.session, lot_id, len(slots), sum(deltas[lot_id]))
+
+    result = {}
+    for floor in floors:
+        floor_id = floor_ids[(floor['name'],)]
+        rows = {}
+        for row in floor['rows']:
+            row_id = row_ids[(floor_id, row['name'])]
+            rows[row['name']] = {
+                'id': row_id,
+                'slots': {slot['name']: slot_ids[(row_id, slot['name'])] for slot in row['slots']}
+            }
+        result[floor['name']] = {'id': floor_id, 'rows': rows}
+    return result
+
+class LayoutImporter:
+    """
+    Streams slots into a lot for the ``flask layout import`` command.
+
+    Slots are added one at a time as ``(floor, row, slot)`` names and written in
+    batches: new floors and rows with one INSERT ... RETURNING each, then the slots.
+    On PostgreSQL (psycopg2) slot IDs are drawn from the sequence up front and the
+    batch is loaded with COPY; elsewhere it is a multi-row INSERT ... RETURNING.
+    Floors and rows the lot already has are reused by name, and slots it already has
+    are rejected, so a layout can be extended by importing only the new slots.
+    Everything happens in the session's transaction; the caller commits.
+    """
+
+    def __init__(self, lot_id, batch_size=10000):
+        self.lot_id = lot_id
+        self.batch_size = batch_size
+        self.floor_ids = {}  # floor name -> id
+        self.row_ids = {}    # (floor name, row name) -> id
+        self.slot_ids = {}   # (floor name, row name, slot name) -> id, for imported slots
+        self.existing_slots = set()  # (floor name, row name, slot name) already in the lot
+        self.pending = []
+        self.deltas = {lot_id: [0, 0]}
+        self.use_copy = db.session.get_bind().dialect.driver == 'psycopg2'
+        self._load_existing()
+
+    def _load_existing(self):
+        floor_names = {}
+        for floor_id, name in db.session.execute(select(Floor.id, Floor.name).where(Floor.parkinglot_id == self.lot_id)):
+            self.floor_ids[name] = floor_id
+            floor_names[floor_id] = name
+        row_keys = {}
+        for row_id, name, floor_id in db.session.execute(
+            select(Row.id, Row.name, Row.floor_id).where(Row.parkinglot_id == self.lot_id)
+        ):
+            row_keys[row_id] = (floor_names[floor_id], name)
+            self.row_ids[row_keys[row_id]] = row_id
+        for row_id, name in db.session.execute(select(Slot.row_id, Slot.name).where(Slot.parkinglot_id == self.lot_id)):
+            self.existing_slots.add(row_keys[row_id] + (name,))
+
+    def add(self, floor, row, slot, status=0, vehicle_type='Car'):
+        """
+        Queue one slot. Floors and rows are created the first time their name is seen.
+
+        :raises ValueError: On an invalid name, status or vehicle type, or a duplicate slot.
+        """
+        for kind, name in (('floor', floor), ('row', row), ('slot', slot)):
+            if not isinstance(name, str) or not 1 <= len(name) <= 50:
+                raise ValueError(f'Invalid {kind} name: {name!r}')
+        if status not in VALID_STATUSES:
+            raise ValueError(f'Invalid status for slot {slot!r}: {status!r}')
+        if vehicle_type not in VEHICLE_TYPES:
+            raise ValueError(f'Invalid vehicle type for slot {slot!r}: {vehicle_type!r}')
+        key = (floor, row, slot)
+        if key in self.slot_ids:
+            raise ValueError(f'Duplicate slot {slot!r} in floor {floor!r}, row {row!r}')
+        if key in self.existing_slots:
+            raise ValueError(f'Slot {slot!r} already exists in floor {floor!r}, row {row!r}')
+        self.slot_ids[key] = None
+        self.pending.append((floor, row, slot, status, vehicle_type))
+        track_availability(self.deltas, self.lot_id, vehicle_type, False, status == 0)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        new_floors = list(dict.fromkeys(f for f, _, _, _, _ in self.pending if f not in self.floor_ids))
+        for (name,), floor_id in _insert_returning(Floor, [
+            {'floor_name': name, 'parkinglot_id': self.lot_id} for name in new_floors
+        ], Floor.name).items():
+            self.floor_ids[name] = floor_id
+
+        floor_names = {floor_id: name for name, floor_id in self.floor_ids.items()}
+        new_rows = list(dict.fromkeys((f, r) for f, r, _, _, _ in self.pending if (f, r) not in self.row_ids))
+        for (floor_id, name), row_id in _insert_returning(Row, [
+            {'row_name': row, 'floor_id': self.floor_ids[floor], 'parkinglot_id': self.lot_id} for floor, row in new_rows
+        ], Row.floor_id, Row.name).items():
+            self.row_ids[(floor_names[floor_id], name)] = row_id
+
+        if self.use_copy:
+            self._copy_slots()
+        else:
+            self._insert_slots()
+        self.pending = []
+
+    def _insert_slots(self):
+        row_names = {row_id: key for key, row_id in self.row_ids.items()}
+        for (row_id, name), slot_id in _insert_returning(Slot, [
+            {'slot_name': slot, 'status': status, 'vehicle_type': vehicle_type, 'row_id': self.row_ids[(floor, row)],
+             'floor_id': self.floor_ids[floor], 'parkinglot_id': self.lot_id}
+            for floor, row, slot, status, vehicle_type in self.pending
+        ], Slot.row_id, Slot.name).items():
+            self.slot_ids[row_names[row_id] + (name,)] = slot_id
+
+    def _copy_slots(self):
+        connection = db.session.connection()
+        slot_ids = connection.execute(
+            text("SELECT nextval(pg_get_serial_sequence('slots', 'slot_id')) FROM generate_series(1, :n)"),
+            {'n': len(self.pending)}
+        ).scalars().all()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for slot_id, (floor, row, slot, status, vehicle_type) in zip(slot_ids, self.pending):
+            writer.writerow((slot_id, slot, status, vehicle_type, self.row_ids[(floor, row)],
+                             self.floor_ids[floor], self.lot_id))
+            self.slot_ids[(floor, row, slot)] = slot_id
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                'COPY slots (slot_id, slot_name, status, vehicle_type, row_id, floor_id, parkinglot_id) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+        finally:
+            cursor.close()
+
+    def finish(self):
+        """Write the remaining batch and update the lot's counters and version. Returns ``slot_ids``."""
+        self.flush()
+        adjust_available_counters(self.deltas, resync=[self.lot_id])
+        stage_slot_counts(db.session, self.lot_id, len(self.slot_ids), sum(self.deltas[self.lot_id]))
+        return self.slot_ids
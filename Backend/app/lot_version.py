@@ -0,0 +1,127 @@
+from sqlalchemy import case, event, inspect, update
+from sqlalchemy.orm import Session
+from .models import ParkingLotDetails, Floor, Row, Slot
+from . import db
+from .pubsub import stage_lot_versions
+
+# ParkingLotDetails.version increases whenever the lot, or any of its floors, rows or
+# slots, changes. ORM writes are picked up by the flush hooks below; statements that
+# bypass the unit of work (bulk UPDATE/DELETE) call bump_lot_versions themselves.
+#
+# For delta sync, each slot records in change_version the lot version of its last
+# change, and min_sync_version marks the last structural change (floors or rows
+# added, changed or removed, slots removed) that slot deltas cannot describe.
+
+TOUCHED_KEY = 'touched_lot_ids'
+RESYNC_KEY = 'resync_lot_ids'
+CHANGED_SLOTS_KEY = 'changed_slots'
+
+def version_bump_values(resync=()):
+    """SET clause that increments the version, and moves min_sync_version up to it for ``resync`` lots."""
+    values = {'version': ParkingLotDetails.version + 1}
+    if resync:
+        values['min_sync_version'] = case(
+            (ParkingLotDetails.id.in_(sorted(set(resync))), ParkingLotDetails.version + 1),
+            else_=ParkingLotDetails.min_sync_version
+        )
+    return values
+
+def bump_lot_versions(lot_ids, bind=None, resync=()):
+    """
+    Increment the versions of ``lot_ids`` and return ``{lot_id: new_version}``.
+
+    Without ``bind`` the new versions are also staged on db.session for the
+    availability stream; callers passing a connection stage them themselves.
+    """
+    lot_ids = sorted(set(lot_ids))
+    if not lot_ids:
+        return {}
+    rows = (bind or db.session).execute(
+        update(ParkingLotDetails)
+        .where(ParkingLotDetails.id.in_(lot_ids))
+        .values(**version_bump_values(resync))
+        .returning(ParkingLotDetails.id, ParkingLotDetails.version)
+        .execution_options(synchronize_session=False)
+    )
+    versions = dict(rows.all())
+    if bind is None:
+        stage_lot_versions(db.session, versions)
+    return versions
+
+def stamp_slot_versions(slot_lots, versions, bind=None):
+    """Set change_version of the slots in ``slot_lots`` ({slot_id: lot_id}) to their lot's version."""
+    if slot_lots:
+        (bind or db.session).execute(
+            update(Slot)
+            .where(Slot.id.in_(sorted(slot_lots)))
+            .values(change_version=case(versions, value=Slot.parkinglot_id))
+            .execution_options(synchronize_session=False)
+        )
+
+@event.listens_for(Session, 'before_flush')
+def _collect_touched_lots(session, flush_context, instances):
+    touched, resync, slots = set(), set(), []
+    for obj in session.new:
+        if isinstance(obj, (Floor, Row, Slot)):
+            touched.add(obj.parkinglot_id)
+            if isinstance(obj, Slot):
+                slots.append(obj)
+            else:
+                resync.add(obj.parkinglot_id)
+    for obj in session.deleted:
+        if isinstance(obj, (Floor, Row, Slot)):
+            touched.add(obj.parkinglot_id)
+            resync.add(obj.parkinglot_id)
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, (Floor, Row, Slot)):
+            # A child moved to another lot changes both lots
+            previous = inspect(obj).attrs.parkinglot_id.history.deleted or ()
+            touched.add(obj.parkinglot_id)
+            touched.update(previous)
+            resync.update(previous)
+            if isinstance(obj, Slot):
+                slots.append(obj)
+            else:
+                resync.add(obj.parkinglot_id)
+        elif isinstance(obj, ParkingLotDetails) and not inspect(obj).attrs.version.history.has_changes():
+            obj.version = ParkingLotDetails.version + 1
+    touched.discard(None)
+    resync.discard(None)
+    if touched:
+        session.info.setdefault(TOUCHED_KEY, set()).update(touched)
+        session.info.setdefault(RESYNC_KEY, set()).update(resync)
+        session.info.setdefault(CHANGED_SLOTS_KEY, []).extend(slots)
+
+@event.listens_for(Session, 'after_flush')
+def _bump_touched_lots(session, flush_context):
+    touched = session.info.get(TOUCHED_KEY)
+    if touched:
+        # After the flush, so slot rows are locked before the lot row as in apply_status_updates
+        connection = session.connection()
+        versions = bump_lot_versions(touched, connection, session.info.pop(RESYNC_KEY, ()))
+        stage_lot_versions(session, versions)
+        stamp_slot_versions(
+            {slot.id: slot.parkinglot_id for slot in session.info.get(CHANGED_SLOTS_KEY, ())
+             if slot.id is not None and slot.parkinglot_id in versions},
+            versions, connection
+        )
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_bumped_versions(session, flush_context):
+    touched = session.info.pop(TOUCHED_KEY, None)
+    slots = session.info.pop(CHANGED_SLOTS_KEY, ())
+    if touched:
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, ParkingLotDetails) and obj.id in touched:
+                session.expire(obj, ['version', 'min_sync_version'])
+    for slot in slots:
+        if slot in session and not inspect(slot).deleted:
+            session.expire(slot, ['change_version'])
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_touched_lots(session):
+    session.info.pop(TOUCHED_KEY, None)
+    session.info.pop(RESYNC_KEY, None)
+    session.info.pop(CHANGED_SLOTS_KEY, None)
@@ -1,5 +1,7 @@
 from . import db
+from . import geo
 from datetime import datetime
+from sqlalchemy import DDL, event, literal_column
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class ParkingLotDetails(db.Model):
@@ -32,8 +34,54 @@ class ParkingLotDetails(db.Model):
     allows_prepaid_passes = db.Column(db.Text)
     provides_valet_services = db.Column(db.Text)
     value_added_services = db.Column(db.Text)
+    version = db.Column(db.BigInteger, nullable=False, default=1, server_default='1') # Bumped on any change to the lot or its floors/rows/slots
+    min_sync_version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0') # Version of the last change slot deltas cannot describe
+    geohash = db.Column(db.String(12)) # Derived from latitude/longitude on every flush, see app/geo.py
 
-    floors = db.relationship('Floor', backref='parking_lot', lazy=True)
+    floors = db.relationship('Floor', backref='parking_lot', lazy=True, order_by='Floor.id')
+
+    __table_args__ = (
+        # text_pattern_ops lets PostgreSQL answer geohash LIKE 'prefix%' from the index
+        db.Index('ix_parkinglots_details_geohash', 'geohash', postgresql_ops={'geohash': 'text_pattern_ops'}),
+    )
+
+@event.listens_for(ParkingLotDetails, 'before_insert')
+@event.listens_for(ParkingLotDetails, 'before_update')
+def _set_geohash(mapper, connection, lot):
+    if lot.latitude is None or lot.longitude is None:
+        lot.geohash = None
+    else:
+        lot.geohash = geo.encode(float(lot.latitude), float(lot.longitude))
+
+# Lot list filters. The predicates are rendered with literal values so that a query
+# filtering on one of them can be answered from the partial index carrying the same
+# predicate; the free-text flag columns hold 'Yes'/'yes'/'No', hence lower().
+LOT_HAS_CCTV = db.func.lower(ParkingLotDetails.has_cctv) == literal_column("'yes'")
+LOT_HAS_VALET = db.func.lower(ParkingLotDetails.provides_valet_services) == literal_column("'yes'")
+LOT_TAKES_CARS = ParkingLotDetails.car_capacity > literal_column('0')
+LOT_TAKES_TWO_WHEELERS = ParkingLotDetails.two_wheeler_capacity > literal_column('0')
+LOT_HAS_FREE_CAR_SLOTS = ParkingLotDetails.available_car_slots > literal_column('0')
+LOT_HAS_FREE_TWO_WHEELER_SLOTS = ParkingLotDetails.available_two_wheeler_slots > literal_column('0')
+
+db.Index('ix_parkinglots_details_city', db.func.lower(ParkingLotDetails.city))
+db.Index('ix_parkinglots_details_parking_type', db.func.lower(ParkingLotDetails.parking_type))
+for _name, _predicate in (
+    ('has_cctv', LOT_HAS_CCTV),
+    ('has_valet', LOT_HAS_VALET),
+    ('takes_cars', LOT_TAKES_CARS),
+    ('takes_two_wheelers', LOT_TAKES_TWO_WHEELERS),
+    ('free_car_slots', LOT_HAS_FREE_CAR_SLOTS),
+    ('free_two_wheeler_slots', LOT_HAS_FREE_TWO_WHEELER_SLOTS),
+):
+    db.Index(f'ix_parkinglots_details_{_name}', ParkingLotDetails.id,
+             postgresql_where=_predicate, sqlite_where=_predicate)
+
+# Substring search on name, landmark and address (q=) uses pg_trgm GIN indexes on PostgreSQL
+for _column in ('parking_name', 'landmark', 'address'):
+    db.Index(f'ix_parkinglots_details_{_column}_trgm', ParkingLotDetails.__table__.c[_column],
+             postgresql_using='gin', postgresql_ops={_column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+event.listen(ParkingLotDetails.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -59,7 +107,11 @@ class Floor(db.Model):
     name = db.Column('floor_name', db.String(50), nullable=False)
     parkinglot_id = db.Column(db.Integer, db.ForeignKey('parkinglots_details.parkinglot_id'), nullable=False)
 
-    rows = db.relationship('Row', backref='floor', lazy=True)
+    rows = db.relationship('Row', backref='floor', lazy=True, order_by='Row.id')
+
+    __table_args__ = (
+        db.Index('ix_floors_parkinglot_id', 'parkinglot_id'),
+    )
 
 class Row(db.Model):
     __tablename__ = 'rows'
@@ -68,18 +120,37 @@ class Row(db.Model):
     floor_id = db.Column(db.Integer, db.ForeignKey('floors.floor_id'), nullable=False)
     parkinglot_id = db.Column(db.Integer, nullable=False) # Denormalized for easier lookup
 
-    slots = db.relationship('Slot', backref='row', lazy=True)
+    slots = db.relationship('Slot', backref='row', lazy=True, order_by='Slot.id')
+
+    __table_args__ = (
+        db.Index('ix_rows_floor_id', 'floor_id'),
+        db.Index('ix_rows_parkinglot_id', 'parkinglot_id'),
+    )
 
 class Slot(db.Model):
     __tablename__ = 'slots'
     id = db.Column('slot_id', db.Integer, primary_key=True)
     name = db.Column('slot_name', db.String(50), nullable=False)
     status = db.Column(db.Integer, default=0) # 0 for free, 1 for occupied
+    vehicle_type = db.Column(db.String(20), nullable=False, default='Car', server_default='Car') # Car or Two-Wheeler
     vehicle_reg_no = db.Column(db.String(20))
     ticket_id = db.Column(db.String(50))
     row_id = db.Column(db.Integer, db.ForeignKey('rows.row_id'), nullable=False)
     floor_id = db.Column(db.Integer, nullable=False) # Denormalized
     parkinglot_id = db.Column(db.Integer, nullable=False) # Denormalized
+    change_version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0') # Lot version of the last change to this slot
+
+    __table_args__ = (
+        db.Index('ix_slots_parkinglot_id_status', 'parkinglot_id', 'status'),
+        db.Index('ix_slots_row_id', 'row_id'),
+        db.Index('ix_slots_parkinglot_id_change_version', 'parkinglot_id', 'change_version'),
+    )
+
+# Free slots in allocation order (lowest floor, then lowest ID). The predicate is
+# shared with the allocation query and rendered as a literal so it matches the index.
+SLOT_IS_FREE = Slot.status == literal_column('0')
+db.Index('ix_slots_free', Slot.parkinglot_id, Slot.vehicle_type, Slot.floor_id, Slot.id,
+         postgresql_where=SLOT_IS_FREE, sqlite_where=SLOT_IS_FREE)
 
 class ParkingSession(db.Model):
     __tablename__ = 'parking_sessions'
@@ -95,12 +166,24 @@ class ParkingSession(db.Model):
     duration_hrs = db.Column(db.Numeric, server_default=None)
     vehicle_type = db.Column(db.String(20))  # Car, Two-Wheeler, etc.
 
+    __table_args__ = (
+        # At most one open session per vehicle; also serves the active-session lookups
+        db.Index('uq_parking_sessions_active_vehicle', 'vehicle_reg_no', unique=True,
+                 postgresql_where=db.text('end_time IS NULL'), sqlite_where=db.text('end_time IS NULL')),
+        db.Index('ix_parking_sessions_slot_id', 'slot_id'),
+    )
+
 class AdminParkingLot(db.Model):
     __tablename__ = 'admin_parking_lots'
     id = db.Column(db.Integer, primary_key=True)
     admin_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     parking_lot_id = db.Column(db.Integer, db.ForeignKey('parkinglots_details.parkinglot_id'), nullable=False) 
 
+    __table_args__ = (
+        db.Index('ix_admin_parking_lots_admin_id_parking_lot_id', 'admin_id', 'parking_lot_id'),
+        db.Index('ix_admin_parking_lots_parking_lot_id', 'parking_lot_id'),
+    )
+
 class AdminPaymentLedger(db.Model):
     __tablename__ = 'admin_payment_ledger'
     id = db.Column(db.Integer, primary_key=True)
@@ -117,6 +200,60 @@ class AdminPaymentLedger(db.Model):
         db.UniqueConstraint('admin_id', 'date', name='uix_admin_date'),
     ) 
 
+# Last snapshot sequence applied per edge device and parking lot
+class DeviceSequence(db.Model):
+    __tablename__ = 'device_sequences'
+    device_id = db.Column(db.String(64), primary_key=True)
+    parkinglot_id = db.Column(db.Integer, primary_key=True)
+    last_seq = db.Column(db.BigInteger, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Edge device (e.g. Raspberry Pi) with its own API key, scoped to one or more lots
+class Device(db.Model):
+    __tablename__ = 'devices'
+    id = db.Column('device_id', db.Integer, primary_key=True)
+    name = db.Column('device_name', db.String(64), unique=True, nullable=False)
+    api_key_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hex digest
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    lots = db.relationship('DeviceLot', backref='device', lazy=True, cascade='all, delete-orphan')
+
+class DeviceLot(db.Model):
+    __tablename__ = 'device_lots'
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.device_id'), primary_key=True)
+    parkinglot_id = db.Column(db.Integer, db.ForeignKey('parkinglots_details.parkinglot_id'), primary_key=True)
+
+# Single-row counter advanced in the same transaction as every change to device keys
+# or scopes; each worker compares it with the generation of its cached key table
+class DeviceKeyGeneration(db.Model):
+    __tablename__ = 'device_key_generation'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    generation = db.Column(db.BigInteger, nullable=False, default=0)
+
+@event.listens_for(DeviceKeyGeneration.__table__, 'after_create')
+def _seed_device_key_generation(target, connection, **kw):
+    # The counter row always exists (migration f4b8d2c61e93 inserts it as well)
+    connection.execute(target.insert().values(id=1, generation=0))
+
+# Append-only log of slot status transitions. On PostgreSQL the table is
+# range-partitioned by month on changed_at (see migration 3c1e8f0d2a47), so
+# retention drops whole partitions instead of deleting rows.
+class SlotStatusEvent(db.Model):
+    __tablename__ = 'slot_status_events'
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    slot_id = db.Column(db.Integer, nullable=False)
+    parkinglot_id = db.Column(db.Integer, nullable=False)
+    old_status = db.Column(db.Integer)
+    new_status = db.Column(db.Integer)  # NULL when the slot was deleted
+    source = db.Column(db.String(20), nullable=False)  # device, checkin, checkout, manual, delete
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_slot_status_events_lot_changed_at', 'parkinglot_id', 'changed_at'),
+        db.Index('ix_slot_status_events_slot_changed_at', 'slot_id', 'changed_at'),
+    )
+
 # Add relationship to User model if not present
 if not hasattr(User, 'payment_ledgers'):
-    User.payment_ledgers = db.relationship('AdminPaymentLedger', back_populates='admin', lazy='dynamic') 
\ No newline at end of file
+    User.payment_ledgers = db.relationship('AdminPaymentLedger', back_populates='admin', lazy='dynamic') 
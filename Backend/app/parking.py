@@ -1,15 +1,33 @@
-from flask import Blueprint, request, jsonify
-from .models import ParkingLotDetails, Floor, Row, Slot
+import json
+from flask import Blueprint, request, jsonify, current_app, stream_with_context, url_for
+import functools
+from sqlalchemy import func, inspect, not_, or_, select
+from sqlalchemy.orm import selectinload
+from .models import (
+    ParkingLotDetails, Floor, Row, Slot,
+    LOT_HAS_CCTV, LOT_HAS_VALET, LOT_TAKES_CARS, LOT_TAKES_TWO_WHEELERS,
+    LOT_HAS_FREE_CAR_SLOTS, LOT_HAS_FREE_TWO_WHEELER_SLOTS,
+)
 from . import db, ma
 from flask_jwt_extended import jwt_required
-from marshmallow import post_load
+from marshmallow import post_load, validate, ValidationError
 from .admin import role_required
+from . import bitmap
+from . import geo
+from .pubsub import availability_broker, stage_slot_counts
+from .availability import lot_stats, availability_snapshot, adjust_slot_availability
+from .cache import lot_cache
+from .fast_dump import CompiledDump, LotDocuments
+from .layout import layout_schema, create_layout
+from .slot_status import VALID_STATUSES
+from . import hierarchy
 
 # Marshmallow Schemas
 class SlotSchema(ma.Schema):
     id = ma.Int(dump_only=True)
     name = ma.Str(required=True)
-    status = ma.Int()
+    status = ma.Int(validate=validate.OneOf(VALID_STATUSES))
+    vehicle_type = ma.Str()
     vehicle_reg_no = ma.Str()
     ticket_id = ma.Str()
     row_id = ma.Int(load_only=True, required=True)
@@ -17,8 +35,9 @@ class SlotSchema(ma.Schema):
     parkinglot_id = ma.Int(load_only=True, required=True)
 
     @post_load
-    def make_slot(self, data, **kwargs):
-        return Slot(**data)
+    def make_slot(self, data, partial=False, **kwargs):
+        # Partial loads are the column changes of a set-based UPDATE, see app/hierarchy.py
+        return data if partial else Slot(**data)
 
 class RowSchema(ma.Schema):
     id = ma.Int(dump_only=True)
@@ -28,8 +47,9 @@ class RowSchema(ma.Schema):
     slots = ma.Nested(SlotSchema, many=True, dump_only=True)
 
     @post_load
-    def make_row(self, data, **kwargs):
-        return Row(**data)
+    def make_row(self, data, partial=False, **kwargs):
+        # Partial loads are the column changes of a set-based UPDATE, see app/hierarchy.py
+        return data if partial else Row(**data)
 
 class FloorSchema(ma.Schema):
     id = ma.Int(dump_only=True)
@@ -38,8 +58,9 @@ class FloorSchema(ma.Schema):
     rows = ma.Nested(RowSchema, many=True, dump_only=True)
 
     @post_load
-    def make_floor(self, data, **kwargs):
-        return Floor(**data)
+    def make_floor(self, data, partial=False, **kwargs):
+        # Partial loads are the column changes of a set-based UPDATE, see app/hierarchy.py
+        return data if partial else Floor(**data)
 
 class ParkingLotDetailsSchema(ma.Schema):
     id = ma.Int(dump_only=True)
@@ -77,6 +98,7 @@ class ParkingLotDetailsSchema(ma.Schema):
     total_slots = ma.Int()
     created_at = ma.DateTime(dump_only=True)
     updated_at = ma.DateTime(dump_only=True)
+    version = ma.Int(dump_only=True)
     floors = ma.Nested(FloorSchema, many=True, dump_only=True)
 
     @post_load
@@ -87,6 +109,31 @@ class ParkingLotDetailsSchema(ma.Schema):
 parking_lot_summary_schema = ParkingLotDetailsSchema(exclude=("floors",))
 parking_lots_summary_schema = ParkingLotDetailsSchema(many=True, exclude=("floors",))
 
+# Sparse fieldsets for the list view: summary fields backed by a column
+LOT_LIST_FIELDS = frozenset(parking_lot_summary_schema.fields) & frozenset(inspect(ParkingLotDetails).column_attrs.keys())
+LOT_LIST_DEFAULT_LIMIT = 100
+LOT_LIST_MAX_LIMIT = 500
+STATS_MAX_LOTS = 100
+MULTI_GET_MAX_IDS = 100
+NEARBY_DEFAULT_RADIUS_M = 2000
+NEARBY_MAX_RADIUS_M = 50000
+NEARBY_DEFAULT_LIMIT = 20
+NEARBY_MAX_LIMIT = 100
+CHANGES_MAX_SLOTS = 500  # beyond this a client is better off reloading the lot
+SEARCH_MIN_LENGTH = 3  # shorter patterns cannot use the trigram indexes
+VEHICLE_TYPE_FILTERS = {'car': LOT_TAKES_CARS, 'two_wheeler': LOT_TAKES_TWO_WHEELERS}
+AVAILABLE_FILTERS = {
+    'car': LOT_HAS_FREE_CAR_SLOTS,
+    'two_wheeler': LOT_HAS_FREE_TWO_WHEELER_SLOTS,
+    'any': or_(LOT_HAS_FREE_CAR_SLOTS, LOT_HAS_FREE_TWO_WHEELER_SLOTS),
+}
+FLAG_FILTERS = {'has_cctv': LOT_HAS_CCTV, 'provides_valet_services': LOT_HAS_VALET}
+FLAG_VALUES = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+@functools.lru_cache(maxsize=64)
+def lot_list_dumper(fields):
+    return CompiledDump(ParkingLotDetailsSchema(only=fields), ParkingLotDetails)
+
 # Schema for detail view (with all nested details)
 parking_lot_detail_schema = ParkingLotDetailsSchema()
 
@@ -97,8 +144,95 @@ rows_schema = RowSchema(many=True)
 floor_schema = FloorSchema()
 floors_schema = FloorSchema(many=True)
 
+# Updatable fields; the IDs placing an object in the hierarchy cannot be changed
+slot_update_schema = SlotSchema(only=('name', 'status', 'vehicle_type', 'vehicle_reg_no', 'ticket_id'), partial=True)
+row_update_schema = RowSchema(only=('name',), partial=True)
+floor_update_schema = FloorSchema(only=('name',), partial=True)
+
+# Read endpoints dump row tuples with serializers compiled from the schemas above
+lot_summary_dumper = CompiledDump(parking_lot_summary_schema, ParkingLotDetails)
+lot_documents = LotDocuments(parking_lot_detail_schema, floor_schema, row_schema, slot_schema)
+
 parking_bp = Blueprint('parking', __name__, url_prefix='/parking')
 
+def lot_version(lot_id):
+    """Current version of a lot (primary-key lookup), or None if it does not exist."""
+    return db.session.execute(
+        select(ParkingLotDetails.version).where(ParkingLotDetails.id == lot_id)
+    ).scalar_one_or_none()
+
+def lot_etag(lot_id, version, representation):
+    return f"lot-{lot_id}-v{version}-{representation}"
+
+def tag_response(response, etag):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached_json(lot_id, etag, render):
+    """JSON response whose body is rendered once per lot version and then served from lot_cache."""
+    body = lot_cache.get_or_render(lot_id, etag, lambda: jsonify(render()).get_data())
+    return current_app.response_class(body, mimetype='application/json')
+
+def not_modified(etag):
+    """A 304 response if the client's If-None-Match already holds ``etag``, else None."""
+    if request.if_none_match.contains_weak(etag):
+        return tag_response(current_app.response_class(status=304), etag)
+    return None
+
+def parse_lot_filters():
+    """
+    Build WHERE conditions from the lot filter query parameters.
+
+    Every condition matches one of the indexes declared next to ParkingLotDetails:
+    ``city`` and ``parking_type`` compare case-insensitively, the flags and
+    ``vehicle_types``/``available`` use partial indexes, and ``q`` is a substring
+    search over name, landmark and address backed by trigram indexes.
+
+    :raises ValueError: If a parameter has an unsupported value.
+    """
+    conditions = []
+    for name in ('city', 'parking_type'):
+        value = request.args.get(name, '').strip()
+        if value:
+            conditions.append(func.lower(getattr(ParkingLotDetails, name)) == value.lower())
+    for name, predicate in FLAG_FILTERS.items():
+        value = request.args.get(name)
+        if value is None:
+            continue
+        if value.lower() not in FLAG_VALUES:
+            raise ValueError(f"{name} must be true or false")
+        if FLAG_VALUES[value.lower()]:
+            conditions.append(predicate)
+        else:
+            conditions.append(or_(getattr(ParkingLotDetails, name).is_(None), not_(predicate)))
+    vehicle_types = request.args.get('vehicle_types')
+    if vehicle_types:
+        for vehicle_type in (v.strip() for v in vehicle_types.split(',') if v.strip()):
+            if vehicle_type not in VEHICLE_TYPE_FILTERS:
+                raise ValueError("vehicle_types must be a comma-separated list of car and two_wheeler")
+            conditions.append(VEHICLE_TYPE_FILTERS[vehicle_type])
+    available = request.args.get('available')
+    if available is not None:
+        if available not in AVAILABLE_FILTERS:
+            raise ValueError("available must be any, car or two_wheeler")
+        conditions.append(AVAILABLE_FILTERS[available])
+    q = request.args.get('q', '').strip()
+    if q:
+        if len(q) < SEARCH_MIN_LENGTH:
+            raise ValueError(f"q must be at least {SEARCH_MIN_LENGTH} characters")
+        pattern = '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append(or_(
+            ParkingLotDetails.name.ilike(pattern, escape='\\'),
+            ParkingLotDetails.landmark.ilike(pattern, escape='\\'),
+            ParkingLotDetails.address.ilike(pattern, escape='\\'),
+        ))
+    return conditions
+
+# Eager loader for the nested schemas: one SELECT per level instead of one per parent
+ROWS_WITH_SLOTS = selectinload(Floor.rows).selectinload(Row.slots)
+
 @parking_bp.route('/lots', methods=['POST'])
 @role_required("user")
 def create_parking_lot():
@@ -149,18 +283,185 @@ def create_parking_lot():
 @role_required("user")
 def get_parking_lots():
     """
-    Get a list of all parking lots (summary view).
+    Get a page of parking lots (summary view).
     ---
     tags:
       - Parking
     security:
       - BearerAuth: []
+    description: |
+      Lots are returned in ascending ID order, at most `limit` per page. When more
+      lots follow, the response carries an `X-Next-Cursor` header (and a `Link`
+      header with rel="next"); pass its value back as `cursor` to get the next page.
+      Filters combine with AND and are kept in the `Link` header.
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        description: Page size (default 100, max 500)
+      - in: query
+        name: cursor
+        type: integer
+        description: Value of X-Next-Cursor from the previous page
+      - in: query
+        name: fields
+        type: string
+        description: Comma-separated fields to return, e.g. `id,name,city`; only these columns are loaded
+      - in: query
+        name: city
+        type: string
+        description: Exact city, case-insensitive
+      - in: query
+        name: parking_type
+        type: string
+        description: Exact parking type (e.g. `Paid`, `Free`), case-insensitive
+      - in: query
+        name: has_cctv
+        type: boolean
+      - in: query
+        name: provides_valet_services
+        type: boolean
+      - in: query
+        name: vehicle_types
+        type: string
+        description: Comma-separated `car`/`two_wheeler`; lots must have capacity for each
+      - in: query
+        name: available
+        type: string
+        enum: [any, car, two_wheeler]
+        description: Only lots with free car slots, free two-wheeler slots, or either
+      - in: query
+        name: q
+        type: string
+        description: Substring of the name, landmark or address (at least 3 characters)
     responses:
       200:
         description: List of parking lots
+      400:
+        description: Invalid limit, cursor, fields or filter
     """
-    lots = ParkingLotDetails.query.all()
-    return jsonify(parking_lots_summary_schema.dump(lots))
+    try:
+        limit = int(request.args.get('limit', LOT_LIST_DEFAULT_LIMIT))
+        cursor = request.args.get('cursor', type=str)
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    if not 1 <= limit <= LOT_LIST_MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {LOT_LIST_MAX_LIMIT}"}), 400
+
+    dumper = lot_summary_dumper
+    fields = request.args.get('fields')
+    if fields:
+        requested = {f.strip() for f in fields.split(',') if f.strip()}
+        unknown = requested - LOT_LIST_FIELDS
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+        requested.add('id')  # needed for the cursor
+        dumper = lot_list_dumper(tuple(sorted(requested)))
+
+    try:
+        conditions = parse_lot_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Only the selected columns are fetched, as plain tuples
+    query = (
+        select(ParkingLotDetails.id, *dumper.columns)
+        .where(*conditions)
+        .order_by(ParkingLotDetails.id)
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        query = query.where(ParkingLotDetails.id > cursor)
+    rows = db.session.execute(query).all()
+    response = jsonify([dumper.dump(row[1:]) for row in rows[:limit]])
+    if len(rows) > limit:
+        next_cursor = str(rows[limit - 1][0])
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, _external=True, **args)}>; rel="next"'
+    return response
+
+@parking_bp.route('/lots/nearby', methods=['GET'])
+@role_required("user")
+def get_nearby_parking_lots():
+    """
+    Find parking lots near a point, closest first.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    description: |
+      Candidates come from a geohash prefix lookup on an indexed column (the cell
+      around the point and its eight neighbours), so the cost depends on how many
+      lots are in the area rather than in the database. Each result is the lot
+      summary plus `distance_m`.
+    parameters:
+      - in: query
+        name: lat
+        type: number
+        required: true
+      - in: query
+        name: lon
+        type: number
+        required: true
+      - in: query
+        name: radius
+        type: number
+        description: Search radius in meters (default 2000, max 50000)
+      - in: query
+        name: limit
+        type: integer
+        description: Maximum number of lots (default 20, max 100)
+      - in: query
+        name: available
+        type: string
+        enum: [any, car, two_wheeler]
+        description: Only lots with free car slots, free two-wheeler slots, or either
+    responses:
+      200:
+        description: Lots ordered by distance (accepts the same filters as GET /lots)
+      400:
+        description: Invalid parameters
+    """
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius = float(request.args.get('radius', NEARBY_DEFAULT_RADIUS_M))
+        limit = int(request.args.get('limit', NEARBY_DEFAULT_LIMIT))
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon are required; lat, lon, radius and limit must be numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat/lon out of range"}), 400
+    if not 0 < radius <= NEARBY_MAX_RADIUS_M:
+        return jsonify({"error": f"radius must be between 0 and {NEARBY_MAX_RADIUS_M} meters"}), 400
+    if not 1 <= limit <= NEARBY_MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {NEARBY_MAX_LIMIT}"}), 400
+    try:
+        conditions = parse_lot_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cells = geo.covering_cells(lat, lon, radius)
+    query = select(ParkingLotDetails.latitude, ParkingLotDetails.longitude, *lot_summary_dumper.columns).where(
+        or_(*(ParkingLotDetails.geohash.like(cell + '%') for cell in cells)),
+        *conditions
+    )
+
+    nearby = []
+    for row in db.session.execute(query):
+        distance = geo.haversine_m(lat, lon, float(row[0]), float(row[1]))
+        if distance <= radius:
+            nearby.append((distance, row[2:]))
+    nearby.sort(key=lambda item: item[0])
+    results = []
+    for distance, row in nearby[:limit]:
+        lot = lot_summary_dumper.dump(row)
+        lot['distance_m'] = round(distance, 1)
+        results.append(lot)
+    return jsonify(results)
 
 @parking_bp.route('/lots/<int:lot_id>', methods=['GET'])
 @role_required("user")
@@ -177,16 +478,39 @@ def get_parking_lot(lot_id):
         name: lot_id
         type: integer
         required: true
+    produces:
+      - application/json
+      - application/vnd.parking.slot-bitmap
+    description: |
+      Send `Accept: application/vnd.parking.slot-bitmap` to get only the slot
+      statuses as a packed bitset (slots ordered by ascending slot ID).
+
+      The ETag changes whenever the lot or any of its floors, rows or slots change;
+      send it back in If-None-Match to get a 304 without a body.
     responses:
       200:
         description: Parking lot details
+      304:
+        description: Not modified since the ETag in If-None-Match
       404:
         description: Parking lot not found
     """
-    lot = db.session.get(ParkingLotDetails, lot_id)
-    if not lot:
+    version = lot_version(lot_id)
+    if version is None:
         return jsonify({"error": "Parking lot not found"}), 404
-    return jsonify(parking_lot_detail_schema.dump(lot))
+    as_bitmap = request.accept_mimetypes.best_match(['application/json', bitmap.BITMAP_MIMETYPE]) == bitmap.BITMAP_MIMETYPE
+    etag = lot_etag(lot_id, version, 'bitmap' if as_bitmap else 'detail')
+    response = not_modified(etag)
+    if response is None:
+        if as_bitmap:
+            slot_ids, statuses = bitmap.load_layout(lot_id)
+            payload = bitmap.encode(lot_id, bitmap.layout_version(slot_ids), statuses)
+            response = current_app.response_class(payload, mimetype=bitmap.BITMAP_MIMETYPE)
+        else:
+            # Whole hierarchy in four queries regardless of lot size
+            response = cached_json(lot_id, etag, lambda: lot_documents.detail(lot_id))
+    response.vary.add('Accept')
+    return tag_response(response, etag)
 
 @parking_bp.route('/lots/<int:lot_id>/stats', methods=['GET'])
 @role_required("user")
@@ -206,23 +530,320 @@ def get_parking_lot_stats(lot_id):
     responses:
       200:
         description: Parking lot statistics
+      304:
+        description: Not modified since the ETag in If-None-Match
       404:
         description: Parking lot not found
     """
-    if not db.session.get(ParkingLotDetails, lot_id):
+    version = lot_version(lot_id)
+    if version is None:
         return jsonify({"error": "Parking lot not found"}), 404
+    etag = lot_etag(lot_id, version, 'stats')
+    response = not_modified(etag)
+    if response is None:
+        stats = lot_stats([lot_id]).get(lot_id)
+        if stats is None:
+            return jsonify({"error": "Parking lot not found"}), 404
+        response = jsonify(stats)
+    return tag_response(response, etag)
 
-    total_slots = Slot.query.filter_by(parkinglot_id=lot_id).count()
-    available_slots = Slot.query.filter_by(parkinglot_id=lot_id, status=0).count()
-    occupied_slots = total_slots - available_slots
-
-    stats = {
+@parking_bp.route('/lots/<int:lot_id>/availability', methods=['GET'])
+@role_required("user")
+def get_parking_lot_availability(lot_id):
+    """
+    Get the available car and two-wheeler slot counters of a parking lot.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: path
+        name: lot_id
+        type: integer
+        required: true
+    description: |
+      Served from the counters kept on the lot by every slot write, so this is a
+      single primary-key lookup. Use /lots/{lot_id}/stats for per-floor detail.
+    responses:
+      200:
+        description: Availability counters
+      404:
+        description: Parking lot not found
+    """
+    row = db.session.execute(
+        select(
+            ParkingLotDetails.available_car_slots, ParkingLotDetails.car_capacity,
+            ParkingLotDetails.available_two_wheeler_slots, ParkingLotDetails.two_wheeler_capacity
+        ).where(ParkingLotDetails.id == lot_id)
+    ).first()
+    if row is None:
+        return jsonify({"error": "Parking lot not found"}), 404
+    return jsonify({
         'parkinglot_id': lot_id,
-        'total_slots': total_slots,
-        'available_slots': available_slots,
-        'occupied_slots': occupied_slots
-    }
-    return jsonify(stats)
+        'available_car_slots': row.available_car_slots,
+        'car_capacity': row.car_capacity,
+        'available_two_wheeler_slots': row.available_two_wheeler_slots,
+        'two_wheeler_capacity': row.two_wheeler_capacity
+    })
+
+@parking_bp.route('/lots/<int:lot_id>/changes', methods=['GET'])
+@role_required("user")
+def get_parking_lot_changes(lot_id):
+    """
+    Get the slots of a parking lot that changed after a given lot version.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: path
+        name: lot_id
+        type: integer
+        required: true
+      - in: query
+        name: since
+        type: integer
+        required: true
+        description: Lot version the client last synced (the ETag or "version" it holds)
+    description: |
+      Returns the new lot version and every slot whose status or details changed after
+      "since", ordered by the version of their last change. When the client cannot be
+      brought up to date from slot changes alone (floors or rows were added, renamed
+      or removed, slots were removed, "since" is not a version of this lot, or more than
+      500 slots changed) the response carries "resync": true and no slots, and the client
+      should reload /lots/{lot_id}.
+    responses:
+      200:
+        description: Changed slots and the current version, or a resync marker
+      400:
+        description: Missing or invalid since
+      404:
+        description: Parking lot not found
+    """
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({"error": "since must be a non-negative integer"}), 400
+    lot = db.session.execute(
+        select(ParkingLotDetails.version, ParkingLotDetails.min_sync_version).where(ParkingLotDetails.id == lot_id)
+    ).first()
+    if lot is None:
+        return jsonify({"error": "Parking lot not found"}), 404
+    result = {'parkinglot_id': lot_id, 'version': lot.version}
+    if since < lot.min_sync_version or since > lot.version:
+        return jsonify({**result, 'resync': True})
+
+    # Slots are stamped in the transaction that moves the lot to their version, so every
+    # change up to the version read above is visible; later ones are left for the next sync
+    rows = db.session.execute(
+        select(Slot.row_id, Slot.floor_id, Slot.change_version, *lot_documents.slot.columns)
+        .where(Slot.parkinglot_id == lot_id, Slot.change_version > since, Slot.change_version <= lot.version)
+        .order_by(Slot.change_version, Slot.id)
+        .limit(CHANGES_MAX_SLOTS + 1)
+    ).all() if since < lot.version else []
+    if len(rows) > CHANGES_MAX_SLOTS:
+        return jsonify({**result, 'resync': True})
+    slots = []
+    for row in rows:
+        slot = lot_documents.slot.dump(row[3:])
+        slot.update(row_id=row.row_id, floor_id=row.floor_id, change_version=row.change_version)
+        slots.append(slot)
+    return jsonify({**result, 'resync': False, 'slots': slots})
+
+@parking_bp.route('/lots/stats', methods=['GET'])
+@role_required("user")
+def get_parking_lots_stats():
+    """
+    Get statistics for several parking lots at once.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: query
+        name: ids
+        type: string
+        required: true
+        description: Comma-separated parking lot IDs, e.g. `1,2,3` (at most 100)
+    description: |
+      Returns one entry per requested ID, in request order, with the same body as
+      /lots/{lot_id}/stats. IDs that do not exist get
+      `{"parkinglot_id": <id>, "error": "Parking lot not found"}`.
+      All lots are counted with a single grouped query.
+    responses:
+      200:
+        description: List of parking lot statistics
+      400:
+        description: Missing or invalid ids
+    """
+    try:
+        lot_ids = parse_ids(STATS_MAX_LOTS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stats = lot_stats(lot_ids)
+    return jsonify([
+        stats.get(lot_id) or {"parkinglot_id": lot_id, "error": "Parking lot not found"}
+        for lot_id in lot_ids
+    ])
+
+@parking_bp.route('/lots/<int:lot_id>/availability/stream', methods=['GET'])
+@role_required("user")
+def stream_lot_availability(lot_id):
+    """
+    Stream availability changes for a parking lot as Server-Sent Events.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: path
+        name: lot_id
+        type: integer
+        required: true
+    produces:
+      - text/event-stream
+    description: |
+      Starts with a `snapshot` event carrying the same counts as /lots/{lot_id}/stats
+      and the lot `version` they were read at, followed by an `availability` event
+      whenever slots of the lot change status, or are created or deleted, in a later version:
+
+        {"parkinglot_id": 1, "version": 42, "total_delta": 0, "occupied_delta": 1,
+         "available_delta": -1, "available_slots": 9, "occupied_slots": 1,
+         "total_slots": 10, "slots": [{"id": 3, "status": 1}]}
+
+      Changes are pushed from every worker's ingest, check-in/check-out and slot
+      create/delete paths after they commit (PostgreSQL LISTEN/NOTIFY);
+      the connection holds no database session while idle. A `resync` event means the
+      client fell behind and should reconnect to get a fresh snapshot.
+    responses:
+      200:
+        description: Event stream
+      404:
+        description: Parking lot not found
+      503:
+        description: Streams are not served by this worker
+    """
+    return availability_stream([lot_id])
+
+@parking_bp.route('/lots/availability/stream', methods=['GET'])
+@role_required("user")
+def stream_lots_availability():
+    """
+    Stream availability changes for several parking lots as Server-Sent Events.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: query
+        name: ids
+        type: string
+        required: true
+        description: Comma-separated parking lot IDs, e.g. `1,2,3`
+    produces:
+      - text/event-stream
+    description: |
+      Same events as /lots/{lot_id}/availability/stream, with one `snapshot` per lot.
+    responses:
+      200:
+        description: Event stream
+      400:
+        description: Missing or invalid ids
+      404:
+        description: Parking lot not found
+      503:
+        description: Streams are not served by this worker
+    """
+    try:
+        lot_ids = parse_ids(current_app.config.get('AVAILABILITY_STREAM_MAX_LOTS', 50))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return availability_stream(lot_ids)
+
+def parse_ids(max_ids):
+    """
+    Parse the ``ids`` query parameter (``1,2,3``) into a list without duplicates, in request order.
+
+    :raises ValueError: If ids is missing, malformed or longer than ``max_ids``.
+    """
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers")
+    if not ids:
+        raise ValueError("Missing ids")
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} ids are allowed")
+    return ids
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def availability_stream(lot_ids):
+    if not current_app.config['SERVE_STREAMS']:
+        return jsonify({"error": "Streams are served by the streaming service"}), 503
+    # Subscribe before taking the snapshot so no change is missed in between; changes
+    # committed before the snapshot are recognized by their lot version and skipped
+    availability_broker.listen(db.engine)
+    subscription = availability_broker.subscribe(lot_ids)
+    try:
+        snapshot = availability_snapshot(lot_ids)
+    except Exception:
+        availability_broker.unsubscribe(subscription)
+        raise
+    if len(snapshot) != len(lot_ids):
+        availability_broker.unsubscribe(subscription)
+        return jsonify({"error": "Parking lot not found"}), 404
+    since = {lot_id: version for lot_id, (version, _, _) in snapshot.items()}
+    counts = {lot_id: (total, available) for lot_id, (_, total, available) in snapshot.items()}
+    # Idle subscribers must not pin a pooled connection
+    db.session.close()
+    heartbeat = current_app.config.get('AVAILABILITY_STREAM_HEARTBEAT', 15)
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            for lot_id in lot_ids:
+                total, available = counts[lot_id]
+                yield server_sent_event('snapshot', {
+                    'parkinglot_id': lot_id,
+                    'version': since[lot_id],
+                    'total_slots': total,
+                    'available_slots': available,
+                    'occupied_slots': total - available
+                })
+            while True:
+                change = subscription.get(timeout=heartbeat)
+                if subscription.overflowed:
+                    yield server_sent_event('resync', {'reason': 'Subscriber fell behind'})
+                    return
+                if change is None:
+                    yield ": keepalive\n\n"
+                    continue
+                lot_id = change['parkinglot_id']
+                if change['version'] is not None and change['version'] <= since[lot_id]:
+                    continue
+                total, available = counts[lot_id]
+                total += change['total_delta']
+                available += change['available_delta']
+                counts[lot_id] = (total, available)
+                yield server_sent_event('availability', {
+                    **change,
+                    'total_slots': total,
+                    'available_slots': available,
+                    'occupied_slots': total - available
+                })
+        finally:
+            availability_broker.unsubscribe(subscription)
+
+    response = current_app.response_class(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @parking_bp.route('/lots/<int:lot_id>', methods=['PUT'])
 @role_required("user")
@@ -265,6 +886,7 @@ def update_parking_lot(lot_id):
     try:
         updated_lot = parking_lot_summary_schema.load(data, instance=lot, partial=True)
         db.session.commit()
+        lot_cache.invalidate(lot_id)
         return jsonify(parking_lot_summary_schema.dump(updated_lot))
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -273,7 +895,7 @@ def update_parking_lot(lot_id):
 @role_required("user")
 def delete_parking_lot(lot_id):
     """
-    Delete a parking lot.
+    Delete a parking lot with its floors, rows and slots.
     ---
     tags:
       - Parking
@@ -290,11 +912,9 @@ def delete_parking_lot(lot_id):
       404:
         description: Parking lot not found
     """
-    lot = db.session.get(ParkingLotDetails, lot_id)
-    if not lot:
+    if not hierarchy.delete_lot(lot_id):
+        db.session.rollback()
         return jsonify({"error": "Parking lot not found"}), 404
-    
-    db.session.delete(lot)
     db.session.commit()
     return jsonify({"message": "Parking lot deleted successfully"})
 
@@ -338,11 +958,70 @@ def create_floor(lot_id):
         new_floor = floor_schema.load(data)
         db.session.add(new_floor)
         db.session.commit()
+        lot_cache.invalidate(lot_id)
         return jsonify(floor_schema.dump(new_floor)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
 
+@parking_bp.route('/lots/<int:lot_id>/layout', methods=['POST'])
+@role_required("user")
+def create_lot_layout(lot_id):
+    """
+    Create floors, rows and slots of a parking lot in one request.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    description: |
+      The whole layout is validated first and then inserted in a single transaction
+      with one multi-row INSERT per level. Names must be unique within their parent;
+      at most 10000 slots per request. Slot `status` defaults to 0 (free) and
+      `vehicle_type` to `Car`.
+    parameters:
+      - in: path
+        name: lot_id
+        type: integer
+        required: true
+      - in: body
+        name: body
+        schema:
+          type: object
+          example:
+            floors:
+              - name: Ground
+                rows:
+                  - name: A
+                    slots:
+                      - name: A1
+                      - name: A2
+                        vehicle_type: Two-Wheeler
+    responses:
+      201:
+        description: |
+          Generated IDs keyed by the supplied names, e.g.
+          `{"parkinglot_id": 1, "floors": {"Ground": {"id": 3, "rows": {"A": {"id": 7, "slots": {"A1": 20, "A2": 21}}}}}}`
+      400:
+        description: Invalid layout
+      404:
+        description: Parking lot not found
+    """
+    if not db.session.get(ParkingLotDetails, lot_id):
+        return jsonify({"error": "Parking lot not found"}), 404
+    try:
+        layout = layout_schema.load(request.get_json(silent=True) or {})
+    except ValidationError as e:
+        return jsonify({"error": e.messages}), 400
+    try:
+        floors = create_layout(lot_id, layout)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    lot_cache.invalidate(lot_id)
+    return jsonify({"parkinglot_id": lot_id, "floors": floors}), 201
+
 @parking_bp.route('/lots/<int:lot_id>/floors', methods=['GET'])
 @role_required("user")
 def get_floors_for_lot(lot_id):
@@ -361,13 +1040,55 @@ def get_floors_for_lot(lot_id):
     responses:
       200:
         description: List of floors
+      304:
+        description: Not modified since the ETag in If-None-Match
       404:
         description: Parking lot not found
     """
-    lot = db.session.get(ParkingLotDetails, lot_id)
-    if not lot:
+    version = lot_version(lot_id)
+    if version is None:
         return jsonify({"error": "Parking lot not found"}), 404
-    return jsonify(floors_schema.dump(lot.floors))
+    etag = lot_etag(lot_id, version, 'floors')
+    response = not_modified(etag)
+    if response is None:
+        response = cached_json(lot_id, etag, lambda: lot_documents.floors(lot_id))
+    return tag_response(response, etag)
+
+@parking_bp.route('/floors', methods=['GET'])
+@role_required("user")
+def get_floors_by_ids():
+    """
+    Get several floors by ID in one request.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: query
+        name: ids
+        type: string
+        required: true
+        description: Comma-separated floor IDs, e.g. `1,2,3` (at most 100)
+    description: |
+      Returns one entry per requested ID, in request order, with the same body as
+      /floors/{floor_id} (rows and slots included); all floors are loaded with one query per level. IDs that do not exist get
+      `{"id": <id>, "error": "Floor not found"}`.
+    responses:
+      200:
+        description: List of floors
+      400:
+        description: Missing or invalid ids
+    """
+    try:
+        floor_ids = parse_ids(MULTI_GET_MAX_IDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    floors = lot_documents.floors_by_id(floor_ids)
+    return jsonify([
+        floors.get(floor_id) or {"id": floor_id, "error": "Floor not found"}
+        for floor_id in floor_ids
+    ])
 
 @parking_bp.route('/floors/<int:floor_id>', methods=['GET'])
 @role_required("user")
@@ -390,7 +1111,7 @@ def get_floor(floor_id):
       404:
         description: Floor not found
     """
-    floor = db.session.get(Floor, floor_id)
+    floor = db.session.get(Floor, floor_id, options=[ROWS_WITH_SLOTS])
     if not floor:
         return jsonify({"error": "Floor not found"}), 404
     return jsonify(floor_schema.dump(floor))
@@ -425,24 +1146,24 @@ def update_floor(floor_id):
       404:
         description: Floor not found
     """
-    floor = db.session.get(Floor, floor_id)
-    if not floor:
-        return jsonify({"error": "Floor not found"}), 404
-    
-    data = request.get_json()
     try:
-        updated_floor = floor_schema.load(data, instance=floor, partial=True)
-        db.session.commit()
-        return jsonify(floor_schema.dump(updated_floor))
-    except Exception as e:
+        changes = floor_update_schema.load(request.get_json())
+    except ValidationError as e:
+        return jsonify({"error": e.messages}), 400
+    row = hierarchy.rename(Floor, floor_id, changes, lot_documents.floor.columns)
+    if row is None:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 400
+        return jsonify({"error": "Floor not found"}), 404
+    db.session.commit()
+    floor = lot_documents.floor.dump(row)
+    floor['rows'] = lot_documents.rows(floor_id)
+    return jsonify(floor)
 
 @parking_bp.route('/floors/<int:floor_id>', methods=['DELETE'])
 @role_required("user")
 def delete_floor(floor_id):
     """
-    Delete a floor.
+    Delete a floor with its rows and slots.
     ---
     tags:
       - Parking
@@ -459,11 +1180,9 @@ def delete_floor(floor_id):
       404:
         description: Floor not found
     """
-    floor = db.session.get(Floor, floor_id)
-    if not floor:
+    if hierarchy.delete_floor(floor_id) is None:
+        db.session.rollback()
         return jsonify({"error": "Floor not found"}), 404
-    
-    db.session.delete(floor)
     db.session.commit()
     return jsonify({"message": "Floor deleted successfully"})
 
@@ -509,6 +1228,7 @@ def create__row(floor_id):
         new_row = row_schema.load(data)
         db.session.add(new_row)
         db.session.commit()
+        lot_cache.invalidate(floor.parkinglot_id)
         return jsonify(row_schema.dump(new_row)), 201
     except Exception as e:
         db.session.rollback()
@@ -532,13 +1252,60 @@ def get_rows_for_floor(floor_id):
     responses:
       200:
         description: List of rows
+      304:
+        description: Not modified since the ETag in If-None-Match
       404:
         description: Floor not found
     """
-    floor = db.session.get(Floor, floor_id)
-    if not floor:
+    found = db.session.execute(
+        select(Floor.parkinglot_id, ParkingLotDetails.version)
+        .outerjoin(ParkingLotDetails, ParkingLotDetails.id == Floor.parkinglot_id)
+        .where(Floor.id == floor_id)
+    ).first()
+    if not found:
         return jsonify({"error": "Floor not found"}), 404
-    return jsonify(rows_schema.dump(floor.rows))
+    lot_id, version = found
+    etag = lot_etag(lot_id, version, f'floor-{floor_id}-rows')
+    response = not_modified(etag)
+    if response is None:
+        response = cached_json(lot_id, etag, lambda: lot_documents.rows(floor_id))
+    return tag_response(response, etag)
+
+@parking_bp.route('/rows', methods=['GET'])
+@role_required("user")
+def get_rows_by_ids():
+    """
+    Get several rows by ID in one request.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: query
+        name: ids
+        type: string
+        required: true
+        description: Comma-separated row IDs, e.g. `1,2,3` (at most 100)
+    description: |
+      Returns one entry per requested ID, in request order, with the same body as
+      /rows/{row_id} (slots included); all rows are loaded with one query per level. IDs that do not exist get
+      `{"id": <id>, "error": "Row not found"}`.
+    responses:
+      200:
+        description: List of rows
+      400:
+        description: Missing or invalid ids
+    """
+    try:
+        row_ids = parse_ids(MULTI_GET_MAX_IDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = lot_documents.rows_by_id(row_ids)
+    return jsonify([
+        rows.get(row_id) or {"id": row_id, "error": "Row not found"}
+        for row_id in row_ids
+    ])
 
 @parking_bp.route('/rows/<int:row_id>', methods=['GET'])
 @role_required("user")
@@ -596,24 +1363,24 @@ def update_row(row_id):
       404:
         description: Row not found
     """
-    row = db.session.get(Row, row_id)
-    if not row:
-        return jsonify({"error": "Row not found"}), 404
-    
-    data = request.get_json()
     try:
-        updated_row = row_schema.load(data, instance=row, partial=True)
-        db.session.commit()
-        return jsonify(row_schema.dump(updated_row))
-    except Exception as e:
+        changes = row_update_schema.load(request.get_json())
+    except ValidationError as e:
+        return jsonify({"error": e.messages}), 400
+    updated = hierarchy.rename(Row, row_id, changes, lot_documents.row.columns)
+    if updated is None:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 400
+        return jsonify({"error": "Row not found"}), 404
+    db.session.commit()
+    row = lot_documents.row.dump(updated)
+    row['slots'] = lot_documents.slots(row_id)
+    return jsonify(row)
 
 @parking_bp.route('/rows/<int:row_id>', methods=['DELETE'])
 @role_required("user")
 def delete_row(row_id):
     """
-    Delete a row.
+    Delete a row with its slots.
     ---
     tags:
       - Parking
@@ -630,11 +1397,9 @@ def delete_row(row_id):
       404:
         description: Row not found
     """
-    row = db.session.get(Row, row_id)
-    if not row:
+    if hierarchy.delete_row(row_id) is None:
+        db.session.rollback()
         return jsonify({"error": "Row not found"}), 404
-    
-    db.session.delete(row)
     db.session.commit()
     return jsonify({"message": "Row deleted successfully"})
 
@@ -680,7 +1445,11 @@ def create_slot(row_id):
     try:
         new_slot = slot_schema.load(data)
         db.session.add(new_slot)
+        db.session.flush()
+        adjust_slot_availability(new_slot.parkinglot_id, new_slot.vehicle_type, False, new_slot.status == 0)
+        stage_slot_counts(db.session, new_slot.parkinglot_id, 1, int(new_slot.status == 0))
         db.session.commit()
+        lot_cache.invalidate(row.parkinglot_id)
         return jsonify(slot_schema.dump(new_slot)), 201
     except Exception as e:
         db.session.rollback()
@@ -704,13 +1473,60 @@ def get_slots_for_row(row_id):
     responses:
       200:
         description: List of slots
+      304:
+        description: Not modified since the ETag in If-None-Match
       404:
         description: Row not found
     """
-    row = db.session.get(Row, row_id)
-    if not row:
+    found = db.session.execute(
+        select(Row.parkinglot_id, ParkingLotDetails.version)
+        .outerjoin(ParkingLotDetails, ParkingLotDetails.id == Row.parkinglot_id)
+        .where(Row.id == row_id)
+    ).first()
+    if not found:
         return jsonify({"error": "Row not found"}), 404
-    return jsonify(slots_schema.dump(row.slots))
+    lot_id, version = found
+    etag = lot_etag(lot_id, version, f'row-{row_id}-slots')
+    response = not_modified(etag)
+    if response is None:
+        response = cached_json(lot_id, etag, lambda: lot_documents.slots(row_id))
+    return tag_response(response, etag)
+
+@parking_bp.route('/slots', methods=['GET'])
+@role_required("user")
+def get_slots_by_ids():
+    """
+    Get several slots by ID in one request.
+    ---
+    tags:
+      - Parking
+    security:
+      - BearerAuth: []
+    parameters:
+      - in: query
+        name: ids
+        type: string
+        required: true
+        description: Comma-separated slot IDs, e.g. `1,2,3` (at most 100)
+    description: |
+      Returns one entry per requested ID, in request order, with the same body as
+      /slots/{slot_id}; all slots are loaded with a single IN query. IDs that do not exist get
+      `{"id": <id>, "error": "Slot not found"}`.
+    responses:
+      200:
+        description: List of slots
+      400:
+        description: Missing or invalid ids
+    """
+    try:
+        slot_ids = parse_ids(MULTI_GET_MAX_IDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    slots = lot_documents.slots_by_id(slot_ids)
+    return jsonify([
+        slots.get(slot_id) or {"id": slot_id, "error": "Slot not found"}
+        for slot_id in slot_ids
+    ])
 
 @parking_bp.route('/slots/<int:slot_id>', methods=['GET'])
 @role_required("user")
@@ -762,6 +1578,7 @@ def update_slot(slot_id):
               type: string
             status:
               type: integer
+              enum: [0, 1]
     responses:
       200:
         description: Slot updated
@@ -770,18 +1587,16 @@ def update_slot(slot_id):
       404:
         description: Slot not found
     """
-    slot = db.session.get(Slot, slot_id)
-    if not slot:
-        return jsonify({"error": "Slot not found"}), 404
-    
-    data = request.get_json()
     try:
-        updated_slot = slot_schema.load(data, instance=slot, partial=True)
-        db.session.commit()
-        return jsonify(slot_schema.dump(updated_slot))
-    except Exception as e:
+        changes = slot_update_schema.load(request.get_json())
+    except ValidationError as e:
+        return jsonify({"error": e.messages}), 400
+    row = hierarchy.update_slot(slot_id, changes, lot_documents.slot.columns)
+    if row is None:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 400
+        return jsonify({"error": "Slot not found"}), 404
+    db.session.commit()
+    return jsonify(lot_documents.slot.dump(row))
 
 @parking_bp.route('/slots/<int:slot_id>', methods=['DELETE'])
 @role_required("user")
@@ -804,10 +1619,8 @@ def delete_slot(slot_id):
       404:
         description: Slot not found
     """
-    slot = db.session.get(Slot, slot_id)
-    if not slot:
+    if hierarchy.delete_slot(slot_id) is None:
+        db.session.rollback()
         return jsonify({"error": "Slot not found"}), 404
-    
-    db.session.delete(slot)
     db.session.commit()
     return jsonify({"message": "Slot deleted successfully"})
\ No newline at end of file
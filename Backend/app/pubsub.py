@@ -0,0 +1,218 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'pending_slot_transitions'
+COUNTS_KEY = 'pending_slot_counts'
+VERSIONS_KEY = 'pending_lot_versions'
+# PostgreSQL NOTIFY channel carrying committed events to every process
+CHANNEL = 'slot_availability'
+# Slots listed per event, which keeps a NOTIFY payload well under PostgreSQL's 8000 bytes
+EVENT_MAX_SLOTS = 100
+
+class Subscription:
+    def __init__(self, lot_ids, maxsize):
+        self.lot_ids = frozenset(lot_ids)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Next published event, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class AvailabilityBroker:
+    """
+    Fan-out of slot availability changes to SSE subscribers.
+
+    Write paths stage their transitions and slot count changes on the SQLAlchemy
+    session (see stage_transitions and stage_slot_counts); they are published only
+    after the transaction commits and dropped on rollback. Every event carries the lot
+    version its transaction committed, so a stream can skip changes its snapshot
+    already includes. Each subscriber gets a bounded queue, and a subscriber that
+    falls behind is flagged as overflowed so its stream can ask the client to resync.
+
+    On PostgreSQL the events are sent with NOTIFY inside the committing transaction
+    and every process that serves streams LISTENs (see listen), so subscribers see the
+    writes of all workers. Elsewhere (SQLite in development and tests) events are
+    published in-process after the commit.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, lot_ids):
+        subscription = Subscription(lot_ids, self.maxsize)
+        with self._lock:
+            for lot_id in subscription.lot_ids:
+                self._subscribers.setdefault(lot_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for lot_id in subscription.lot_ids:
+                subscribers = self._subscribers.get(lot_id)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[lot_id]
+
+    def publish(self, lot_id, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(lot_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(payload)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def publish_events(self, events):
+        for payload in events:
+            self.publish(payload['parkinglot_id'], payload)
+
+    def listen(self, engine):
+        """
+        Start this process's listener for events committed by any process. Idempotent;
+        a no-op unless ``engine`` is PostgreSQL.
+        """
+        if engine.dialect.name != 'postgresql':
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=listen_forever,
+                                                  args=(engine, CHANNEL, self._publish_notification, self._resync),
+                                                  name='availability-listener', daemon=True)
+                self._listener.start()
+
+    def _publish_notification(self, payload):
+        payload = json.loads(payload)
+        self.publish(payload['parkinglot_id'], payload)
+
+    def _resync(self):
+        # Events may have been missed before LISTEN took effect: send every current subscriber to a resync
+        with self._lock:
+            subscriptions = {s for subscribers in self._subscribers.values() for s in subscribers}
+        for subscription in subscriptions:
+            subscription.overflowed = True
+
+def listen_forever(engine, channel, on_notify, on_listening):
+    """
+    LISTEN on ``channel`` for the life of the process and pass each NOTIFY payload to
+    ``on_notify``, reconnecting after errors. ``on_listening`` runs whenever LISTEN has
+    (re)taken effect, since notifications sent before that point were missed.
+    """
+    while True:
+        try:
+            connection = engine.raw_connection()
+            connection.detach()  # Never handed back to the pool in LISTEN mode
+            try:
+                _receive(connection.driver_connection, channel, on_notify, on_listening)
+            finally:
+                connection.close()
+        except Exception:
+            logger.exception('Listener on %s lost its connection; reconnecting', channel)
+        time.sleep(1)
+
+def _receive(connection, channel, on_notify, on_listening):
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {channel}')
+    on_listening()
+    while True:
+        if select.select([connection], [], [], 60) == ([], [], []):
+            continue
+        connection.poll()
+        while connection.notifies:
+            on_notify(connection.notifies.pop(0).payload)
+
+availability_broker = AvailabilityBroker()
+
+def build_events(transitions, counts=None, versions=None):
+    """
+    Turn staged changes into availability events, one per lot (more for lots with
+    over EVENT_MAX_SLOTS changed slots, each carrying the deltas of its own slots).
+
+    :param transitions: ``(slot_id, lot_id, old, new)`` status transitions; ``new`` is
+        None for a deleted slot.
+    :param counts: ``{lot_id: [total_delta, available_delta]}`` from created slots.
+    :param versions: ``{lot_id: version}`` committed by the transaction.
+    """
+    counts = counts or {}
+    versions = versions or {}
+    by_lot = {lot_id: [] for lot_id in counts}
+    for slot_id, lot_id, old, new in transitions:
+        by_lot.setdefault(lot_id, []).append((slot_id, old, new))
+    events = []
+    for lot_id, changes in by_lot.items():
+        total_delta, available_delta = counts.get(lot_id, (0, 0))
+        for start in range(0, max(len(changes), 1), EVENT_MAX_SLOTS):
+            chunk = changes[start:start + EVENT_MAX_SLOTS]
+            total_delta += sum((new is not None) - (old is not None) for _, old, new in chunk)
+            available_delta += sum((new == 0) - (old == 0) for _, old, new in chunk)
+            events.append({
+                'parkinglot_id': lot_id,
+                'version': versions.get(lot_id),
+                'total_delta': total_delta,
+                'occupied_delta': total_delta - available_delta,
+                'available_delta': available_delta,
+                'slots': [{'id': slot_id, 'status': new} for slot_id, _, new in chunk]
+            })
+            total_delta = available_delta = 0  # Count changes go out with the first chunk only
+    return events
+
+def stage_transitions(session, transitions):
+    """Queue transitions for publication once ``session`` commits."""
+    session.info.setdefault(PENDING_KEY, []).extend(transitions)
+
+def stage_slot_counts(session, lot_id, total_delta, available_delta):
+    """
+    Queue a change in a lot's slot count for publication, for slots created without a
+    status event. Deleted slots are published as transitions to a None status instead.
+    """
+    staged = session.info.setdefault(COUNTS_KEY, {}).setdefault(lot_id, [0, 0])
+    staged[0] += total_delta
+    staged[1] += available_delta
+
+def stage_lot_versions(session, versions):
+    """Remember the latest version each lot reached in ``session``'s transaction."""
+    staged = session.info.setdefault(VERSIONS_KEY, {})
+    for lot_id, version in versions.items():
+        staged[lot_id] = max(version, staged.get(lot_id, version))
+
+def _take_events(session):
+    transitions = session.info.pop(PENDING_KEY, None)
+    counts = session.info.pop(COUNTS_KEY, None)
+    versions = session.info.pop(VERSIONS_KEY, None)
+    if not transitions and not counts:
+        return []
+    return build_events(transitions or (), counts, versions)
+
+@event.listens_for(Session, 'before_commit')
+def _notify_committing(session):
+    if not (session.info.get(PENDING_KEY) or session.info.get(COUNTS_KEY)):
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        # Delivered by PostgreSQL only if and when this transaction commits
+        for payload in _take_events(session):
+            session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                            {'channel': CHANNEL, 'payload': json.dumps(payload)})
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    availability_broker.publish_events(_take_events(session))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    _take_events(session)
@@ -0,0 +1,484 @@
+import atexit
+import math
+import threading
+import weakref
+from datetime import datetime, timezone
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from flask import current_app
+from werkzeug.local import LocalProxy
+from .models import Slot, DeviceSequence, SlotStatusEvent, SLOT_IS_FREE
+from . import db
+from .pubsub import stage_transitions
+from .availability import is_car, track_availability, adjust_available_counters, adjust_slot_availability
+from .cache import lot_cache
+from .lot_version import stamp_slot_versions
+
+# 0 for free, 1 for occupied
+VALID_STATUSES = (0, 1)
+# Claims retried when another writer takes the chosen slot first (databases without SKIP LOCKED)
+CLAIM_ATTEMPTS = 5
+
+def parse_status_items(items):
+    """
+    Validate a list of slot status items as printed by detect_parking_occupancy.py.
+
+    :param items: List of ``{"id": <slot_id>, "status": <0|1>}`` dicts.
+    :return: ``(updates, results)`` where ``updates`` maps slot_id -> status for the
+             valid items (last one wins for repeated IDs) and ``results`` holds one
+             result dict per input item, in input order.
+    """
+    updates = {}
+    results = []
+    for item in items:
+        slot_id = item.get('id') if isinstance(item, dict) else None
+        status = item.get('status') if isinstance(item, dict) else None
+        try:
+            if isinstance(slot_id, bool) or isinstance(status, bool):
+                raise TypeError
+            slot_id = int(slot_id)
+            status = int(status)
+        except (ValueError, TypeError):
+            results.append({"id": slot_id, "result": "invalid", "error": "Missing or invalid id or status"})
+            continue
+        if status not in VALID_STATUSES:
+            results.append({"id": slot_id, "result": "invalid", "error": "Invalid status value"})
+            continue
+        updates[slot_id] = status
+        results.append({"id": slot_id, "result": None})
+    return updates, results
+
+def apply_status_updates(updates, lot_ids=None, source='device'):
+    """
+    Write slot statuses, touching only the rows whose status actually changed.
+
+    Current statuses are read with one SELECT (rows locked in ID order so concurrent
+    batches cannot deadlock), the lots' availability counters and versions are adjusted
+    with one UPDATE, the changed rows are written (stamped with the new lot version)
+    with another and each transition is appended to slot_status_events. The caller commits.
+
+    :param updates: Dict mapping slot_id -> status.
+    :param lot_ids: Optional set of lot IDs the caller may write; slots in other lots
+                    are left untouched and reported as out of scope.
+    :param source: Recorded on the status events.
+    :return: ``(found, changed, out_of_scope)`` -- the set of writable slot IDs that
+             exist, a dict mapping each changed slot_id -> (old_status, new_status),
+             and the set of existing slot IDs outside ``lot_ids``.
+    """
+    if not updates:
+        return set(), {}, set()
+    rows = db.session.execute(
+        select(Slot.id, Slot.status, Slot.parkinglot_id, Slot.vehicle_type)
+        .where(Slot.id.in_(updates.keys()))
+        .order_by(Slot.id)
+        .with_for_update()
+    ).all()
+    current = {}
+    out_of_scope = set()
+    for slot_id, status, lot_id, vehicle_type in rows:
+        if lot_ids is not None and lot_id not in lot_ids:
+            out_of_scope.add(slot_id)
+        else:
+            current[slot_id] = (status, lot_id, vehicle_type)
+    changed = {
+        slot_id: (current[slot_id][0], status)
+        for slot_id, status in updates.items()
+        if slot_id in current and current[slot_id][0] != status
+    }
+    if changed:
+        deltas = {}
+        for slot_id, (old, new) in changed.items():
+            _, lot_id, vehicle_type = current[slot_id]
+            deltas.setdefault(lot_id, [0, 0])  # bumps the lot version even if availability is unchanged
+            track_availability(deltas, lot_id, vehicle_type, old == 0, new == 0)
+        versions = adjust_available_counters(deltas)
+        db.session.execute(
+            update(Slot)
+            .where(Slot.id.in_(changed.keys()))
+            .values(
+                status=case({slot_id: new for slot_id, (_, new) in changed.items()}, value=Slot.id),
+                change_version=case(versions, value=Slot.parkinglot_id)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        lot_cache.invalidate_on_commit(db.session, deltas)
+        record_status_events(
+            [(slot_id, current[slot_id][1], old, new) for slot_id, (old, new) in changed.items()],
+            source
+        )
+    return set(current), changed, out_of_scope
+
+def resolve_slot_scope(slot_ids, lot_ids=None):
+    """
+    Check slot IDs against a device scope without locking anything, for callers that
+    queue writes instead of applying them (write-behind ingest).
+
+    :return: ``(found, out_of_scope)`` as in apply_status_updates: the writable slot IDs
+             that exist and the existing slot IDs outside ``lot_ids``.
+    """
+    found, out_of_scope = set(), set()
+    if slot_ids:
+        for slot_id, lot_id in db.session.execute(
+            select(Slot.id, Slot.parkinglot_id).where(Slot.id.in_(slot_ids))
+        ):
+            if lot_ids is not None and lot_id not in lot_ids:
+                out_of_scope.add(slot_id)
+            else:
+                found.add(slot_id)
+    return found, out_of_scope
+
+def record_status_events(transitions, source):
+    """
+    Append slot status transitions to slot_status_events with one batched INSERT and
+    stage them for the availability stream, which publishes them once the session commits.
+
+    :param transitions: Iterable of ``(slot_id, parkinglot_id, old_status, new_status)``;
+        ``new_status`` is None for a deleted slot.
+    :param source: What caused the change, e.g. ``device``, ``checkin``, ``checkout`` or ``delete``.
+    """
+    transitions = list(transitions)
+    now = datetime.utcnow()
+    rows = [
+        {"slot_id": slot_id, "parkinglot_id": lot_id, "old_status": old, "new_status": new,
+         "source": source, "changed_at": now}
+        for slot_id, lot_id, old, new in transitions
+    ]
+    if rows:
+        db.session.execute(insert(SlotStatusEvent), rows)
+        stage_transitions(db.session, transitions)
+
+def claim_free_slot(lot_id, vehicle_type, vehicle_reg_no, ticket_id, floor_id=None):
+    """
+    Mark one free slot of ``lot_id`` occupied by ``vehicle_reg_no``, atomically.
+
+    The candidate is the lowest free slot of the matching type (on ``floor_id`` if it
+    has one, else on the lowest floor), read through the ix_slots_free partial index
+    with FOR UPDATE SKIP LOCKED, so concurrent claims neither wait for nor pick the
+    same row. The UPDATE is still guarded by ``status = 0`` for databases without row
+    locks; a lost race moves on to the next candidate. The caller commits.
+
+    :return: The claimed ``(id, floor_id, row_id, name, vehicle_type)`` row, or None if no slot is free.
+    """
+    slot_type = 'Car' if is_car(vehicle_type) else 'Two-Wheeler'
+    for floor in ([floor_id, None] if floor_id is not None else [None]):
+        query = (
+            select(Slot.id, Slot.floor_id, Slot.row_id, Slot.name, Slot.vehicle_type)
+            .where(Slot.parkinglot_id == lot_id, Slot.vehicle_type == slot_type, SLOT_IS_FREE)
+            .order_by(Slot.floor_id, Slot.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if floor is not None:
+            query = query.where(Slot.floor_id == floor)
+        for _ in range(CLAIM_ATTEMPTS):
+            candidate = db.session.execute(query).first()
+            if candidate is None:
+                break
+            claimed = db.session.execute(
+                update(Slot)
+                .where(Slot.id == candidate.id, SLOT_IS_FREE)
+                .values(status=1, vehicle_reg_no=vehicle_reg_no, ticket_id=ticket_id)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if claimed:
+                record_status_events([(candidate.id, lot_id, 0, 1)], 'allocate')
+                versions = adjust_slot_availability(lot_id, slot_type, True, False)
+                stamp_slot_versions({candidate.id: lot_id}, versions)
+                lot_cache.invalidate_on_commit(db.session, [lot_id])
+                return candidate
+    return None
+
+def occupy_slot(slot, vehicle_reg_no, ticket_id, source='checkin'):
+    """
+    Mark ``slot`` occupied by ``vehicle_reg_no`` if it is still free.
+
+    The UPDATE is guarded by ``status = 0`` and takes the slot's row lock before the
+    lot counter is adjusted (slot rows before the lot row, as everywhere else), so of
+    two concurrent check-ins only one records the transition. The caller commits.
+
+    :return: True if this call occupied the slot, False if it was no longer free.
+    """
+    occupied = db.session.execute(
+        update(Slot)
+        .where(Slot.id == slot.id, SLOT_IS_FREE)
+        .values(status=1, vehicle_reg_no=vehicle_reg_no, ticket_id=ticket_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if occupied:
+        record_status_events([(slot.id, slot.parkinglot_id, 0, 1)], source)
+        versions = adjust_slot_availability(slot.parkinglot_id, slot.vehicle_type, True, False)
+        stamp_slot_versions({slot.id: slot.parkinglot_id}, versions)
+        lot_cache.invalidate_on_commit(db.session, [slot.parkinglot_id])
+    return bool(occupied)
+
+def release_slot(slot, ticket_id, source='checkout'):
+    """
+    Mark ``slot`` free if it is occupied, with the same guard and lock order as
+    occupy_slot. A slot a device already reported free only loses the occupant of
+    ``ticket_id``. The caller commits.
+
+    :return: True if this call freed the slot.
+    """
+    released = db.session.execute(
+        update(Slot)
+        .where(Slot.id == slot.id, Slot.status == 1)
+        .values(status=0, vehicle_reg_no=None, ticket_id=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if released:
+        record_status_events([(slot.id, slot.parkinglot_id, 1, 0)], source)
+        versions = adjust_slot_availability(slot.parkinglot_id, slot.vehicle_type, False, True)
+        stamp_slot_versions({slot.id: slot.parkinglot_id}, versions)
+        lot_cache.invalidate_on_commit(db.session, [slot.parkinglot_id])
+    else:
+        db.session.execute(
+            update(Slot)
+            .where(Slot.id == slot.id, Slot.ticket_id == ticket_id)
+            .values(vehicle_reg_no=None, ticket_id=None)
+            .execution_options(synchronize_session=False)
+        )
+    return bool(released)
+
+def fill_results(results, found, changed, out_of_scope=(), accepted=False):
+    """
+    Resolve the pending entries produced by parse_status_items. With ``accepted``, the
+    writable slots were queued rather than written and are reported as ``accepted``.
+    """
+    for entry in results:
+        if entry["result"] is None:
+            if entry["id"] in out_of_scope:
+                entry["result"] = "out_of_scope"
+            elif entry["id"] not in found:
+                entry["result"] = "not_found"
+            elif accepted:
+                entry["result"] = "accepted"
+            elif entry["id"] in changed:
+                entry["result"] = "changed"
+            else:
+                entry["result"] = "unchanged"
+    return results
+
+def snapshot_sequence(data):
+    """
+    Extract the ordering key of a sequenced snapshot envelope.
+
+    Devices send either a monotonic integer ``seq`` or a ``captured_at`` capture time
+    (ISO-8601 string or epoch seconds); capture times are compared in milliseconds.
+
+    :return: The sequence as an int, or None if the envelope carries neither field.
+    :raises ValueError: If the value cannot be interpreted.
+    """
+    if data.get('seq') is not None:
+        seq = data['seq']
+        if isinstance(seq, bool) or not isinstance(seq, int) or seq < 0:
+            raise ValueError("seq must be a non-negative integer")
+        return seq
+    captured_at = data.get('captured_at')
+    if captured_at is None:
+        return None
+    if isinstance(captured_at, (int, float)) and not isinstance(captured_at, bool):
+        if not math.isfinite(captured_at):
+            raise ValueError("captured_at must be a finite number")
+        return int(captured_at * 1000)
+    if isinstance(captured_at, str):
+        captured = datetime.fromisoformat(captured_at.replace('Z', '+00:00'))
+        if captured.tzinfo is None:
+            captured = captured.replace(tzinfo=timezone.utc)
+        return int(captured.timestamp() * 1000)
+    raise ValueError("captured_at must be an ISO-8601 string or epoch seconds")
+
+def claim_sequence(device_id, lot_id, seq):
+    """
+    Record ``seq`` as the last applied snapshot for (device_id, lot_id) if it is newer.
+
+    The common case is a single conditional UPDATE; the row is only read back when the
+    snapshot is stale or the device reports for this lot the first time. The caller
+    commits, so a failed slot write also rolls the sequence back.
+
+    :return: ``(accepted, last_seq)``.
+    """
+    result = db.session.execute(
+        update(DeviceSequence)
+        .where(DeviceSequence.device_id == device_id,
+               DeviceSequence.parkinglot_id == lot_id,
+               DeviceSequence.last_seq < seq)
+        .values(last_seq=seq, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return True, seq
+    last_seq = db.session.scalar(
+        select(DeviceSequence.last_seq)
+        .where(DeviceSequence.device_id == device_id, DeviceSequence.parkinglot_id == lot_id)
+    )
+    if last_seq is not None:
+        return False, last_seq
+    try:
+        with db.session.begin_nested():
+            db.session.add(DeviceSequence(device_id=device_id, parkinglot_id=lot_id, last_seq=seq))
+    except IntegrityError:
+        # Another request registered this device/lot first; compare against its sequence
+        return claim_sequence(device_id, lot_id, seq)
+    return True, seq
+
+class StatusWriteBuffer:
+    """
+    Write-behind buffer for slot status ingest.
+
+    Updates are acknowledged immediately and kept in memory as the latest status per
+    slot_id (last write wins), together with the lot scope of the device that sent it.
+    A background thread flushes them through apply_status_updates in one transaction
+    every SLOT_STATUS_FLUSH_INTERVAL seconds, or sooner once SLOT_STATUS_FLUSH_MAX_PENDING
+    slots are waiting. If a batch fails, its slots are retried one per transaction so a
+    bad slot cannot block the others, and a slot is dropped (and logged) after
+    SLOT_STATUS_FLUSH_MAX_ATTEMPTS failed flushes. Pending updates are flushed on
+    interpreter shutdown. With SLOT_STATUS_WRITE_BEHIND_SYNC set, every submit flushes
+    inline, which keeps tests deterministic.
+
+    Each app gets its own buffer in ``app.extensions``; ``write_buffer`` below is the
+    current app's.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['slot_status_buffer'] = self
+        _buffers.add(self)
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config.get('SLOT_STATUS_WRITE_BEHIND'))
+
+    @property
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, updates, lot_ids=None):
+        """Queue ``updates`` (slot_id -> status) for the next flush, limited to ``lot_ids`` if given."""
+        if not updates:
+            return
+        scope = frozenset(lot_ids) if lot_ids is not None else None
+        with self._lock:
+            for slot_id, status in updates.items():
+                self._pending[slot_id] = (status, scope, 0)
+            pending = len(self._pending)
+        if self.app.config.get('SLOT_STATUS_WRITE_BEHIND_SYNC'):
+            self.flush()
+            return
+        self._ensure_started()
+        if pending >= self.app.config.get('SLOT_STATUS_FLUSH_MAX_PENDING', 1000):
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all pending updates in one transaction. Returns the number of slots flushed."""
+        # Serialise flushes so an older batch can never commit after a newer one
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        with self.app.app_context():
+            fresh = {slot_id: entry for slot_id, entry in batch.items() if not entry[2]}
+            failed = self._apply_batch(fresh)
+            # Slots that failed before are retried on their own so they cannot hold back the rest
+            failed.update(self._apply_each({slot_id: entry for slot_id, entry in batch.items() if entry[2]}))
+        self._requeue(failed)
+        return len(batch) - len(failed)
+
+    def _apply_batch(self, batch):
+        """Apply ``batch`` in one transaction; on failure fall back to one transaction per slot."""
+        if not batch:
+            return {}
+        scopes = {}
+        for slot_id, (status, scope, _) in batch.items():
+            scopes.setdefault(scope, {})[slot_id] = status
+        try:
+            for scope, updates in scopes.items():
+                apply_status_updates(updates, lot_ids=scope)
+            db.session.commit()
+            return {}
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception("Failed to flush %d buffered slot statuses, retrying them one by one", len(batch))
+        return self._apply_each(batch)
+
+    def _apply_each(self, batch):
+        """Apply each slot of ``batch`` in its own transaction. Returns the entries that failed."""
+        failed = {}
+        for slot_id, entry in batch.items():
+            try:
+                apply_status_updates({slot_id: entry[0]}, lot_ids=entry[1])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                failed[slot_id] = entry
+        return failed
+
+    def _requeue(self, failed):
+        """Queue failed entries for the next flush, dropping those that failed SLOT_STATUS_FLUSH_MAX_ATTEMPTS times."""
+        max_attempts = self.app.config.get('SLOT_STATUS_FLUSH_MAX_ATTEMPTS', 5)
+        dropped = []
+        with self._lock:
+            for slot_id, (status, scope, attempts) in failed.items():
+                if slot_id in self._pending:
+                    continue  # a newer status arrived while we were flushing
+                if attempts + 1 >= max_attempts:
+                    dropped.append(slot_id)
+                else:
+                    self._pending[slot_id] = (status, scope, attempts + 1)
+        if dropped:
+            self.app.logger.error(
+                "Dropped buffered statuses of slots %s after %d failed flushes", sorted(dropped), max_attempts
+            )
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still pending."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping = True
+            self._wakeup.set()
+            thread.join()
+            self._thread = None
+        if self.app is not None:
+            self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._wakeup.clear()
+            self._thread = threading.Thread(target=self._run, name='slot-status-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config.get('SLOT_STATUS_FLUSH_INTERVAL', 0.5)
+        while not self._stopping:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self.flush()
+
+_buffers = weakref.WeakSet()
+
+@atexit.register
+def _stop_buffers():
+    for buffer in list(_buffers):
+        buffer.stop()
+
+write_buffer = LocalProxy(lambda: current_app.extensions['slot_status_buffer'])
@@ -0,0 +1,103 @@
+"""
+Compare the Marshmallow and the tuple-based dump paths for the lot detail document.
+
+Builds a 5,000-slot lot (10 floors x 10 rows x 50 slots) in an in-memory SQLite
+database and times rendering GET /parking/lots/<id> both ways, with the default
+JSON provider and, if orjson is installed, with OrjsonProvider. Every path must
+produce the same bytes.
+
+Usage (from Backend/):
+    python benchmarks/bench_lot_serialization.py [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from app import create_app, db
+from app.models import ParkingLotDetails, Floor, Row, Slot
+from app.parking import parking_lot_detail_schema, lot_documents
+
+FLOORS, ROWS_PER_FLOOR, SLOTS_PER_ROW = 10, 10, 50
+
+def build_lot():
+    lot = ParkingLotDetails(name='Benchmark Tower', address='1 Bench St', city='Testville',
+                            latitude=12.9716, longitude=77.5946, car_capacity=5000)
+    db.session.add(lot)
+    db.session.flush()
+    for f in range(FLOORS):
+        floor = Floor(name=f'Level {f}', parkinglot_id=lot.id)
+        db.session.add(floor)
+        db.session.flush()
+        for r in range(ROWS_PER_FLOOR):
+            row = Row(name=f'{f}-{r}', floor_id=floor.id, parkinglot_id=lot.id)
+            db.session.add(row)
+            db.session.flush()
+            db.session.execute(insert(Slot), [
+                {'name': f'{f}-{r}-{s}', 'status': s % 2, 'row_id': row.id, 'floor_id': floor.id,
+                 'parkinglot_id': lot.id}
+                for s in range(SLOTS_PER_ROW)
+            ])
+    db.session.commit()
+    return lot.id
+
+def marshmallow_path(lot_id):
+    lot = db.session.execute(
+        select(ParkingLotDetails).where(ParkingLotDetails.id == lot_id).options(
+            selectinload(ParkingLotDetails.floors).selectinload(Floor.rows).selectinload(Row.slots))
+    ).scalar_one()
+    body = jsonify(parking_lot_detail_schema.dump(lot)).get_data()
+    db.session.expunge_all()
+    return body
+
+def fast_path(lot_id):
+    return jsonify(lot_documents.detail(lot_id)).get_data()
+
+def timed(func, lot_id, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func(lot_id)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        lot_id = build_lot()
+        results = []
+        reference = None
+        providers = [('default', app.json)]
+        try:
+            from app.json_provider import OrjsonProvider
+            providers.append(('orjson', OrjsonProvider(app)))
+        except ImportError:
+            print('orjson not installed; skipping OrjsonProvider')
+        for provider_name, provider in providers:
+            app.json = provider
+            for path_name, func in (('marshmallow', marshmallow_path), ('tuples', fast_path)):
+                func(lot_id)  # warm up
+                ms, body = timed(func, lot_id, args.repeat)
+                reference = reference or body
+                assert body == reference, f'{path_name}/{provider_name} output differs'
+                results.append((path_name, provider_name, ms))
+
+        baseline = results[0][2]
+        print(f'Lot detail, {FLOORS * ROWS_PER_FLOOR * SLOTS_PER_ROW} slots, '
+              f'{len(reference)} bytes, median of {args.repeat} runs')
+        for path_name, provider_name, ms in results:
+            print(f'  {path_name:<12} {provider_name:<8} {ms:8.1f} ms  {baseline / ms:5.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+# Gunicorn settings for the 'stream' service in docker-compose.yml. Ingest streams
+# from edge devices and availability subscriptions hold their request open for hours,
+# which would pin one of the API's few gthread threads each; gevent serves every
+# stream on its own greenlet.
+import os
+
+bind = '0.0.0.0:5001'
+worker_class = 'gevent'
+workers = int(os.environ.get('STREAM_WORKERS', '1'))
+worker_connections = int(os.environ.get('STREAM_WORKER_CONNECTIONS', '1000'))  # Open streams per worker
+
+def post_fork(server, worker):
+    # psycopg2 is a C extension that gevent cannot patch: make its waits cooperative
+    # so one stream's query does not block the other greenlets of the worker.
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
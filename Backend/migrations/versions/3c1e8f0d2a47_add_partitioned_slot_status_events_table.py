@@ -0,0 +1,72 @@
+"""add slot_status_events table, range-partitioned by month on PostgreSQL
+
+Revision ID: 3c1e8f0d2a47
+Revises: be65e5584d3b
+Create Date: 2026-10-18 11:20:05.118342
+
+"""
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1e8f0d2a47'
+down_revision = 'be65e5584d3b'
+branch_labels = None
+depends_on = None
+
+# Partitions created up front; `flask slot-events create-partitions` keeps adding them
+MONTHS_AHEAD = 3
+
+
+def _month_start(day, offset):
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_table('slot_status_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('slot_id', sa.Integer(), nullable=False),
+        sa.Column('parkinglot_id', sa.Integer(), nullable=False),
+        sa.Column('old_status', sa.Integer(), nullable=True),
+        sa.Column('new_status', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        # The partition key has to be part of the primary key
+        op.execute("""
+            CREATE TABLE slot_status_events (
+                id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+                slot_id INTEGER NOT NULL,
+                parkinglot_id INTEGER NOT NULL,
+                old_status INTEGER,
+                new_status INTEGER NOT NULL,
+                source VARCHAR(20) NOT NULL,
+                changed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                PRIMARY KEY (id, changed_at)
+            ) PARTITION BY RANGE (changed_at)
+        """)
+        today = date.today()
+        for offset in range(MONTHS_AHEAD + 1):
+            start, end = _month_start(today, offset), _month_start(today, offset + 1)
+            op.execute(
+                f"CREATE TABLE slot_status_events_y{start.year}m{start.month:02d} "
+                f"PARTITION OF slot_status_events "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        # Safety net so ingest never fails if the partition cron falls behind
+        op.execute("CREATE TABLE slot_status_events_default PARTITION OF slot_status_events DEFAULT")
+    op.create_index('ix_slot_status_events_lot_changed_at', 'slot_status_events', ['parkinglot_id', 'changed_at'], unique=False)
+    op.create_index('ix_slot_status_events_slot_changed_at', 'slot_status_events', ['slot_id', 'changed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_slot_status_events_slot_changed_at', table_name='slot_status_events')
+    op.drop_index('ix_slot_status_events_lot_changed_at', table_name='slot_status_events')
+    # Dropping the parent drops all of its partitions
+    op.drop_table('slot_status_events')
@@ -0,0 +1,69 @@
+"""add geohash to parkinglots_details for nearby search
+
+Revision ID: 4f6c0b83d915
+Revises: e7a2c95b1f08
+Create Date: 2026-10-18 15:02:44.613290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6c0b83d915'
+down_revision = 'e7a2c95b1f08'
+branch_labels = None
+depends_on = None
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _geohash(latitude, longitude, precision=9):
+    # Frozen copy of app.geo.encode for the backfill
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def upgrade():
+    with op.batch_alter_table('parkinglots_details', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+
+    lots = sa.table('parkinglots_details',
+                    sa.column('parkinglot_id', sa.Integer),
+                    sa.column('latitude', sa.Numeric),
+                    sa.column('longitude', sa.Numeric),
+                    sa.column('geohash', sa.String))
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(lots.c.parkinglot_id, lots.c.latitude, lots.c.longitude)
+        .where(lots.c.latitude.isnot(None), lots.c.longitude.isnot(None))
+    ).all()
+    if rows:
+        connection.execute(
+            lots.update().where(lots.c.parkinglot_id == sa.bindparam('lot_id')).values(geohash=sa.bindparam('hash')),
+            [{'lot_id': lot_id, 'hash': _geohash(float(lat), float(lon))} for lot_id, lat, lon in rows]
+        )
+
+    op.create_index('ix_parkinglots_details_geohash', 'parkinglots_details', ['geohash'], unique=False,
+                    postgresql_ops={'geohash': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_parkinglots_details_geohash', table_name='parkinglots_details')
+    with op.batch_alter_table('parkinglots_details', schema=None) as batch_op:
+        batch_op.drop_column('geohash')
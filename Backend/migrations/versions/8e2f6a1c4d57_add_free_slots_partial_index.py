@@ -0,0 +1,25 @@
+"""add partial index on free slots for allocation
+
+Revision ID: 8e2f6a1c4d57
+Revises: b51d3e0a7c92
+Create Date: 2026-10-18 17:05:37.219604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f6a1c4d57'
+down_revision = 'b51d3e0a7c92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_slots_free', 'slots', ['parkinglot_id', 'vehicle_type', 'floor_id', 'slot_id'], unique=False,
+                    postgresql_where=sa.text('status = 0'), sqlite_where=sa.text('status = 0'))
+
+
+def downgrade():
+    op.drop_index('ix_slots_free', table_name='slots')
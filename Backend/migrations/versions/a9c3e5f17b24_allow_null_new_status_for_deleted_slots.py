@@ -0,0 +1,31 @@
+"""allow a NULL new_status in slot_status_events for deleted slots
+
+Revision ID: a9c3e5f17b24
+Revises: f4b8d2c61e93
+Create Date: 2026-10-18 22:14:09.582613
+
+Deleting a slot is logged with source 'delete' and no new status. On PostgreSQL
+dropping NOT NULL on the partitioned table applies to every partition and needs
+no table rewrite.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c3e5f17b24'
+down_revision = 'f4b8d2c61e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('slot_status_events', schema=None) as batch_op:
+        batch_op.alter_column('new_status', existing_type=sa.Integer(), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM slot_status_events WHERE new_status IS NULL")
+    with op.batch_alter_table('slot_status_events', schema=None) as batch_op:
+        batch_op.alter_column('new_status', existing_type=sa.Integer(), nullable=False)
@@ -0,0 +1,30 @@
+"""add device_sequences table for idempotent edge snapshots
+
+Revision ID: b040faf996a7
+Revises: 76aad77a380f
+Create Date: 2026-10-18 09:12:41.205317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b040faf996a7'
+down_revision = '76aad77a380f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device_sequences',
+    sa.Column('device_id', sa.String(length=64), nullable=False),
+    sa.Column('parkinglot_id', sa.Integer(), nullable=False),
+    sa.Column('last_seq', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('device_id', 'parkinglot_id')
+    )
+
+
+def downgrade():
+    op.drop_table('device_sequences')
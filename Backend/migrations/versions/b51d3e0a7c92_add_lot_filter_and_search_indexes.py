@@ -0,0 +1,51 @@
+"""add lot filter and search indexes to parkinglots_details
+
+Revision ID: b51d3e0a7c92
+Revises: 4f6c0b83d915
+Create Date: 2026-10-18 16:20:11.408137
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b51d3e0a7c92'
+down_revision = '4f6c0b83d915'
+branch_labels = None
+depends_on = None
+
+PARTIAL_INDEXES = {
+    'has_cctv': "lower(has_cctv) = 'yes'",
+    'has_valet': "lower(provides_valet_services) = 'yes'",
+    'takes_cars': 'car_capacity > 0',
+    'takes_two_wheelers': 'two_wheeler_capacity > 0',
+    'free_car_slots': 'available_car_slots > 0',
+    'free_two_wheeler_slots': 'available_two_wheeler_slots > 0',
+}
+SEARCH_COLUMNS = ('parking_name', 'landmark', 'address')
+
+
+def upgrade():
+    op.create_index('ix_parkinglots_details_city', 'parkinglots_details', [sa.text('lower(city)')], unique=False)
+    op.create_index('ix_parkinglots_details_parking_type', 'parkinglots_details', [sa.text('lower(parking_type)')],
+                    unique=False)
+    for name, predicate in PARTIAL_INDEXES.items():
+        op.create_index(f'ix_parkinglots_details_{name}', 'parkinglots_details', ['parkinglot_id'], unique=False,
+                        postgresql_where=sa.text(predicate), sqlite_where=sa.text(predicate))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in SEARCH_COLUMNS:
+            op.create_index(f'ix_parkinglots_details_{column}_trgm', 'parkinglots_details', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            op.drop_index(f'ix_parkinglots_details_{column}_trgm', table_name='parkinglots_details')
+    for name in PARTIAL_INDEXES:
+        op.drop_index(f'ix_parkinglots_details_{name}', table_name='parkinglots_details')
+    op.drop_index('ix_parkinglots_details_parking_type', table_name='parkinglots_details')
+    op.drop_index('ix_parkinglots_details_city', table_name='parkinglots_details')
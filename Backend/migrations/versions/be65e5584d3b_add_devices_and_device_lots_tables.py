@@ -0,0 +1,41 @@
+"""add devices and device_lots tables for per-device API keys
+
+Revision ID: be65e5584d3b
+Revises: b040faf996a7
+Create Date: 2026-10-18 10:03:17.552904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'be65e5584d3b'
+down_revision = 'b040faf996a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('devices',
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.Column('device_name', sa.String(length=64), nullable=False),
+    sa.Column('api_key_hash', sa.String(length=64), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('device_id'),
+    sa.UniqueConstraint('api_key_hash'),
+    sa.UniqueConstraint('device_name')
+    )
+    op.create_table('device_lots',
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.Column('parkinglot_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['device_id'], ['devices.device_id'], ),
+    sa.ForeignKeyConstraint(['parkinglot_id'], ['parkinglots_details.parkinglot_id'], ),
+    sa.PrimaryKeyConstraint('device_id', 'parkinglot_id')
+    )
+
+
+def downgrade():
+    op.drop_table('device_lots')
+    op.drop_table('devices')
@@ -0,0 +1,73 @@
+"""add hot path indexes for slots, sessions and admin assignments
+
+Revision ID: c7a94e2b16d8
+Revises: 8e2f6a1c4d57
+Create Date: 2026-10-18 17:48:03.551920
+
+Indexes are built with CREATE INDEX CONCURRENTLY on PostgreSQL so the migration can
+run against a live database. A concurrent build that fails leaves an INVALID index
+behind; it is dropped and rebuilt when the migration is re-run.
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a94e2b16d8'
+down_revision = '8e2f6a1c4d57'
+branch_labels = None
+depends_on = None
+
+ACTIVE_SESSION = sa.text('end_time IS NULL')
+
+INDEXES = [
+    ('ix_slots_parkinglot_id_status', 'slots', ['parkinglot_id', 'status'], {}),
+    ('ix_slots_row_id', 'slots', ['row_id'], {}),
+    ('ix_rows_floor_id', 'rows', ['floor_id'], {}),
+    ('ix_rows_parkinglot_id', 'rows', ['parkinglot_id'], {}),
+    ('ix_floors_parkinglot_id', 'floors', ['parkinglot_id'], {}),
+    ('uq_parking_sessions_active_vehicle', 'parking_sessions', ['vehicle_reg_no'],
+     {'unique': True, 'postgresql_where': ACTIVE_SESSION, 'sqlite_where': ACTIVE_SESSION}),
+    ('ix_parking_sessions_slot_id', 'parking_sessions', ['slot_id'], {}),
+    ('ix_admin_parking_lots_admin_id_parking_lot_id', 'admin_parking_lots', ['admin_id', 'parking_lot_id'], {}),
+    ('ix_admin_parking_lots_parking_lot_id', 'admin_parking_lots', ['parking_lot_id'], {}),
+]
+
+
+def _open_session_duplicates(connection):
+    return connection.execute(sa.text(
+        "SELECT vehicle_reg_no FROM parking_sessions WHERE end_time IS NULL "
+        "GROUP BY vehicle_reg_no HAVING count(*) > 1"
+    )).scalars().all()
+
+
+def _is_invalid(connection, name):
+    return connection.execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {'name': name}).first() is not None
+
+
+def upgrade():
+    connection = op.get_bind()
+    online = not context.is_offline_mode()
+    duplicates = _open_session_duplicates(connection) if online else []
+    if duplicates:
+        raise RuntimeError(
+            'Close the extra open sessions before adding uq_parking_sessions_active_vehicle; '
+            f"vehicles with several open sessions: {', '.join(duplicates)}"
+        )
+
+    postgresql = connection.dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            if postgresql and online and _is_invalid(connection, name):
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,43 @@
+"""add slot change versions for delta sync
+
+Revision ID: d3f81b6a0c25
+Revises: c7a94e2b16d8
+Create Date: 2026-10-18 18:32:40.118206
+
+Existing slots start at change_version 0, below every lot version, so they only
+reach clients that sync from scratch. The index is built concurrently on PostgreSQL.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f81b6a0c25'
+down_revision = 'c7a94e2b16d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('parkinglots_details', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('min_sync_version', sa.BigInteger(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('slots', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('change_version', sa.BigInteger(), server_default='0', nullable=False))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_slots_parkinglot_id_change_version', 'slots', ['parkinglot_id', 'change_version'],
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_slots_parkinglot_id_change_version', table_name='slots', if_exists=True,
+                      postgresql_concurrently=True)
+
+    with op.batch_alter_table('slots', schema=None) as batch_op:
+        batch_op.drop_column('change_version')
+
+    with op.batch_alter_table('parkinglots_details', schema=None) as batch_op:
+        batch_op.drop_column('min_sync_version')
@@ -0,0 +1,29 @@
+"""add device key generation for cross-worker key table invalidation
+
+Revision ID: f4b8d2c61e93
+Revises: d3f81b6a0c25
+Create Date: 2026-10-18 21:07:52.340517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b8d2c61e93'
+down_revision = 'd3f81b6a0c25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    device_key_generation = op.create_table('device_key_generation',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('generation', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(device_key_generation, [{'id': 1, 'generation': 0}])
+
+
+def downgrade():
+    op.drop_table('device_key_generation')
@@ -276,6 +276,68 @@ def test_vehicle_checkin_flow(client):
         headers={'Authorization': f'Bearer {admin_token}'},
         content_type='application/json')
     assert resp.status_code == 409 
+    # Two check-ins that both read slot2 as free: only the first occupies it and counts
+    from app.models import SlotStatusEvent
+    from app.slot_status import occupy_slot
+    available = db.session.get(ParkingLotDetails, lot_id).available_car_slots
+    assert occupy_slot(slot2, 'DL01AB9001', 'ticket-1') is True
+    assert occupy_slot(slot2, 'DL01AB9002', 'ticket-2') is False
+    db.session.commit()
+    db.session.expire_all()
+    assert (db.session.get(Slot, slot2.id).vehicle_reg_no, db.session.get(ParkingLotDetails, lot_id).available_car_slots) == \
+        ('DL01AB9001', available - 1)
+    assert SlotStatusEvent.query.filter_by(slot_id=slot2.id, source='checkin').count() == 1
+
+def test_vehicle_allocate_flow(client):
+    unique_id = str(uuid.uuid4())[:8]
+    super_admin_token = get_super_admin_and_token(client, unique_id)
+    admin_token, admin_id, admin_email, admin_password = get_admin_and_token(client, unique_id, super_admin_token)
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    from app.models import db, ParkingLotDetails, Slot, ParkingSession, SlotStatusEvent
+    lot = ParkingLotDetails(name='Allocate Lot', address='Gate Rd', latitude=0, longitude=0,
+                            available_car_slots=2, available_two_wheeler_slots=1)
+    db.session.add(lot)
+    db.session.commit()
+    lot_id = lot.id
+    slots = {
+        name: Slot(name=name, status=status, vehicle_type=vehicle_type, row_id=1, floor_id=floor_id, parkinglot_id=lot_id)
+        for name, status, vehicle_type, floor_id in [
+            ('A1', 1, 'Car', 1), ('A2', 0, 'Two-Wheeler', 1), ('A3', 0, 'Car', 1), ('B1', 0, 'Car', 2),
+        ]
+    }
+    db.session.add_all(slots.values())
+    db.session.commit()
+
+    def allocate(vehicle_reg_no, **extra):
+        return client.post('/admin/session/allocate', json={'vehicle_reg_no': vehicle_reg_no, 'lot_id': lot_id, **extra},
+                           headers=headers)
+
+    # Lowest free slot of the vehicle type, preferred floor first, falling back to other floors
+    resp = allocate('DL02AL0001')
+    assert resp.status_code == 200
+    assert resp.get_json()['slot']['name'] == 'A3'
+    resp = allocate('DL02AL0002', floor_id=2)
+    assert resp.get_json()['slot']['name'] == 'B1'
+    resp = allocate('DL02AL0003', vehicle_type='two-wheeler', floor_id=2)
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['slot']['name'] == 'A2'
+    # No free car slot left, and a vehicle cannot be checked in twice
+    assert allocate('DL02AL0004').status_code == 409
+    assert allocate('DL02AL0001', vehicle_type='Two-Wheeler').status_code == 409
+    assert client.post('/admin/session/allocate', json={'lot_id': lot_id}, headers=headers).status_code == 400
+    assert allocate('DL02AL0005', vehicle_type='Truck').status_code == 400
+    assert client.post('/admin/session/allocate', json={'vehicle_reg_no': 'DL02AL0005', 'lot_id': str(lot_id)},
+                       headers=headers).status_code == 400
+
+    db.session.expire_all()
+    slot = db.session.get(Slot, slots['A2'].id)
+    assert (slot.status, slot.vehicle_reg_no, slot.ticket_id) == (1, 'DL02AL0003', data['session_id'])
+    session = db.session.get(ParkingSession, data['session_id'])
+    assert (session.slot_id, session.floor_id, session.vehicle_type) == (slot.id, 1, 'Two-Wheeler')
+    lot = db.session.get(ParkingLotDetails, lot_id)
+    assert (lot.available_car_slots, lot.available_two_wheeler_slots) == (0, 0)
+    assert SlotStatusEvent.query.filter_by(parkinglot_id=lot_id, source='allocate').count() == 3
 
 def test_vehicle_checkout_flow(client):
     import uuid
@@ -334,6 +396,9 @@ def test_vehicle_checkout_flow(client):
     assert 'checkout_time' in data
     assert data['amount_paid'] == 60.0  # 3 hours * 20/hr
     assert data['duration_hours'] == 3
+    from app.models import SlotStatusEvent
+    events = SlotStatusEvent.query.filter_by(slot_id=slot_id).all()
+    assert [(e.old_status, e.new_status, e.source) for e in events] == [(1, 0, 'checkout')]
     # Try to check out again (should fail: no active session)
     resp = client.post('/admin/session/checkout',
         data=json.dumps(payload),
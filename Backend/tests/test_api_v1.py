@@ -0,0 +1,532 @@
+import json
+from sqlalchemy import event
+from app import db, bitmap
+from app.device_keys import DeviceKeyTable
+from app.models import ParkingLotDetails, Floor, Row, Slot, SlotStatusEvent
+
+API_HEADERS = {'X-API-KEY': 'super-secret-rpi-key'}
+
+def make_lot(slot_count=3, name='RPi Lot'):
+    """Create a lot with one floor, one row and ``slot_count`` free slots; return the slot IDs."""
+    lot = ParkingLotDetails(name=name, address='1 Edge Rd')
+    db.session.add(lot)
+    db.session.flush()
+    floor = Floor(name='G', parkinglot_id=lot.id)
+    db.session.add(floor)
+    db.session.flush()
+    row = Row(name='A', floor_id=floor.id, parkinglot_id=lot.id)
+    db.session.add(row)
+    db.session.flush()
+    slots = [Slot(name=f'S{i}', status=0, row_id=row.id, floor_id=floor.id, parkinglot_id=lot.id)
+             for i in range(slot_count)]
+    db.session.add_all(slots)
+    db.session.commit()
+    return [s.id for s in slots]
+
+def slot_status(slot_id):
+    db.session.expire_all()
+    return db.session.get(Slot, slot_id).status
+
+def test_update_status_requires_api_key(client):
+    response = client.post('/api/v1/slots/update_status',
+                           data=json.dumps({'id': 1, 'status': 1}),
+                           content_type='application/json')
+    assert response.status_code == 401
+
+def test_update_single_slot_status(client):
+    slot_ids = make_lot(1)
+    response = client.post('/api/v1/slots/update_status',
+                           headers=API_HEADERS,
+                           data=json.dumps({'id': slot_ids[0], 'status': 1}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert json.loads(response.data)['changed'] is True
+    assert slot_status(slot_ids[0]) == 1
+
+    response = client.post('/api/v1/slots/update_status',
+                           headers=API_HEADERS,
+                           data=json.dumps({'id': slot_ids[0], 'status': 1}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert json.loads(response.data)['changed'] is False
+
+def test_bulk_update_status(client):
+    """
+    GIVEN slots reported by an edge device
+    WHEN the whole detector output is POSTed to '/api/v1/slots/bulk_update_status'
+    THEN every valid slot is updated and each item gets its own result.
+    """
+    slot_ids = make_lot(3)
+    payload = [
+        {'id': slot_ids[0], 'status': 1},
+        {'id': slot_ids[1], 'status': 1},
+        {'id': 999999, 'status': 1},
+        {'id': slot_ids[2], 'status': 7},
+        {'status': 1},
+    ]
+    response = client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=json.dumps(payload),
+                           content_type='application/json')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert sorted(data['changed']) == sorted(slot_ids[:2])
+    assert [r['result'] for r in data['results']] == ['changed', 'changed', 'not_found', 'invalid', 'invalid']
+    assert slot_status(slot_ids[0]) == 1
+    assert slot_status(slot_ids[1]) == 1
+    assert slot_status(slot_ids[2]) == 0
+
+def test_bulk_update_status_writes_only_changed_slots(client):
+    """
+    GIVEN slots with known statuses
+    WHEN a snapshot repeating most of those statuses is POSTed
+    THEN only the slots that transitioned are written and reported as changed.
+    """
+    slot_ids = make_lot(3)
+    payload = [{'id': slot_id, 'status': 0} for slot_id in slot_ids]
+    payload[1]['status'] = 1
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/api/v1/slots/bulk_update_status',
+                               headers=API_HEADERS,
+                               data=json.dumps(payload),
+                               content_type='application/json')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['changed'] == [slot_ids[1]]
+    assert [r['result'] for r in data['results']] == ['unchanged', 'changed', 'unchanged']
+    updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE SLOTS')]
+    assert len(updates) == 1
+    counters = [s for s in statements if s.lstrip().upper().startswith('UPDATE PARKINGLOTS_DETAILS')]
+    assert len(counters) == 1
+
+def test_bulk_update_status_rejects_non_list(client):
+    response = client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=json.dumps({'id': 1, 'status': 1}),
+                           content_type='application/json')
+    assert response.status_code == 400
+
+def test_write_behind_sync_mode(app, client):
+    """
+    GIVEN write-behind ingest in synchronous mode
+    WHEN a batch is POSTed
+    THEN it is acknowledged with 202 and already visible in the database.
+    """
+    slot_ids = make_lot(2)
+    app.config.update(SLOT_STATUS_WRITE_BEHIND=True, SLOT_STATUS_WRITE_BEHIND_SYNC=True)
+    try:
+        response = client.post('/api/v1/slots/bulk_update_status',
+                               headers=API_HEADERS,
+                               data=json.dumps([{'id': slot_ids[0], 'status': 1}, {'id': 'x', 'status': 1}]),
+                               content_type='application/json')
+    finally:
+        app.config.update(SLOT_STATUS_WRITE_BEHIND=False, SLOT_STATUS_WRITE_BEHIND_SYNC=False)
+    assert response.status_code == 202
+    data = json.loads(response.data)
+    assert data['accepted'] == 1
+    assert [r['result'] for r in data['results']] == ['accepted', 'invalid']
+    assert slot_status(slot_ids[0]) == 1
+
+def test_write_behind_coalesces_until_flush(app, client):
+    """
+    GIVEN write-behind ingest with a long flush interval
+    WHEN several updates for the same slot arrive
+    THEN nothing is written until the flush, and the last status wins.
+    """
+    from app.slot_status import write_buffer
+    slot_ids = make_lot(1)
+    app.config.update(SLOT_STATUS_WRITE_BEHIND=True, SLOT_STATUS_FLUSH_INTERVAL=60)
+    try:
+        for status in (1, 0, 1):
+            response = client.post('/api/v1/slots/update_status',
+                                   headers=API_HEADERS,
+                                   data=json.dumps({'id': slot_ids[0], 'status': status}),
+                                   content_type='application/json')
+            assert response.status_code == 202
+        assert write_buffer.pending_count == 1
+        assert slot_status(slot_ids[0]) == 0
+        assert write_buffer.flush() == 1
+        assert slot_status(slot_ids[0]) == 1
+    finally:
+        write_buffer.stop()
+        app.config.update(SLOT_STATUS_WRITE_BEHIND=False, SLOT_STATUS_FLUSH_INTERVAL=0.5)
+
+def test_write_behind_isolates_failing_slots(app, client, monkeypatch):
+    """
+    GIVEN a buffered batch in which one slot always fails to write
+    WHEN the buffer is flushed repeatedly
+    THEN the other slots are written on the first flush and the failing one is dropped
+    after SLOT_STATUS_FLUSH_MAX_ATTEMPTS flushes.
+    """
+    import app.slot_status as status_module
+    from app.slot_status import write_buffer
+    slot_ids = make_lot(3)
+    real_apply = status_module.apply_status_updates
+
+    def apply(updates, lot_ids=None, source='device'):
+        if slot_ids[1] in updates:
+            raise RuntimeError('slot write failed')
+        return real_apply(updates, lot_ids=lot_ids, source=source)
+
+    monkeypatch.setattr(status_module, 'apply_status_updates', apply)
+    app.config.update(SLOT_STATUS_WRITE_BEHIND=True, SLOT_STATUS_FLUSH_INTERVAL=60, SLOT_STATUS_FLUSH_MAX_ATTEMPTS=3)
+    try:
+        write_buffer.submit({slot_id: 1 for slot_id in slot_ids})
+        assert write_buffer.flush() == 2
+        assert [slot_status(slot_id) for slot_id in slot_ids] == [1, 0, 1]
+        assert write_buffer.pending_count == 1
+        assert write_buffer.flush() == 0
+        assert write_buffer.pending_count == 1
+        write_buffer.flush()
+        assert write_buffer.pending_count == 0
+    finally:
+        write_buffer.stop()
+        app.config.update(SLOT_STATUS_WRITE_BEHIND=False, SLOT_STATUS_FLUSH_INTERVAL=0.5, SLOT_STATUS_FLUSH_MAX_ATTEMPTS=5)
+
+def test_write_buffer_is_per_app(app):
+    """
+    GIVEN a second app created in the same process
+    WHEN each app's write buffer is looked up
+    THEN every app has its own buffer bound to itself.
+    """
+    from app import create_app
+    from app.slot_status import write_buffer
+    other = create_app('testing')
+    assert other.extensions['slot_status_buffer'] is not app.extensions['slot_status_buffer']
+    assert write_buffer._get_current_object() is app.extensions['slot_status_buffer']
+    with other.app_context():
+        assert write_buffer._get_current_object().app is other
+    assert app.extensions['slot_status_buffer'].app is app
+
+def test_sequenced_snapshot_rejects_stale_and_replayed(client):
+    """
+    GIVEN an edge device sending sequenced snapshots for a lot
+    WHEN an older or repeated sequence arrives after a newer one
+    THEN it is rejected with 409 and the slots keep the newest state.
+    """
+    slot_ids = make_lot(1)
+    lot_id = db.session.get(Slot, slot_ids[0]).parkinglot_id
+
+    def send(seq, status):
+        return client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=json.dumps({'device_id': 'rpi-seq', 'lot_id': lot_id, 'seq': seq,
+                                            'slots': [{'id': slot_ids[0], 'status': status}]}),
+                           content_type='application/json')
+
+    assert send(5, 1).status_code == 200
+    response = send(5, 1)
+    assert response.status_code == 409
+    assert json.loads(response.data)['last_seq'] == 5
+    assert send(3, 0).status_code == 409
+    assert slot_status(slot_ids[0]) == 1
+    assert send(6, 0).status_code == 200
+    assert slot_status(slot_ids[0]) == 0
+
+def test_envelope_applies_only_to_its_lot(client):
+    """
+    GIVEN a sequenced snapshot envelope for one lot
+    WHEN it also lists a slot of another lot
+    THEN only the envelope lot's slot is written and the other is reported out of scope.
+    """
+    own_slots = make_lot(1, name='Envelope Lot')
+    other_slots = make_lot(1, name='Envelope Other Lot')
+    lot_id = db.session.get(Slot, own_slots[0]).parkinglot_id
+    response = client.post('/api/v1/slots/bulk_update_status', headers=API_HEADERS,
+                           data=json.dumps({'device_id': 'rpi-envelope', 'lot_id': lot_id, 'seq': 1,
+                                            'slots': [{'id': own_slots[0], 'status': 1},
+                                                      {'id': other_slots[0], 'status': 1}]}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert [r['result'] for r in json.loads(response.data)['results']] == ['changed', 'out_of_scope']
+    assert slot_status(own_slots[0]) == 1
+    assert slot_status(other_slots[0]) == 0
+    response = client.post('/api/v1/slots/bulk_update_status', headers=API_HEADERS,
+                           data=json.dumps({'lot_id': 'x', 'slots': []}), content_type='application/json')
+    assert response.status_code == 400
+
+def test_sequenced_snapshot_accepts_capture_time(client):
+    slot_ids = make_lot(1)
+    lot_id = db.session.get(Slot, slot_ids[0]).parkinglot_id
+
+    def send(captured_at):
+        return client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=json.dumps({'device_id': 'rpi-ts', 'lot_id': lot_id, 'captured_at': captured_at,
+                                            'slots': [{'id': slot_ids[0], 'status': 1}]}),
+                           content_type='application/json')
+
+    assert send('2026-01-01T10:00:00Z').status_code == 200
+    assert send('2026-01-01T09:59:59Z').status_code == 409
+    assert send('bogus').status_code == 400
+    assert send(float('nan')).status_code == 400
+    response = client.post('/api/v1/slots/bulk_update_status', headers=API_HEADERS,
+                           data=f'{{"device_id": "rpi-ts", "lot_id": {lot_id}, "captured_at": 1e400, "slots": []}}',
+                           content_type='application/json')
+    assert response.status_code == 400
+
+def test_bitmap_round_trip():
+    statuses = [1, 0, 0, 1, 1, 0, 1, 0, 1]
+    payload = bitmap.encode(7, 1234, statuses)
+    assert len(payload) == bitmap.HEADER.size + 2
+    assert bitmap.decode(payload) == (7, 1234, statuses)
+    partial = [1, None, 0, None, 1, 0, None, 0, 1]
+    payload = bitmap.encode(7, 1234, partial)
+    assert len(payload) == bitmap.HEADER.size + 4
+    assert bitmap.decode(payload) == (7, 1234, partial)
+
+def test_bitmap_ingest(client):
+    """
+    GIVEN the layout published for a lot
+    WHEN an edge device POSTs a packed bitmap of statuses in that order
+    THEN the slots are updated, slots outside a coverage mask are left alone,
+    and a bitmap built for another layout is rejected.
+    """
+    slot_ids = make_lot(10)
+    lot_id = db.session.get(Slot, slot_ids[0]).parkinglot_id
+    response = client.get(f'/api/v1/lots/{lot_id}/layout', headers=API_HEADERS)
+    assert response.status_code == 200
+    layout = json.loads(response.data)
+    assert layout['slot_ids'] == slot_ids
+
+    statuses = [1 if i % 3 == 0 else 0 for i in range(len(slot_ids))]
+    response = client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=bitmap.encode(lot_id, layout['layout_version'], statuses),
+                           content_type=bitmap.BITMAP_MIMETYPE)
+    assert response.status_code == 200
+    assert sorted(json.loads(response.data)['changed']) == [s for s, st in zip(slot_ids, statuses) if st]
+    assert [slot_status(s) for s in slot_ids] == statuses
+
+    # A camera covering only the first half frees its slots and leaves the rest alone
+    partial = [0] * 5 + [None] * 5
+    response = client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=bitmap.encode(lot_id, layout['layout_version'], partial),
+                           content_type=bitmap.BITMAP_MIMETYPE)
+    assert response.status_code == 200
+    assert [slot_status(s) for s in slot_ids] == [0] * 5 + statuses[5:]
+
+    response = client.post('/api/v1/slots/bulk_update_status',
+                           headers=API_HEADERS,
+                           data=bitmap.encode(lot_id, layout['layout_version'] ^ 1, statuses),
+                           content_type=bitmap.BITMAP_MIMETYPE)
+    assert response.status_code == 409
+    assert json.loads(response.data)['layout_version'] == layout['layout_version']
+
+def test_stream_ingest(app, client, monkeypatch):
+    """
+    GIVEN an authenticated NDJSON ingest stream
+    WHEN several frames are pushed over the same request
+    THEN each frame is applied and acknowledged on its own line,
+    and workers that do not serve streams refuse them.
+    """
+    slot_ids = make_lot(2)
+    lot_id = db.session.get(Slot, slot_ids[0]).parkinglot_id
+    frames = [
+        [{'id': slot_ids[0], 'status': 1}],
+        {'device_id': 'rpi-stream', 'lot_id': lot_id, 'seq': 1, 'slots': [{'id': slot_ids[1], 'status': 1}]},
+        'not json',
+        {'device_id': 'rpi-stream', 'lot_id': lot_id, 'seq': 1, 'slots': [{'id': slot_ids[1], 'status': 0}]},
+    ]
+    body = '\n'.join(f if isinstance(f, str) else json.dumps(f) for f in frames) + '\n'
+    response = client.post('/api/v1/slots/stream', headers=API_HEADERS,
+                           data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    acks = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [a['status'] for a in acks] == [200, 200, 400, 409]
+    assert [a['frame'] for a in acks] == [1, 2, 3, 4]
+    assert slot_status(slot_ids[0]) == 1
+    assert slot_status(slot_ids[1]) == 1
+
+    monkeypatch.setitem(app.config, 'SERVE_STREAMS', False)
+    response = client.post('/api/v1/slots/stream', headers=API_HEADERS,
+                           data=body, content_type='application/x-ndjson')
+    assert response.status_code == 503
+
+def super_admin_headers(client):
+    client.post('/auth/register', data=json.dumps({
+        'user_name': 'Device Admin',
+        'user_email': 'device_admin@example.com',
+        'user_password': 'password',
+        'user_phone_no': '7000000001',
+        'role': 'super_admin',
+        'super_admin_secret': 'SUPER_SECRET_SUPER_ADMIN_KEY'
+    }), content_type='application/json')
+    response = client.post('/auth/login', data=json.dumps({
+        'user_email': 'device_admin@example.com',
+        'user_password': 'password'
+    }), content_type='application/json')
+    return {'Authorization': f"Bearer {json.loads(response.data)['access_token']}"}
+
+def test_device_keys_are_scoped_to_their_lots(client):
+    """
+    GIVEN a device registered for one lot
+    WHEN it reports slots of its own lot and of another lot
+    THEN only its own slots are written, and revoking the key locks it out.
+    """
+    own_slots = make_lot(1, name='Device Lot')
+    other_slots = make_lot(1, name='Other Lot')
+    own_lot = db.session.get(Slot, own_slots[0]).parkinglot_id
+    other_lot = db.session.get(Slot, other_slots[0]).parkinglot_id
+    admin_headers = super_admin_headers(client)
+    response = client.post('/admin/devices', headers=admin_headers,
+                           data=json.dumps({'name': 'rpi-scoped', 'parking_lot_ids': [own_lot]}),
+                           content_type='application/json')
+    assert response.status_code == 201
+    device = json.loads(response.data)
+    device_headers = {'X-API-KEY': device['api_key']}
+
+    response = client.post('/api/v1/slots/bulk_update_status', headers=device_headers,
+                           data=json.dumps([{'id': own_slots[0], 'status': 1}, {'id': other_slots[0], 'status': 1}]),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert [r['result'] for r in json.loads(response.data)['results']] == ['changed', 'out_of_scope']
+    assert slot_status(own_slots[0]) == 1
+    assert slot_status(other_slots[0]) == 0
+
+    response = client.post('/api/v1/slots/bulk_update_status', headers=device_headers,
+                           data=json.dumps({'lot_id': other_lot, 'seq': 1, 'slots': [{'id': other_slots[0], 'status': 1}]}),
+                           content_type='application/json')
+    assert response.status_code == 403
+    response = client.post('/api/v1/slots/update_status', headers=device_headers,
+                           data=json.dumps({'id': other_slots[0], 'status': 1}),
+                           content_type='application/json')
+    assert response.status_code == 403
+
+    response = client.delete(f"/admin/devices/{device['device_id']}", headers=admin_headers)
+    assert response.status_code == 200
+    response = client.get(f'/api/v1/lots/{own_lot}/layout', headers=device_headers)
+    assert response.status_code == 401
+
+def test_device_key_changes_reach_other_workers(client, auth_headers):
+    """
+    GIVEN another worker's key table loaded while a device key was valid
+    WHEN the device's lot is deleted and the key is revoked
+    THEN that table serves its copy without a query until its TTL passes or it is
+    notified, and then drops the lot and the key.
+    """
+    slot_ids = make_lot(1, name='Worker Lot')
+    lot_id = db.session.get(Slot, slot_ids[0]).parkinglot_id
+    admin_headers = super_admin_headers(client)
+    response = client.post('/admin/devices', headers=admin_headers,
+                           data=json.dumps({'name': 'rpi-workers', 'parking_lot_ids': [lot_id]}),
+                           content_type='application/json')
+    device = json.loads(response.data)
+    other_worker = DeviceKeyTable()
+    assert other_worker.lookup(device['api_key'], ttl=3600).lot_ids == {lot_id}
+
+    response = client.delete(f'/parking/lots/{lot_id}', headers=auth_headers)
+    assert response.status_code == 200
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert other_worker.lookup(device['api_key'], ttl=3600).lot_ids == {lot_id}
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements == []
+    # Past its TTL the table sees the newer shared generation
+    assert other_worker.lookup(device['api_key'], ttl=0).lot_ids == set()
+
+    client.delete(f"/admin/devices/{device['device_id']}", headers=admin_headers)
+    other_worker.invalidate()  # What its listener does on the NOTIFY sent by bump()
+    assert other_worker.lookup(device['api_key'], ttl=3600) is None
+
+def test_write_behind_rejects_unknown_and_out_of_scope_slots(app, client):
+    """
+    GIVEN write-behind ingest and a device registered for one lot
+    WHEN it reports its own slot, another lot's slot and an unknown slot
+    THEN only its own slot is queued; the others are reported instead of accepted.
+    """
+    own_slots = make_lot(1, name='Buffered Lot')
+    other_slots = make_lot(1, name='Buffered Other Lot')
+    own_lot = db.session.get(Slot, own_slots[0]).parkinglot_id
+    response = client.post('/admin/devices', headers=super_admin_headers(client),
+                           data=json.dumps({'name': 'rpi-buffered', 'parking_lot_ids': [own_lot]}),
+                           content_type='application/json')
+    device_headers = {'X-API-KEY': json.loads(response.data)['api_key']}
+    app.config.update(SLOT_STATUS_WRITE_BEHIND=True, SLOT_STATUS_WRITE_BEHIND_SYNC=True)
+    try:
+        response = client.post('/api/v1/slots/bulk_update_status', headers=device_headers,
+                               data=json.dumps([{'id': own_slots[0], 'status': 1}, {'id': other_slots[0], 'status': 1},
+                                                {'id': 999999, 'status': 1}]),
+                               content_type='application/json')
+        assert response.status_code == 202
+        data = json.loads(response.data)
+        assert data['accepted'] == 1
+        assert [r['result'] for r in data['results']] == ['accepted', 'out_of_scope', 'not_found']
+        for slot_id, status_code in ((other_slots[0], 403), (999999, 404)):
+            response = client.post('/api/v1/slots/update_status', headers=device_headers,
+                                   data=json.dumps({'id': slot_id, 'status': 1}), content_type='application/json')
+            assert response.status_code == status_code
+    finally:
+        app.config.update(SLOT_STATUS_WRITE_BEHIND=False, SLOT_STATUS_WRITE_BEHIND_SYNC=False)
+    assert slot_status(own_slots[0]) == 1
+    assert slot_status(other_slots[0]) == 0
+
+def test_transitions_are_logged_as_events(client):
+    """
+    GIVEN a slot reported by an edge device
+    WHEN the same status is reported twice and then flips back
+    THEN exactly one event is appended per real transition.
+    """
+    slot_ids = make_lot(1)
+    for status in (1, 1, 0):
+        client.post('/api/v1/slots/bulk_update_status', headers=API_HEADERS,
+                    data=json.dumps([{'id': slot_ids[0], 'status': status}]),
+                    content_type='application/json')
+    events = SlotStatusEvent.query.filter_by(slot_id=slot_ids[0]).order_by(SlotStatusEvent.id).all()
+    assert [(e.old_status, e.new_status, e.source) for e in events] == [(0, 1, 'device'), (1, 0, 'device')]
+
+def test_status_writes_maintain_lot_counters(app, client, auth_headers):
+    """
+    GIVEN a lot whose availability counters match its slots
+    WHEN slots change status through the device API and slots are created and deleted
+    THEN the lot's counters follow in the same transaction and reconcile finds no drift.
+    """
+    slot_ids = make_lot(3, name='Counter Lot')
+    lot_id = db.session.get(Slot, slot_ids[0]).parkinglot_id
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['availability', 'reconcile', '--lot-id', str(lot_id)])
+    assert '1 lot(s) repaired' in result.output
+
+    def counters():
+        db.session.expire_all()
+        lot = db.session.get(ParkingLotDetails, lot_id)
+        return lot.available_car_slots, lot.available_two_wheeler_slots
+
+    assert counters() == (3, 0)
+    client.post('/api/v1/slots/bulk_update_status',
+                headers=API_HEADERS,
+                data=json.dumps([{'id': slot_ids[0], 'status': 1}, {'id': slot_ids[1], 'status': 1}]),
+                content_type='application/json')
+    assert counters() == (1, 0)
+
+    bike = Slot(name='B1', status=0, vehicle_type='Two-Wheeler', row_id=db.session.get(Slot, slot_ids[0]).row_id,
+                floor_id=db.session.get(Slot, slot_ids[0]).floor_id, parkinglot_id=lot_id)
+    db.session.add(bike)
+    db.session.commit()
+    client.post('/api/v1/slots/update_status',
+                headers=API_HEADERS,
+                data=json.dumps({'id': bike.id, 'status': 1}),
+                content_type='application/json')
+    # The bike slot was inserted behind the API's back, so its +1 is missing
+    assert counters() == (1, -1)
+    result = runner.invoke(args=['availability', 'reconcile', '--lot-id', str(lot_id)])
+    assert 'two-wheeler -1 -> 0' in result.output
+    assert counters() == (1, 0)
+
+    response = client.get(f'/parking/lots/{lot_id}/availability', headers=auth_headers)
+    assert json.loads(response.data)['available_car_slots'] == 1
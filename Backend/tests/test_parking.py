@@ -1,4 +1,10 @@
 import json
+import pytest
+from sqlalchemy import event, select
+from app import db, bitmap
+from app.cache import lot_cache, LRUBackend
+from app.slot_status import apply_status_updates
+from app.models import ParkingLotDetails, Floor, Row, Slot, ParkingSession, SlotStatusEvent
 
 def test_create_parking_lot(client, auth_headers):
     """
@@ -99,4 +105,799 @@ def test_create_slot(client, auth_headers):
     assert response.status_code == 201
     data = json.loads(response.data)
     assert data['name'] == 'A1'
-    assert data['status'] == 0 # Default status 
\ No newline at end of file
+    assert data['status'] == 0 # Default status 
+
+
+def test_get_parking_lot_as_bitmap(client, auth_headers):
+    """
+    GIVEN a parking lot with slots
+    WHEN the lot is requested with the bitmap media type in the Accept header
+    THEN the slot statuses are returned as a packed bitset instead of JSON.
+    """
+    response = client.get('/parking/lots/1',
+                          headers={**auth_headers, 'Accept': bitmap.BITMAP_MIMETYPE})
+    assert response.status_code == 200
+    assert response.mimetype == bitmap.BITMAP_MIMETYPE
+    lot_id, version, statuses = bitmap.decode(response.data)
+    assert lot_id == 1
+    assert statuses == [0]
+
+    response = client.get('/parking/lots/1', headers=auth_headers)
+    assert response.mimetype == 'application/json'
+
+def test_stream_lot_availability(app, client, auth_headers, monkeypatch):
+    """
+    GIVEN a subscriber on a lot's availability stream
+    WHEN a device reports a slot of that lot as occupied
+    THEN the stream pushes an availability delta without the client polling,
+    and workers that do not serve streams refuse the subscription.
+    """
+    response = client.get('/parking/lots/1/availability/stream', headers=auth_headers, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = (chunk.decode() for chunk in response.response)
+    assert next(events) == 'retry: 3000\n\n'
+    snapshot = next(events)
+    assert snapshot.startswith('event: snapshot\n')
+    snapshot = json.loads(snapshot.split('data: ', 1)[1])
+    assert snapshot == {
+        'parkinglot_id': 1, 'version': snapshot['version'], 'total_slots': 1, 'available_slots': 1, 'occupied_slots': 0
+    }
+
+    update = client.post('/api/v1/slots/update_status',
+                         headers={'X-API-KEY': 'super-secret-rpi-key'},
+                         data=json.dumps({'id': 1, 'status': 1}),
+                         content_type='application/json')
+    assert update.status_code == 200
+
+    change = next(events)
+    assert change.startswith('event: availability\n')
+    data = json.loads(change.split('data: ', 1)[1])
+    assert data['available_delta'] == -1
+    assert data['version'] > snapshot['version']
+    assert data['available_slots'] == 0
+    assert data['occupied_slots'] == 1
+    assert data['slots'] == [{'id': 1, 'status': 1}]
+    response.close()
+
+    response = client.get('/parking/lots/availability/stream?ids=1,999', headers=auth_headers)
+    assert response.status_code == 404
+    response = client.get('/parking/lots/availability/stream?ids=abc', headers=auth_headers)
+    assert response.status_code == 400
+
+    monkeypatch.setitem(app.config, 'SERVE_STREAMS', False)
+    response = client.get('/parking/lots/1/availability/stream', headers=auth_headers)
+    assert response.status_code == 503
+
+def test_stream_skips_changes_in_its_snapshot(client, auth_headers, monkeypatch):
+    """
+    GIVEN a change committed after a stream subscribed but before it read its snapshot
+    WHEN the stream starts and a later change arrives
+    THEN the first change is counted once, in the snapshot, and not applied again.
+    """
+    import app.parking as parking_module
+    apply_status_updates({1: 1})
+    db.session.commit()
+    read_snapshot = parking_module.availability_snapshot
+
+    def commit_then_snapshot(lot_ids):
+        apply_status_updates({1: 0})
+        db.session.commit()
+        return read_snapshot(lot_ids)
+
+    monkeypatch.setattr(parking_module, 'availability_snapshot', commit_then_snapshot)
+    response = client.get('/parking/lots/1/availability/stream', headers=auth_headers, buffered=False)
+    events = (chunk.decode() for chunk in response.response)
+    next(events)
+    snapshot = json.loads(next(events).split('data: ', 1)[1])
+    assert snapshot['available_slots'] == 1
+
+    apply_status_updates({1: 1})
+    db.session.commit()
+    data = json.loads(next(events).split('data: ', 1)[1])
+    assert data['available_delta'] == -1
+    assert data['available_slots'] == 0
+    response.close()
+
+def test_stream_follows_slot_creation_and_deletion(client, auth_headers):
+    """
+    GIVEN a subscriber on a lot's availability stream
+    WHEN a slot is added to the lot and then deleted
+    THEN the stream pushes the changed total and available counts for both.
+    """
+    response = client.get('/parking/lots/1/availability/stream', headers=auth_headers, buffered=False)
+    events = (chunk.decode() for chunk in response.response)
+    next(events)
+    snapshot = json.loads(next(events).split('data: ', 1)[1])
+
+    created = client.post('/parking/rows/1/slots', headers=auth_headers,
+                          data=json.dumps({'name': 'Streamed'}), content_type='application/json')
+    assert created.status_code == 201
+    data = json.loads(next(events).split('data: ', 1)[1])
+    assert (data['total_delta'], data['available_delta'], data['occupied_delta']) == (1, 1, 0)
+    assert data['total_slots'] == snapshot['total_slots'] + 1
+    assert data['available_slots'] == snapshot['available_slots'] + 1
+
+    deleted = client.delete(f"/parking/slots/{json.loads(created.data)['id']}", headers=auth_headers)
+    assert deleted.status_code == 200
+    data = json.loads(next(events).split('data: ', 1)[1])
+    assert (data['total_delta'], data['available_delta'], data['occupied_delta']) == (-1, -1, 0)
+    assert data['total_slots'] == snapshot['total_slots']
+    assert data['available_slots'] == snapshot['available_slots']
+    response.close()
+
+def test_slot_updates_and_deletes_are_logged(client, auth_headers):
+    """
+    GIVEN a slot managed through the parking API
+    WHEN it is given an invalid status, then a valid one, and is then deleted
+    THEN the invalid status is rejected and the change and the deletion are logged as events.
+    """
+    logged_before = db.session.scalar(select(db.func.coalesce(db.func.max(SlotStatusEvent.id), 0)))
+    created = client.post('/parking/rows/1/slots', headers=auth_headers,
+                          data=json.dumps({'name': 'Logged'}), content_type='application/json')
+    slot_id = json.loads(created.data)['id']
+    response = client.put(f'/parking/slots/{slot_id}', headers=auth_headers,
+                          data=json.dumps({'status': 2}), content_type='application/json')
+    assert response.status_code == 400
+    response = client.put(f'/parking/slots/{slot_id}', headers=auth_headers,
+                          data=json.dumps({'status': 1}), content_type='application/json')
+    assert response.status_code == 200
+    response = client.delete(f'/parking/slots/{slot_id}', headers=auth_headers)
+    assert response.status_code == 200
+
+    events = db.session.execute(
+        select(SlotStatusEvent.source, SlotStatusEvent.old_status, SlotStatusEvent.new_status)
+        .where(SlotStatusEvent.slot_id == slot_id, SlotStatusEvent.id > logged_before)
+        .order_by(SlotStatusEvent.id)
+    ).all()
+    assert [tuple(e) for e in events] == [('manual', 0, 1), ('delete', 1, None)]
+
+def build_lot(floors, rows_per_floor, slots_per_row):
+    lot = ParkingLotDetails(name=f'Tower {floors}x{rows_per_floor}', address='9 Deck St')
+    db.session.add(lot)
+    db.session.flush()
+    for f in range(floors):
+        floor = Floor(name=f'F{f}', parkinglot_id=lot.id)
+        db.session.add(floor)
+        db.session.flush()
+        for r in range(rows_per_floor):
+            row = Row(name=f'R{r}', floor_id=floor.id, parkinglot_id=lot.id)
+            db.session.add(row)
+            db.session.flush()
+            db.session.add_all([
+                Slot(name=f'S{s}', status=0, row_id=row.id, floor_id=floor.id, parkinglot_id=lot.id)
+                for s in range(slots_per_row)
+            ])
+    db.session.commit()
+    return lot.id
+
+def count_selects(client, url, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(statements), json.loads(response.data)
+
+def test_get_parking_lot_query_count_is_constant(client, auth_headers):
+    """
+    GIVEN a small and a much larger parking lot
+    WHEN the detail of each lot is requested
+    THEN both are served with the same number of queries.
+    """
+    small_id = build_lot(1, 1, 1)
+    large_id = build_lot(4, 5, 3)
+
+    small_count, small = count_selects(client, f'/parking/lots/{small_id}', auth_headers)
+    large_count, large = count_selects(client, f'/parking/lots/{large_id}', auth_headers)
+
+    assert len(large['floors']) == 4
+    assert all(len(row['slots']) == 3 for floor in large['floors'] for row in floor['rows'])
+    assert large_count == small_count
+
+    small_floors_count, _ = count_selects(client, f'/parking/lots/{small_id}/floors', auth_headers)
+    floors_count, floors = count_selects(client, f'/parking/lots/{large_id}/floors', auth_headers)
+    assert len(floors) == 4
+    assert floors_count == small_floors_count
+
+def test_get_parking_lots_keyset_pagination(client, auth_headers):
+    """
+    GIVEN several parking lots
+    WHEN the list is requested page by page with a limit
+    THEN each page follows the X-Next-Cursor of the previous one and the pages cover every lot once.
+    """
+    all_ids = [lot['id'] for lot in json.loads(client.get('/parking/lots', headers=auth_headers).data)]
+    assert len(all_ids) >= 3
+
+    seen, url = [], '/parking/lots?limit=2'
+    while url:
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        page = json.loads(response.data)
+        assert len(page) <= 2
+        seen.extend(lot['id'] for lot in page)
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/parking/lots?limit=2&cursor={cursor}' if cursor else None
+    assert seen == sorted(all_ids)
+
+    assert client.get('/parking/lots?limit=0', headers=auth_headers).status_code == 400
+    assert client.get('/parking/lots?cursor=abc', headers=auth_headers).status_code == 400
+
+def test_get_parking_lots_sparse_fields(client, auth_headers):
+    """
+    GIVEN existing parking lots
+    WHEN the list is requested with a fields parameter
+    THEN only those fields (plus id) are returned, and unknown fields are rejected.
+    """
+    response = client.get('/parking/lots?fields=name,city&limit=1', headers=auth_headers)
+    assert response.status_code == 200
+    assert json.loads(response.data) == [{'id': 1, 'name': 'My Test Lot', 'city': 'Testville'}]
+
+    response = client.get('/parking/lots?fields=name,floors', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_get_parking_lots_stats(client, auth_headers):
+    """
+    GIVEN lots with slots on several floors and of different vehicle types
+    WHEN stats for several lots (and an unknown ID) are requested in one call
+    THEN each lot gets its counts with floor and vehicle type breakdowns from a single query.
+    """
+    lot_id = build_lot(2, 1, 2)
+    bike = Slot.query.filter_by(parkinglot_id=lot_id).order_by(Slot.id).first()
+    bike.vehicle_type = 'Two-Wheeler'
+    bike.status = 1
+    db.session.commit()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(f'/parking/lots/stats?ids={lot_id},1,999', headers=auth_headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert len([s for s in statements if 'slots' in s]) == 1
+    stats, lot_1, missing = json.loads(response.data)
+
+    assert (stats['total_slots'], stats['available_slots'], stats['occupied_slots']) == (4, 3, 1)
+    assert [(f['total_slots'], f['occupied_slots']) for f in stats['floors']] == [(2, 1), (2, 0)]
+    assert stats['vehicle_types'] == {
+        'Car': {'total_slots': 3, 'available_slots': 3, 'occupied_slots': 0},
+        'Two-Wheeler': {'total_slots': 1, 'available_slots': 0, 'occupied_slots': 1}
+    }
+    assert lot_1['parkinglot_id'] == 1
+    assert missing == {'parkinglot_id': 999, 'error': 'Parking lot not found'}
+
+    single = json.loads(client.get(f'/parking/lots/{lot_id}/stats', headers=auth_headers).data)
+    assert single == stats
+    assert client.get('/parking/lots/stats', headers=auth_headers).status_code == 400
+
+def test_lot_etag_revalidation(client, auth_headers):
+    """
+    GIVEN a lot fetched once with its ETag
+    WHEN it is fetched again with If-None-Match, before and after one of its slots changes
+    THEN the first revalidation is a 304 without touching the hierarchy and the second returns the new document.
+    """
+    lot_id = build_lot(1, 1, 2)
+    urls = [f'/parking/lots/{lot_id}', f'/parking/lots/{lot_id}/stats', f'/parking/lots/{lot_id}/floors']
+    row_id = Row.query.filter_by(parkinglot_id=lot_id).first().id
+    urls.append(f'/parking/rows/{row_id}/slots')
+    etags = {}
+    for url in urls:
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200
+        etags[url] = response.headers['ETag']
+    assert len(set(etags.values())) == len(urls)
+
+    for url in urls:
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(url, headers={**auth_headers, 'If-None-Match': etags[url]})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 304
+        assert response.data == b''
+        assert not [s for s in statements if 'FROM slots' in s or 'FROM floors' in s]
+
+    slot_id = Slot.query.filter_by(parkinglot_id=lot_id).first().id
+    client.post('/api/v1/slots/update_status', headers={'X-API-KEY': 'super-secret-rpi-key'},
+                data=json.dumps({'id': slot_id, 'status': 1}), content_type='application/json')
+    for url in urls:
+        response = client.get(url, headers={**auth_headers, 'If-None-Match': etags[url]})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etags[url]
+
+def test_lot_version_bumps_on_orm_writes(client, auth_headers):
+    """
+    GIVEN a lot
+    WHEN a floor is added through the API and the lot details are edited
+    THEN the lot version increases each time.
+    """
+    lot_id = build_lot(1, 1, 1)
+
+    def version():
+        db.session.expire_all()
+        return db.session.get(ParkingLotDetails, lot_id).version
+
+    before = version()
+    client.post(f'/parking/lots/{lot_id}/floors', headers=auth_headers,
+                data=json.dumps({'name': 'Roof'}), content_type='application/json')
+    after_floor = version()
+    assert after_floor > before
+
+    lot = db.session.get(ParkingLotDetails, lot_id)
+    lot.city = 'Elsewhere'
+    db.session.commit()
+    assert version() > after_floor
+
+def test_lot_documents_are_served_from_cache(client, auth_headers):
+    """
+    GIVEN a lot whose detail and floor listing were rendered once
+    WHEN they are requested again, and then a slot is added to the lot
+    THEN the repeat requests are served from the cache without loading the hierarchy,
+    and the write invalidates the lot's cached documents.
+    """
+    lot_id = build_lot(2, 2, 2)
+    urls = [f'/parking/lots/{lot_id}', f'/parking/lots/{lot_id}/floors']
+    first = {url: client.get(url, headers=auth_headers).data for url in urls}
+    assert set(key[0] for key in lot_cache.backend._entries) >= {lot_id}
+
+    for url in urls:
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(url, headers=auth_headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        assert response.data == first[url]
+        assert not [s for s in statements if 'FROM slots' in s or 'FROM floors' in s]
+
+    row_id = Row.query.filter_by(parkinglot_id=lot_id).first().id
+    response = client.post(f'/parking/rows/{row_id}/slots', headers=auth_headers,
+                           data=json.dumps({'name': 'New'}), content_type='application/json')
+    assert response.status_code == 201
+    assert lot_id not in set(key[0] for key in lot_cache.backend._entries)
+    detail = json.loads(client.get(urls[0], headers=auth_headers).data)
+    assert sum(len(row['slots']) for floor in detail['floors'] for row in floor['rows']) == 9
+
+def test_lru_cache_invalidates_by_lot():
+    """
+    GIVEN documents of two lots in a size-bounded LRU cache
+    WHEN one is evicted and a lot is invalidated
+    THEN only that lot's remaining entries are dropped and the size stays consistent.
+    """
+    cache = LRUBackend(max_bytes=8)
+    cache.set(1, 'lot-1:v1', b'aaaa')
+    cache.set(2, 'lot-2:v1', b'bbbb')
+    cache.set(1, 'lot-1:v2', b'cccc')  # evicts lot-1:v1
+    assert cache.get(1, 'lot-1:v1') is None
+    cache.invalidate(1)
+    assert list(cache._entries) == [(2, 'lot-2:v1')]
+    assert (cache._size, cache._lot_keys) == (4, {2: {'lot-2:v1'}})
+
+def test_fast_dump_matches_marshmallow(app, client, auth_headers):
+    """
+    GIVEN a lot with floors, rows and slots
+    WHEN its documents are rendered by the tuple-based read path
+    THEN the JSON bytes equal the Marshmallow schemas' output, with both JSON providers,
+    and request bodies are parsed the same way by both.
+    """
+    from flask import jsonify
+    pytest.importorskip('orjson')
+    from app.json_provider import OrjsonProvider
+    from app.parking import (parking_lot_detail_schema, floors_schema, rows_schema, slots_schema,
+                             parking_lots_summary_schema, lot_documents, lot_summary_dumper)
+    lot_id = build_lot(2, 2, 3)
+    lot = db.session.get(ParkingLotDetails, lot_id)
+    lot.latitude, lot.longitude, lot.city = 12.9716, 77.5946, 'Bengalūru'
+    slot = lot.floors[0].rows[0].slots[0]
+    slot.vehicle_reg_no, slot.ticket_id, slot.status = 'KA01AB1234', 'T-1', 1
+    db.session.commit()
+    db.session.expire_all()
+    lot = db.session.get(ParkingLotDetails, lot_id)
+    floor, row = lot.floors[0], lot.floors[0].rows[0]
+
+    pairs = [
+        (parking_lot_detail_schema.dump(lot), lot_documents.detail(lot_id)),
+        (floors_schema.dump(lot.floors), lot_documents.floors(lot_id)),
+        (rows_schema.dump(floor.rows), lot_documents.rows(floor.id)),
+        (slots_schema.dump(row.slots), lot_documents.slots(row.id)),
+        (parking_lots_summary_schema.dump([lot]),
+         [lot_summary_dumper.dump(db.session.execute(
+             select(*lot_summary_dumper.columns).where(ParkingLotDetails.id == lot_id)).one())]),
+    ]
+    with app.test_request_context():
+        expected = [jsonify(marshmallow_dump).get_data() for marshmallow_dump, _ in pairs]
+        assert [jsonify(fast).get_data() for _, fast in pairs] == expected
+
+    default_provider = app.json
+    app.json = OrjsonProvider(app)
+    try:
+        with app.test_request_context():
+            assert [jsonify(fast).get_data() for _, fast in pairs] == expected
+        body = '{"id": 18446744073709551616, "ratio": NaN}'
+        parsed = app.json.loads(body)
+        assert parsed['id'] == default_provider.loads(body)['id']
+        assert parsed['ratio'] != parsed['ratio']
+    finally:
+        app.json = default_provider
+
+def test_get_nearby_parking_lots(client, auth_headers):
+    """
+    GIVEN lots at known distances from a point, one of them full
+    WHEN nearby lots are requested with a radius and an availability filter
+    THEN only lots inside the radius are returned, closest first, and full lots can be excluded.
+    """
+    def add_lot(name, lat, lon, free_cars):
+        lot = ParkingLotDetails(name=name, address='Geo St', latitude=lat, longitude=lon,
+                                available_car_slots=free_cars, available_two_wheeler_slots=0)
+        db.session.add(lot)
+        db.session.commit()
+        return lot.id
+
+    far = add_lot('Far', 18.6004, 73.8567, 10)          # ~8.9 km north
+    near = add_lot('Near', 18.5228, 73.8567, 10)        # ~270 m north
+    nearer_full = add_lot('Full', 18.5204, 73.8581, 0)  # ~150 m east
+    assert db.session.get(ParkingLotDetails, near).geohash.startswith('tek9')
+
+    response = client.get('/parking/lots/nearby?lat=18.5204&lon=73.8567&radius=1000', headers=auth_headers)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert [lot['id'] for lot in data] == [nearer_full, near]
+    assert 100 < data[0]['distance_m'] < 200
+
+    response = client.get('/parking/lots/nearby?lat=18.5204&lon=73.8567&radius=10000&available=car',
+                          headers=auth_headers)
+    assert [lot['id'] for lot in json.loads(response.data)] == [near, far]
+
+    response = client.get('/parking/lots/nearby?lat=18.5204&lon=73.8567&radius=10000&limit=1', headers=auth_headers)
+    assert [lot['id'] for lot in json.loads(response.data)] == [nearer_full]
+
+    assert client.get('/parking/lots/nearby?lat=18.5204', headers=auth_headers).status_code == 400
+    assert client.get('/parking/lots/nearby?lat=18.5&lon=73.8&radius=999999', headers=auth_headers).status_code == 400
+
+def test_get_parking_lots_filters(client, auth_headers):
+    """
+    GIVEN lots in one city with different amenities, vehicle types and free capacity
+    WHEN the lot list is requested with filters and a search term
+    THEN only matching lots are returned and invalid filters are rejected.
+    """
+    def add_lot(name, **columns):
+        lot = ParkingLotDetails(name=name, address=columns.pop('address', 'Ring Road'), city='Filterpur',
+                                latitude=0, longitude=0, **columns)
+        db.session.add(lot)
+        db.session.commit()
+        return lot.id
+
+    mall = add_lot('City Mall Parking', has_cctv='Yes', provides_valet_services='yes', parking_type='Paid',
+                   car_capacity=50, available_car_slots=0, two_wheeler_capacity=100, available_two_wheeler_slots=5)
+    metro = add_lot('Metro Stand', landmark='Near City Mall', has_cctv='No', parking_type='Free',
+                    car_capacity=0, available_car_slots=0, two_wheeler_capacity=40, available_two_wheeler_slots=0)
+    market = add_lot('Market 50%_off', address='Old market', has_cctv='yes', parking_type='paid',
+                     car_capacity=20, available_car_slots=3, two_wheeler_capacity=0, available_two_wheeler_slots=0)
+
+    def ids(query):
+        response = client.get(f'/parking/lots?city=filterpur&fields=id&{query}', headers=auth_headers)
+        assert response.status_code == 200
+        return [lot['id'] for lot in json.loads(response.data)]
+
+    assert ids('') == [mall, metro, market]
+    assert ids('has_cctv=true') == [mall, market]
+    assert ids('has_cctv=false') == [metro]
+    assert ids('provides_valet_services=yes') == [mall]
+    assert ids('parking_type=PAID') == [mall, market]
+    assert ids('vehicle_types=car') == [mall, market]
+    assert ids('vehicle_types=car,two_wheeler') == [mall]
+    assert ids('available=car') == [market]
+    assert ids('available=any') == [mall, market]
+    assert ids('q=city mall') == [mall, metro]
+    assert ids('q=50%_') == [market]
+    assert ids('q=50%25x') == []
+    assert ids('has_cctv=true&available=two_wheeler') == [mall]
+
+    for query in ('has_cctv=maybe', 'vehicle_types=bus', 'available=truck', 'q=ab'):
+        response = client.get(f'/parking/lots?{query}', headers=auth_headers)
+        assert response.status_code == 400, query
+
+def test_create_lot_layout(client, auth_headers):
+    """
+    GIVEN an empty parking lot and a nested layout of floors, rows and slots
+    WHEN the layout is posted in one request
+    THEN everything is created with a few bulk statements, the IDs come back keyed by name,
+    and the lot's counters and version follow; invalid layouts create nothing.
+    """
+    lot = ParkingLotDetails(name='Layout Lot', address='Bulk Rd', latitude=0, longitude=0,
+                            available_car_slots=0, available_two_wheeler_slots=0)
+    db.session.add(lot)
+    db.session.commit()
+    lot_id, version = lot.id, lot.version
+    layout = {'floors': [
+        {'name': 'G', 'rows': [
+            {'name': 'A', 'slots': [{'name': f'A{i}'} for i in range(1, 51)]},
+            {'name': 'B', 'slots': [{'name': 'B1', 'status': 1}, {'name': 'B2', 'vehicle_type': 'Two-Wheeler'}]},
+        ]},
+        {'name': 'F1', 'rows': [{'name': 'A', 'slots': [{'name': 'A1'}]}]},
+        {'name': 'F2'},
+    ]}
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.post(f'/parking/lots/{lot_id}/layout', json=layout, headers=auth_headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 201
+    assert statements.count('INSERT') == 3
+
+    floors = json.loads(response.data)['floors']
+    assert set(floors) == {'G', 'F1', 'F2'} and floors['F2']['rows'] == {}
+    slot_id = floors['G']['rows']['B']['slots']['B2']
+    slot = db.session.get(Slot, slot_id)
+    assert (slot.name, slot.vehicle_type, slot.row_id, slot.floor_id, slot.parkinglot_id) == (
+        'B2', 'Two-Wheeler', floors['G']['rows']['B']['id'], floors['G']['id'], lot_id)
+    assert db.session.get(Slot, floors['F1']['rows']['A']['slots']['A1']).row_id == floors['F1']['rows']['A']['id']
+    assert db.session.scalar(select(db.func.count(Slot.id)).where(Slot.parkinglot_id == lot_id)) == 53
+
+    db.session.expire_all()
+    lot = db.session.get(ParkingLotDetails, lot_id)
+    assert (lot.available_car_slots, lot.available_two_wheeler_slots) == (51, 1)
+    assert lot.version > version
+
+    bad_layouts = [
+        {},
+        {'floors': [{'name': 'G'}, {'name': 'G'}]},
+        {'floors': [{'name': 'G', 'rows': [{'name': 'A', 'slots': [{'name': 'A1', 'status': 7}]}]}]},
+        {'floors': [{'name': 'G', 'rows': [{'name': 'A', 'slots': [{'name': 'A1'}, {'name': 'A1'}]}]}]},
+    ]
+    for bad in bad_layouts:
+        response = client.post(f'/parking/lots/{lot_id}/layout', json=bad, headers=auth_headers)
+        assert response.status_code == 400, bad
+    assert db.session.scalar(select(db.func.count(Floor.id)).where(Floor.parkinglot_id == lot_id)) == 3
+    assert client.post('/parking/lots/999999/layout', json=layout, headers=auth_headers).status_code == 404
+
+def test_layout_import_command(app, tmp_path):
+    """
+    GIVEN a parking_spots.json file and a CSV layout
+    WHEN they are loaded with `flask layout import`
+    THEN the slots are created in one transaction, the lot counters follow, and the
+    Spot_N -> slot_id mapping is written for the edge device.
+    """
+    lot = ParkingLotDetails(name='Import Lot', address='Edge Rd', latitude=0, longitude=0,
+                            available_car_slots=0, available_two_wheeler_slots=0)
+    db.session.add(lot)
+    db.session.commit()
+    lot_id = lot.id
+    runner = app.test_cli_runner()
+
+    spots = tmp_path / 'parking_spots.json'
+    spots.write_text(json.dumps({'parking1.mp4': {
+        'Spot_1': {'x1': 0, 'y1': 0, 'x2': 10, 'y2': 10},
+        'Spot_2': {'x1': 10, 'y1': 0, 'x2': 20, 'y2': 10},
+    }}))
+    result = runner.invoke(args=['layout', 'import', str(lot_id), str(spots), '--batch-size', '1'])
+    assert result.exit_code == 0, result.output
+    mapping = json.loads((tmp_path / 'slot_ids.json').read_text())['parking1.mp4']
+    assert set(mapping) == {'Spot_1', 'Spot_2'}
+    slot = db.session.get(Slot, mapping['Spot_2'])
+    assert (slot.name, slot.parkinglot_id, slot.status) == ('Spot_2', lot_id, 0)
+
+    layout = tmp_path / 'layout.csv'
+    layout.write_text('floor,row,slot,status,vehicle_type\n'
+                      'F1,A,A1,0,Car\nF1,A,A2,1,Car\nF1,B,B1,0,Two-Wheeler\nF2,A,A1,,\n')
+    result = runner.invoke(args=['layout', 'import', str(lot_id), str(layout),
+                                 '--mapping-out', str(tmp_path / 'ids.json')])
+    assert result.exit_code == 0, result.output
+    ids = json.loads((tmp_path / 'ids.json').read_text())
+    assert set(ids) == {'F1', 'F2'} and set(ids['F1']['rows']) == {'A', 'B'}
+    slot = db.session.get(Slot, ids['F1']['rows']['B']['slots']['B1'])
+    assert (slot.vehicle_type, slot.row_id, slot.floor_id) == ('Two-Wheeler', ids['F1']['rows']['B']['id'], ids['F1']['id'])
+
+    db.session.expire_all()
+    lot = db.session.get(ParkingLotDetails, lot_id)
+    assert (lot.available_car_slots, lot.available_two_wheeler_slots) == (4, 1)
+
+    # Re-importing into existing floors and rows extends them, and existing slots are rejected
+    layout.write_text('floor,row,slot\nF1,A,A3\nF1,C,C1\n')
+    result = runner.invoke(args=['layout', 'import', str(lot_id), str(layout),
+                                 '--mapping-out', str(tmp_path / 'more_ids.json')])
+    assert result.exit_code == 0, result.output
+    more_ids = json.loads((tmp_path / 'more_ids.json').read_text())
+    assert more_ids['F1']['id'] == ids['F1']['id'] and more_ids['F1']['rows']['A']['id'] == ids['F1']['rows']['A']['id']
+    assert set(more_ids['F1']['rows']['A']['slots']) == {'A3'}
+    layout.write_text('floor,row,slot\nF2,A,A2\nF1,A,A1\n')
+    result = runner.invoke(args=['layout', 'import', str(lot_id), str(layout)])
+    assert result.exit_code != 0 and "Slot 'A1' already exists" in result.output
+    assert db.session.scalar(select(db.func.count(Row.id)).where(Row.parkinglot_id == lot_id)) == 5
+
+    layout.write_text('floor,row,slot\nF3,A,A1\nF3,A,A1\n')
+    result = runner.invoke(args=['layout', 'import', str(lot_id), str(layout)])
+    assert result.exit_code != 0 and 'Duplicate slot' in result.output
+    assert db.session.scalar(select(db.func.count(Floor.id)).where(Floor.parkinglot_id == lot_id)) == 3
+
+def test_get_parking_lot_changes(client, auth_headers):
+    """
+    GIVEN a lot synced at its current version
+    WHEN slots change through the device API and the ORM, and later a floor is added
+    THEN each sync returns only the slots changed since the given version, and the floor forces a resync.
+    """
+    lot_id = build_lot(1, 1, 3)
+    url = f'/parking/lots/{lot_id}/changes'
+
+    def changes(since):
+        response = client.get(f'{url}?since={since}', headers=auth_headers)
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    synced = changes(0)['version']
+    assert changes(synced) == {'parkinglot_id': lot_id, 'version': synced, 'resync': False, 'slots': []}
+
+    first, second, third = [slot.id for slot in Slot.query.filter_by(parkinglot_id=lot_id).order_by(Slot.id)]
+    client.post('/api/v1/slots/update_status', headers={'X-API-KEY': 'super-secret-rpi-key'},
+                data=json.dumps({'id': second, 'status': 1}), content_type='application/json')
+    after_device = changes(synced)
+    assert [slot['id'] for slot in after_device['slots']] == [second]
+    assert after_device['slots'][0]['status'] == 1
+    assert after_device['version'] > synced
+
+    db.session.get(Slot, first).vehicle_reg_no = 'MH12AB1234'
+    db.session.commit()
+    after_orm = changes(synced)
+    assert [slot['id'] for slot in after_orm['slots']] == [second, first]
+    assert [slot['id'] for slot in changes(after_device['version'])['slots']] == [first]
+    assert third not in [slot['id'] for slot in after_orm['slots']]
+
+    client.post(f'/parking/lots/{lot_id}/floors', headers=auth_headers,
+                data=json.dumps({'name': 'Roof'}), content_type='application/json')
+    assert changes(after_orm['version'])['resync'] is True
+    latest = changes(0)['version']
+    assert changes(latest)['resync'] is False
+    assert changes(latest + 1)['resync'] is True
+
+    assert client.get(url, headers=auth_headers).status_code == 400
+    assert client.get(f'{url}?since=-1', headers=auth_headers).status_code == 400
+    assert client.get('/parking/lots/999999/changes?since=0', headers=auth_headers).status_code == 404
+
+def count_statements(request):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = request()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return response, len(statements)
+
+def test_set_based_mutations(client, auth_headers):
+    """
+    GIVEN a small and a large lot created from layouts
+    WHEN slots are updated and rows, floors and lots are deleted
+    THEN each request takes the same number of statements for both lots, and the
+    counters, versions and delta sync markers follow the changes.
+    """
+    def make_lot(floors, rows, slots):
+        lot = ParkingLotDetails(name=f'Mutations {floors}x{rows}x{slots}', address='Set St',
+                                available_car_slots=0, available_two_wheeler_slots=0)
+        db.session.add(lot)
+        db.session.commit()
+        layout = {'floors': [
+            {'name': f'F{f}', 'rows': [
+                {'name': f'R{r}', 'slots': [{'name': f'S{s}'} for s in range(slots)]} for r in range(rows)
+            ]} for f in range(floors)
+        ]}
+        response = client.post(f'/parking/lots/{lot.id}/layout', json=layout, headers=auth_headers)
+        assert response.status_code == 201
+        return lot.id, json.loads(response.data)['floors']
+
+    def counters(lot_id):
+        db.session.expire_all()
+        lot = db.session.get(ParkingLotDetails, lot_id)
+        return lot.available_car_slots, lot.version
+
+    small, small_floors = make_lot(1, 1, 1)
+    large, large_floors = make_lot(2, 3, 10)
+    assert counters(large)[0] == 60
+
+    costs = {'update': [], 'delete': []}
+    for floors in (small_floors, large_floors):
+        slot_id = floors['F0']['rows']['R0']['slots']['S0']
+        response, cost = count_statements(lambda: client.put(
+            f'/parking/slots/{slot_id}', json={'status': 1, 'vehicle_reg_no': 'KA01AB1234'}, headers=auth_headers))
+        assert response.status_code == 200
+        assert json.loads(response.data) == {'id': slot_id, 'name': 'S0', 'status': 1, 'vehicle_type': 'Car',
+                                             'vehicle_reg_no': 'KA01AB1234', 'ticket_id': None}
+        costs['update'].append(cost)
+    assert costs['update'][0] == costs['update'][1]
+
+    available, version = counters(large)
+    assert available == 59
+    slot_id = large_floors['F0']['rows']['R0']['slots']['S0']
+    changes = json.loads(client.get(f'/parking/lots/{large}/changes?since={version - 1}', headers=auth_headers).data)
+    assert [slot['id'] for slot in changes['slots']] == [slot_id]
+    assert client.put(f'/parking/slots/{slot_id}', json={'row_id': 1}, headers=auth_headers).status_code == 400
+    assert client.put('/parking/slots/999999', json={'status': 0}, headers=auth_headers).status_code == 404
+
+    row_id = large_floors['F0']['rows']['R0']['id']
+    response = client.put(f'/parking/rows/{row_id}', json={'name': 'Renamed'}, headers=auth_headers)
+    assert response.status_code == 200
+    assert json.loads(response.data)['name'] == 'Renamed' and len(json.loads(response.data)['slots']) == 10
+    assert db.session.get(Row, row_id).name == 'Renamed'
+    assert json.loads(client.get(f'/parking/lots/{large}/changes?since={version}', headers=auth_headers).data)['resync']
+
+    # The occupied slot's session survives the delete without its slot
+    db.session.add(ParkingSession(ticket_id='set-based-1', parkinglot_id=large, slot_id=slot_id,
+                                  vehicle_reg_no='KA01AB1234'))
+    db.session.commit()
+    assert client.delete(f'/parking/rows/{row_id}', headers=auth_headers).status_code == 200
+    assert counters(large)[0] == 50
+    assert db.session.get(ParkingSession, 'set-based-1').slot_id is None
+    assert db.session.get(Slot, slot_id) is None
+    assert client.delete(f'/parking/rows/{row_id}', headers=auth_headers).status_code == 404
+
+    assert client.delete(f"/parking/floors/{large_floors['F1']['id']}", headers=auth_headers).status_code == 200
+    assert counters(large)[0] == 20
+    assert db.session.scalar(select(db.func.count(Row.id)).where(Row.parkinglot_id == large)) == 2
+
+    for lot_id in (small, large):
+        response, cost = count_statements(lambda: client.delete(f'/parking/lots/{lot_id}', headers=auth_headers))
+        assert response.status_code == 200
+        costs['delete'].append(cost)
+        assert db.session.scalar(select(db.func.count(Slot.id)).where(Slot.parkinglot_id == lot_id)) == 0
+        assert db.session.scalar(select(db.func.count(Floor.id)).where(Floor.parkinglot_id == lot_id)) == 0
+    assert costs['delete'][0] == costs['delete'][1]
+    assert client.delete(f'/parking/lots/{large}', headers=auth_headers).status_code == 404
+
+def test_multi_get_by_ids(client, auth_headers):
+    """
+    GIVEN a lot with several floors, rows and slots
+    WHEN slots, rows and floors are requested by ID lists that include unknown IDs
+    THEN each list comes back in request order with the single-get bodies and not-found markers,
+    and the slots are resolved with one query.
+    """
+    lot_id = build_lot(2, 2, 2)
+    slot_ids = [slot.id for slot in Slot.query.filter_by(parkinglot_id=lot_id).order_by(Slot.id.desc())]
+    row_ids = [row.id for row in Row.query.filter_by(parkinglot_id=lot_id)]
+    floor_ids = [floor.id for floor in Floor.query.filter_by(parkinglot_id=lot_id)]
+
+    for kind, ids in (('slots', slot_ids[:3]), ('rows', row_ids[::-1]), ('floors', floor_ids)):
+        requested = [ids[-1], 999999, *ids[:-1], ids[-1]]
+        response = client.get(f"/parking/{kind}?ids={','.join(map(str, requested))}", headers=auth_headers)
+        assert response.status_code == 200
+        body = json.loads(response.data)
+        assert body[1] == {'id': 999999, 'error': f'{kind[:-1].capitalize()} not found'}
+        assert [item['id'] for item in body] == [ids[-1], 999999, *ids[:-1]]
+        for item in body[:1] + body[2:]:
+            assert item == json.loads(client.get(f"/parking/{kind}/{item['id']}", headers=auth_headers).data)
+
+    queries, _ = count_selects(client, f"/parking/slots?ids={','.join(map(str, slot_ids))}", auth_headers)
+    assert queries == 1
+    assert client.get('/parking/slots', headers=auth_headers).status_code == 400
+    assert client.get('/parking/rows?ids=1,x', headers=auth_headers).status_code == 400
+    too_many = ','.join(str(i) for i in range(1, 102))
+    assert client.get(f'/parking/floors?ids={too_many}', headers=auth_headers).status_code == 400
@@ -0,0 +1,99 @@
+import os
+import pytest
+from sqlalchemy import create_engine, select, text
+from app import db
+from app.models import Floor, Row, Slot, ParkingSession, AdminParkingLot
+
+# Hot-path lookups and the index each one should use. Every case is checked before and
+# after its index exists, so a plan that only looks right because of another index fails.
+PLAN_CASES = [
+    ('ix_slots_parkinglot_id_status',
+     select(Slot.id).where(Slot.parkinglot_id == 1, Slot.status == 1)),
+    ('ix_slots_parkinglot_id_change_version',
+     select(Slot.id).where(Slot.parkinglot_id == 1, Slot.change_version > 1)),
+    ('ix_slots_row_id', select(Slot.id).where(Slot.row_id == 1)),
+    ('ix_rows_floor_id', select(Row.id).where(Row.floor_id == 1)),
+    ('ix_rows_parkinglot_id', select(Row.id).where(Row.parkinglot_id == 1)),
+    ('ix_floors_parkinglot_id', select(Floor.id).where(Floor.parkinglot_id == 1)),
+    ('uq_parking_sessions_active_vehicle',
+     select(ParkingSession.ticket_id).where(ParkingSession.vehicle_reg_no == 'DL01AB1234',
+                                            ParkingSession.end_time.is_(None))),
+    ('ix_parking_sessions_slot_id', select(ParkingSession.ticket_id).where(ParkingSession.slot_id == 1)),
+    ('ix_admin_parking_lots_admin_id_parking_lot_id',
+     select(AdminParkingLot.id).where(AdminParkingLot.admin_id == 1, AdminParkingLot.parking_lot_id == 1)),
+    ('ix_admin_parking_lots_parking_lot_id',
+     select(AdminParkingLot.id).where(AdminParkingLot.parking_lot_id == 1)),
+]
+
+# Other indexes that can serve a case's lookup too. The PostgreSQL check drops them
+# along with the case's own index, so its plan without that index is a table scan.
+SIBLING_INDEXES = {
+    'ix_slots_parkinglot_id_status': ('ix_slots_parkinglot_id_change_version',),
+    'ix_slots_parkinglot_id_change_version': ('ix_slots_parkinglot_id_status',),
+    'ix_admin_parking_lots_admin_id_parking_lot_id': ('ix_admin_parking_lots_parking_lot_id',),
+    'ix_admin_parking_lots_parking_lot_id': ('ix_admin_parking_lots_admin_id_parking_lot_id',),
+}
+
+def find_index(name):
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise LookupError(name)
+
+def sqlite_plan(connection, query):
+    compiled = query.compile(connection)
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), tuple(compiled.params.values()))
+    return ' '.join(row[-1] for row in rows)
+
+def postgres_plan(connection, query):
+    compiled = query.compile(connection, compile_kwargs={'literal_binds': True})
+    return '\n'.join(connection.execute(text('EXPLAIN ' + str(compiled))).scalars())
+
+@pytest.mark.parametrize('name, query', PLAN_CASES, ids=[name for name, _ in PLAN_CASES])
+def test_sqlite_plans_use_hot_path_indexes(app, name, query):
+    """
+    GIVEN a hot-path lookup
+    WHEN its index is dropped and re-created
+    THEN SQLite's plan does not name it before and searches the index after.
+    """
+    index = find_index(name)
+    with db.engine.begin() as connection:
+        index.drop(connection)
+        before = sqlite_plan(connection, query)
+        index.create(connection)
+        after = sqlite_plan(connection, query)
+    assert name not in before
+    assert f'USING INDEX {name}' in after or f'USING COVERING INDEX {name}' in after
+
+@pytest.mark.skipif(not os.environ.get('TEST_POSTGRES_URL'),
+                    reason='set TEST_POSTGRES_URL to a scratch PostgreSQL database to check its plans')
+def test_postgres_plans_use_hot_path_indexes():
+    """
+    GIVEN the schema in a scratch PostgreSQL schema
+    WHEN each hot-path index is dropped with its siblings and then re-created alone
+    THEN EXPLAIN shows a sequential scan without it and the index with it.
+    """
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text('CREATE SCHEMA plan_checks'))
+            connection.execute(text('SET LOCAL search_path TO plan_checks, public'))
+            db.metadata.create_all(connection)
+            # Empty tables are cheapest to scan; make the planner pick any usable index
+            connection.execute(text('SET LOCAL enable_seqscan = off'))
+            for name, query in PLAN_CASES:
+                index = find_index(name)
+                siblings = [find_index(sibling) for sibling in SIBLING_INDEXES.get(name, ())]
+                for dropped in [index, *siblings]:
+                    dropped.drop(connection)
+                before = postgres_plan(connection, query)
+                index.create(connection)
+                after = postgres_plan(connection, query)
+                for sibling in siblings:
+                    sibling.create(connection)
+                assert 'Seq Scan' in before and name not in before, (name, before)
+                assert name in after, (name, after)
+        finally:
+            transaction.rollback()
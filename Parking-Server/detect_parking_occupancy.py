@@ -21,6 +21,7 @@ from ultralytics import YOLO
 MODEL_PATH = "best.pt"  # Path to trained YOLOv8 model
 VIDEO_PATH = "parking1.mp4"  # Path to recorded parking video
 JSON_PATH = "parking_spots.json"  # Path to saved parking spot coordinates
+SLOT_IDS_PATH = "slot_ids.json"  # Spot name -> backend slot ID, written by `flask layout import`
 
 # Load YOLOv8 model
 model = YOLO(MODEL_PATH)
@@ -55,8 +56,14 @@ if not ret:
 IOU_THRESHOLD = 0.3  # Lowered IoU threshold for debugging
 CONFIDENCE_THRESHOLD = 0.5  # Minimum confidence for vehicle detection
 
-# Map spot names to slot IDs (dynamic for Spot_1, Spot_2, ...)
-spot_name_to_id = {spot_name: int(spot_name.split('_')[1]) for spot_name in parking_spots.keys() if spot_name.startswith('Spot_') and spot_name.split('_')[1].isdigit()}
+# Map spot names to slot IDs: use the IDs the backend assigned when the spots were
+# imported, else assume Spot_N is slot N
+spot_name_to_id = {}
+if os.path.exists(SLOT_IDS_PATH):
+    with open(SLOT_IDS_PATH, "r") as f:
+        spot_name_to_id = json.load(f).get(video_name, {})
+if not spot_name_to_id:
+    spot_name_to_id = {spot_name: int(spot_name.split('_')[1]) for spot_name in parking_spots.keys() if spot_name.startswith('Spot_') and spot_name.split('_')[1].isdigit()}
 
 # Restore calculate_iou function
 def calculate_iou(box1, box2):
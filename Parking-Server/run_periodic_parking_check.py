@@ -6,6 +6,12 @@ import subprocess
 import time
 import requests
 import json
+import queue
+import collections
+import http.client
+import urllib.parse
+import struct
+import threading
 
 # Activate venv if not already active
 venv_path = os.path.join(os.path.dirname(__file__), 'venv', 'Scripts', 'activate_this.py')
@@ -17,8 +23,153 @@ if os.path.exists(venv_activate):
     with open(venv_activate) as f:
         exec(f.read(), {'__file__': venv_activate})
 
-API_URL = "http://localhost:5000/api/v1/slots/update_status"
+API_URL = "http://localhost:5000/api/v1/slots/bulk_update_status"
 API_KEY = "super-secret-rpi-key"
+DEVICE_ID = os.environ.get("DEVICE_ID", "rpi-1")
+LOT_ID = int(os.environ.get("LOT_ID", "1"))
+# Send a packed bitset instead of JSON; slots this camera does not see are masked out
+USE_BITMAP = os.environ.get("USE_BITMAP", "false").lower() == "true"
+LAYOUT_URL = f"http://localhost:5000/api/v1/lots/{LOT_ID}/layout"
+BITMAP_MIMETYPE = "application/vnd.parking.slot-bitmap"
+# Keep one authenticated NDJSON stream open instead of a request per snapshot
+USE_STREAM = os.environ.get("USE_STREAM", "false").lower() == "true"
+STREAM_URL = "http://localhost:5000/api/v1/slots/stream"
+STREAM_SHUTDOWN_TIMEOUT = 10  # seconds to wait for the last acknowledgements on exit
+
+_frames = queue.Queue()
+# Frames of a dropped stream that the backend never acknowledged, sent again first
+_resend = collections.deque()
+_stop = threading.Event()
+
+_layout = None
+
+
+def fetch_layout():
+    """Fetch the slot ordering the backend expects in bitmap payloads."""
+    global _layout
+    response = requests.get(LAYOUT_URL, headers={"X-API-KEY": API_KEY})
+    response.raise_for_status()
+    _layout = response.json()
+    return _layout
+
+
+def pack_bitmap(layout, slot_statuses):
+    """
+    Pack detector output into the backend's bitmap format (see Backend/app/bitmap.py).
+
+    Slots this camera did not report are marked as unobserved in the coverage mask
+    (format 2), so the backend leaves them alone instead of freeing them.
+    """
+    by_id = {slot["id"]: slot["status"] for slot in slot_statuses}
+    slot_ids = layout["slot_ids"]
+    bits = bytearray((len(slot_ids) + 7) // 8)
+    covered = bytearray(len(bits))
+    for i, slot_id in enumerate(slot_ids):
+        if slot_id in by_id:
+            covered[i >> 3] |= 1 << (i & 7)
+            if by_id[slot_id]:
+                bits[i >> 3] |= 1 << (i & 7)
+    header = struct.pack(">2sBIII", b"SB", 2, LOT_ID, layout["layout_version"], len(slot_ids))
+    return header + bytes(bits) + bytes(covered)
+
+
+def send_bitmap(slot_statuses, captured_at):
+    layout = _layout or fetch_layout()
+    headers = {
+        "X-API-KEY": API_KEY,
+        "Content-Type": BITMAP_MIMETYPE,
+        "X-DEVICE-ID": DEVICE_ID,
+        "X-SNAPSHOT-SEQ": str(int(captured_at * 1000)),
+    }
+    response = requests.post(API_URL, data=pack_bitmap(layout, slot_statuses), headers=headers)
+    if response.status_code == 409 and "layout_version" in response.json():
+        # Slots were added or removed on the backend; refresh the ordering and retry once
+        layout = fetch_layout()
+        response = requests.post(API_URL, data=pack_bitmap(layout, slot_statuses), headers=headers)
+    return response
+
+
+def next_frame(timeout=1):
+    """Next snapshot to send, or None if nothing arrived within ``timeout`` seconds."""
+    try:
+        return _resend.popleft()
+    except IndexError:
+        pass
+    try:
+        return _frames.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+def read_acks(conn, unacked, done):
+    """Drop frames from ``unacked`` as the backend acknowledges them, until the stream ends."""
+    try:
+        response = conn.getresponse()
+        if response.status != 200:
+            print(f"Ingest stream refused: {response.status}")
+            return
+        for line in response:
+            ack = json.loads(line)
+            # The backend numbers frames by line, in the order they were sent
+            while unacked and unacked[0][0] <= ack["frame"]:
+                unacked.popleft()
+            if ack["status"] not in (200, 202, 409):
+                print(f"Frame {ack['frame']} rejected: {ack['status']} {ack.get('error', '')}")
+    except Exception as e:
+        print(f"Ingest stream failed: {e}")
+    finally:
+        done.set()
+
+
+def send_stream(unacked):
+    """
+    Upload queued snapshots over one chunked request while a second thread reads the
+    acknowledgements. Returns when the backend ends the stream or on shutdown; frames
+    left in ``unacked`` were not confirmed.
+    """
+    url = urllib.parse.urlsplit(STREAM_URL)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80)
+    try:
+        conn.putrequest("POST", url.path)
+        conn.putheader("X-API-KEY", API_KEY)
+        conn.putheader("Content-Type", "application/x-ndjson")
+        conn.putheader("Transfer-Encoding", "chunked")
+        conn.endheaders()
+        sock = conn.sock
+        done = threading.Event()
+        reader = threading.Thread(target=read_acks, args=(conn, unacked, done), daemon=True)
+        reader.start()
+        sent = 0
+        while not done.is_set():
+            frame = next_frame()
+            if frame is None:
+                if _stop.is_set():
+                    break
+                continue
+            sent += 1
+            unacked.append((sent, frame))
+            line = (json.dumps(frame) + "\n").encode()
+            sock.sendall(b"%x\r\n%s\r\n" % (len(line), line))
+        if not done.is_set():
+            # End the upload so the backend acknowledges what it has and closes the response
+            sock.sendall(b"0\r\n\r\n")
+            reader.join(STREAM_SHUTDOWN_TIMEOUT)
+    finally:
+        conn.close()
+
+
+def run_stream():
+    """Hold the ingest stream open, reconnecting if the backend drops it."""
+    while not _stop.is_set():
+        unacked = collections.deque()
+        try:
+            send_stream(unacked)
+            print("Ingest stream closed")
+        except Exception as e:
+            print(f"Ingest stream failed: {e}")
+        # Sequenced snapshots are idempotent: one that did arrive is answered with 409
+        _resend.extendleft(reversed([frame for _, frame in unacked]))
+        _stop.wait(5)
 
 
 def periodic_task():
@@ -31,19 +182,44 @@ def periodic_task():
         print(f"Failed to parse output from detect_parking_occupancy.py: {e}")
         print(f"Raw output: {result.stdout}")
         return
-    for slot in slot_statuses:
-        payload = {"id": slot["id"], "status": slot["status"]}
-        try:
+    # Send the whole snapshot in one request; the backend applies it in a single transaction.
+    # The capture time lets the backend drop stale or replayed snapshots, so retries are safe.
+    captured_at = time.time()
+    snapshot = {
+        "device_id": DEVICE_ID,
+        "lot_id": LOT_ID,
+        "captured_at": captured_at,
+        "slots": slot_statuses,
+    }
+    if USE_STREAM:
+        _frames.put(snapshot)
+        return
+    try:
+        if USE_BITMAP:
+            response = send_bitmap(slot_statuses, captured_at)
+        else:
             response = requests.post(
                 API_URL,
-                json=payload,
+                json=snapshot,
                 headers={"X-API-KEY": API_KEY}
             )
-            print(f"Updated slot {slot['id']} status to {slot['status']}: {response.status_code}")
-        except Exception as e:
-            print(f"Failed to update slot {slot['id']}: {e}")
+        if response.status_code == 409:
+            print("Backend already has a newer snapshot, skipping")
+            return
+        print(f"Sent {len(slot_statuses)} slots: {response.status_code}")
+        if response.ok:
+            print(f"Changed slots: {response.json().get('changed', [])}")
+            for item in response.json().get("results", []):
+                if item["result"] in ("not_found", "invalid"):
+                    print(f"Slot {item['id']}: {item['result']}")
+    except Exception as e:
+        print(f"Failed to update slot statuses: {e}")
 
 if __name__ == "__main__":
+    stream_thread = None
+    if USE_STREAM:
+        stream_thread = threading.Thread(target=run_stream, daemon=True)
+        stream_thread.start()
     scheduler = BackgroundScheduler()
     scheduler.add_job(periodic_task, 'interval', minutes=2)
     scheduler.start()
@@ -52,4 +228,7 @@ if __name__ == "__main__":
         while True:
             time.sleep(60)
     except (KeyboardInterrupt, SystemExit):
-        scheduler.shutdown() 
\ No newline at end of file
+        scheduler.shutdown()
+        if stream_thread:
+            _stop.set()
+            stream_thread.join(STREAM_SHUTDOWN_TIMEOUT) 
\ No newline at end of file